@@ -1,108 +1,160 @@
 import os
 import re
 import base64
+import contextlib
 import functools
+import hashlib
+import subprocess
+import sys
+import threading
+import time
 from html import escape
-from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+from datetime import datetime
 
 import streamlit as st
 import streamlit.components.v1 as components
+from streamlit.errors import StreamlitAPIException
 from database import Database, CATEGORIAS_PADRAO, NIVEIS_HIERARQUIA, NIVEL_LABELS
+from modelos import Modelo, Relatorio, Usuario, fmt_data, ler_instante
+from powerbi_embed import (
+    ARQUIVO_POWERBI_CLIENT, URL_POWERBI_CLIENT, EmbedBroker, MARGEM_RENOVACAO_S,
+    baixar_powerbi_client,
+)
+from cache_compartilhado import CacheCompartilhado
+from cache_portal import CacheIndexado, TTL_PADRAO_S
+from verificador_links import VerificadorLinks, INTERVALO_PADRAO_S, SITUACAO_LABELS
+from perfil_rerun import MAX_RERUNS, Perfilador, captura_atual, para_speedscope
+import componentes
 
 
-# Fuso de Brasilia (UTC-3, sem horario de verao desde 2019).
-_TZ_BR = timezone(timedelta(hours=-3))
+_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 
 
-def fmt_data(valor):
-    """Formata datas do Supabase (ISO/UTC) em dd/mm/aaaa hh:mm (horario de Brasilia)."""
-    if not valor:
-        return "—"
+@functools.lru_cache(maxsize=None)
+def url_estatico(nome: str, absoluta: bool = False) -> str:
+    """URL de um arquivo de static/ (server.enableStaticServing) com ?v=<hash>
+    do conteudo: a tag que a referencia fica identica entre reruns e um deploy
+    com o arquivo alterado muda a URL, sem servir a copia velha. Nao da cache
+    longo: a rota app/static do Streamlit nao manda Cache-Control de longa
+    duracao, entao o navegador so guarda o arquivo pelo cache heuristico.
+    `absoluta` gera o caminho a partir da raiz do servidor (para uso dentro
+    dos iframes dos componentes)."""
     try:
-        dt = valor
-        if isinstance(valor, str):
-            dt = datetime.fromisoformat(valor.replace("Z", "+00:00"))
-        if getattr(dt, "tzinfo", None) is not None:
-            dt = dt.astimezone(_TZ_BR)
-        return dt.strftime("%d/%m/%Y %H:%M")
-    except Exception:  # noqa: BLE001  (formato inesperado: mostra o cru)
-        return str(valor)[:16].replace("T", " ")
+        with open(os.path.join(_STATIC_DIR, nome), "rb") as fh:
+            versao = hashlib.sha256(fh.read()).hexdigest()[:10]
+    except OSError:
+        versao = "0"
+    caminho = f"app/static/{nome}?v={versao}"
+    if absoluta:
+        base = (st.get_option("server.baseUrlPath") or "").strip("/")
+        caminho = "/" + (f"{base}/" if base else "") + caminho
+    return caminho
 
 
-def _icone_aba():
-    """Favicon padrao da aba (cabeca de boi verde), usado na carga inicial.
-    A troca dinamica conforme o tema do SISTEMA e feita por JavaScript em
-    _injetar_favicon_tema()."""
-    caminho = os.path.join(os.path.dirname(os.path.abspath(__file__)), "boi_escuro.png")
-    if os.path.exists(caminho):
-        try:
-            from PIL import Image
-            return Image.open(caminho)
-        except Exception:  # noqa: BLE001
-            return caminho
-    return ":bar_chart:"
+@functools.lru_cache(maxsize=None)
+def url_icones_streamlit() -> str | None:
+    """URL (a partir da raiz do servidor) da fonte Material Symbols Rounded
+    que o proprio Streamlit serve no bundle dele (o nome leva um hash que muda
+    por versao). Os iframes dos componentes nao herdam as fontes do documento
+    principal: ela e a reserva dos icones la dentro quando o subset de
+    static/fonts nao foi gerado."""
+    pasta = os.path.join(os.path.dirname(st.__file__), "static", "static", "media")
+    try:
+        nomes = sorted(
+            n for n in os.listdir(pasta)
+            if n.startswith("MaterialSymbols-Rounded") and n.endswith(".woff2")
+        )
+    except OSError:
+        return None
+    if not nomes:
+        return None
+    base = (st.get_option("server.baseUrlPath") or "").strip("/")
+    return "/" + (f"{base}/" if base else "") + f"static/media/{nomes[0]}"
 
 
-@functools.lru_cache(maxsize=None)
-def _favicon_data_uris():
-    """Le os PNGs do boi e devolve data URIs base64 (verde e branco)."""
-    base = os.path.dirname(os.path.abspath(__file__))
-    uris = {"verde": "", "branco": ""}
-    for chave, nome in (("verde", "boi_escuro.png"), ("branco", "boi_claro.png")):
-        caminho = os.path.join(base, nome)
-        try:
-            with open(caminho, "rb") as fh:
-                b64 = base64.b64encode(fh.read()).decode("ascii")
-            uris[chave] = "data:image/png;base64," + b64
-        except Exception:  # noqa: BLE001
-            uris[chave] = ""
-    return uris
+def _icone_aba():
+    """Favicon provisorio da aba ate o script de _injetar_favicon_tema()
+    instalar a cabeca de boi (URL estatica, conforme o tema do SISTEMA).
+
+    Emoji, e nao o PNG: com imagem o Streamlit importa numpy + Pillow e
+    reprocessa o arquivo a cada rerun so para o page_icon (~100 ms no boot)."""
+    return "🐂"
 
 
 def _injetar_favicon_tema():
     """Troca o favicon da aba conforme o tema do SISTEMA (prefers-color-scheme):
     cabeca de boi VERDE no tema claro, BRANCA no tema escuro. Atualiza ao vivo,
-    sem depender do tema (fixo) do Streamlit."""
-    uris = _favicon_data_uris()
-    if not uris["verde"] and not uris["branco"]:
-        return
-    js = """
-    <script>
-    (function () {
-      try {
-        var doc = window.parent.document;
-        var VERDE = "__VERDE__";
-        var BRANCO = "__BRANCO__";
-        var mq = window.matchMedia("(prefers-color-scheme: dark)");
-        function aplicar() {
-          var href = (mq.matches ? BRANCO : VERDE) || VERDE || BRANCO;
-          if (!href) return;
-          var links = doc.querySelectorAll("link[rel~='icon']");
-          if (!links.length) {
-            var l = doc.createElement("link");
-            l.setAttribute("rel", "icon");
-            doc.head.appendChild(l);
-            links = [l];
-          }
-          links.forEach(function (link) {
-            if (link.getAttribute("href") !== href) {
-              link.setAttribute("type", "image/png");
-              link.setAttribute("href", href);
-            }
-          });
-        }
-        aplicar();
-        if (mq.addEventListener) { mq.addEventListener("change", aplicar); }
-        else if (mq.addListener) { mq.addListener(aplicar); }
-        new MutationObserver(aplicar).observe(doc.head, {
-          childList: true, subtree: true, attributes: true, attributeFilter: ["href"]
-        });
-      } catch (e) {}
-    })();
-    </script>
-    """
-    js = js.replace("__VERDE__", uris["verde"]).replace("__BRANCO__", uris["branco"])
-    components.html(js, height=0, width=0)
+    sem depender do tema (fixo) do Streamlit.
+
+    Roda UMA vez por sessao: o iframe de bootstrap instala um <script> no
+    documento pai (que sobrevive aos reruns, mesmo com o iframe removido) e
+    marca window.__frtFavicon; se o bootstrap rodar de novo (ex.: nova sessao
+    na mesma aba), desconecta o observer anterior antes de instalar outro. Os
+    favicons sao referenciados por URL estatica (cacheavel), nao base64."""
+    # Container fixo: mantem a posicao dos elementos seguintes (pool de
+    # iframes) igual com ou sem o bootstrap.
+    with st.container():
+        if st.session_state.get("_favicon_instalado"):
+            return
+        st.session_state["_favicon_instalado"] = True
+        js = """
+        <script>
+        (function () {
+          try {
+            var win = window.parent, doc = win.document;
+            var codigo = "(" + function (VERDE, BRANCO) {
+              var antigo = window.__frtFavicon;
+              if (antigo) {
+                if (antigo.verde === VERDE && antigo.branco === BRANCO) { return; }
+                antigo.parar();
+              }
+              var mq = window.matchMedia("(prefers-color-scheme: dark)");
+              function aplicar() {
+                var href = mq.matches ? BRANCO : VERDE;
+                var links = document.querySelectorAll("link[rel~='icon']");
+                if (!links.length) {
+                  var l = document.createElement("link");
+                  l.setAttribute("rel", "icon");
+                  document.head.appendChild(l);
+                  links = [l];
+                }
+                links.forEach(function (link) {
+                  if (link.getAttribute("href") !== href) {
+                    link.setAttribute("type", "image/png");
+                    link.setAttribute("href", href);
+                  }
+                });
+              }
+              var obs = new MutationObserver(aplicar);
+              aplicar();
+              if (mq.addEventListener) { mq.addEventListener("change", aplicar); }
+              else if (mq.addListener) { mq.addListener(aplicar); }
+              obs.observe(document.head, {
+                childList: true, subtree: true, attributes: true, attributeFilter: ["href"]
+              });
+              window.__frtFavicon = {
+                verde: VERDE, branco: BRANCO,
+                parar: function () {
+                  obs.disconnect();
+                  if (mq.removeEventListener) { mq.removeEventListener("change", aplicar); }
+                  else if (mq.removeListener) { mq.removeListener(aplicar); }
+                }
+              };
+            } + ")(" + JSON.stringify("__VERDE__") + ", " + JSON.stringify("__BRANCO__") + ");";
+            var s = doc.createElement("script");
+            s.textContent = codigo;
+            doc.head.appendChild(s);
+            s.remove();
+          } catch (e) {}
+        })();
+        </script>
+        """
+        js = (
+            js.replace("__VERDE__", url_estatico("boi_escuro.png", absoluta=True))
+            .replace("__BRANCO__", url_estatico("boi_claro.png", absoluta=True))
+        )
+        components.html(js, height=0, width=0)
 
 
 def _ocultar_barra_superior():
@@ -144,6 +196,8 @@ MENU_DASHBOARD = "Dashboard"
 MENU_NOVO_RELATORIO = "Novo relatorio"
 MENU_GERENCIAR_USUARIOS = "Usuarios"
 MENU_MINHA_CONTA = "Minha conta"
+MENU_USO = "Uso"
+MENU_GRUPOS = "Grupos"
 
 
 @st.cache_resource
@@ -151,31 +205,388 @@ def get_database() -> Database:
     # Bump deste marcador quando o schema/contrato do Database mudar: altera o
     # hash da funcao e forca o Streamlit a recriar o recurso (evita instancia
     # antiga em cache apos um deploy).
-    _schema_version = "v3"
-    return Database()
+    _schema_version = "v4"
+    database = Database()
+    # Thread de LISTEN (SUPABASE_DB_URL) que avisa os caches do que mudou no
+    # banco, qualquer que seja a origem da escrita.
+    database.iniciar_escuta()
+    return database
+
+
+def _conectar_database() -> Database:
+    try:
+        return get_database()
+    except Exception as e:  # noqa: BLE001
+        st.error(
+            "Erro ao conectar/inicializar o Supabase. Confira os secrets "
+            "(SUPABASE_URL/SUPABASE_KEY) e o schema (supabase_schema.sql / migration_v3.sql)."
+        )
+        st.exception(e)
+        st.stop()
+
+
+class _DatabaseSobDemanda:
+    """`db` do app: conecta ao Supabase (e importa supabase/psycopg) so no
+    primeiro uso, entao a tela de login renderiza sem esperar o boot do banco."""
+
+    def __getattr__(self, nome):
+        # Em rerun perfilado, cada chamada vira uma secao "db.<metodo>".
+        return captura_atual().envolver(f"db.{nome}", getattr(_conectar_database(), nome))
+
+
+db = _DatabaseSobDemanda()
+
+
+@st.cache_resource
+def _baixar_powerbi_client_em_segundo_plano():
+    """Deploy sem o scripts/baixar_powerbi_client.py: baixa o arquivo uma vez
+    por processo, numa thread, sem segurar o rerun que o pediu."""
+    def _baixar():
+        # Sem internet ou CDN fora: o pool segue carregando do CDN.
+        with contextlib.suppress(Exception):
+            baixar_powerbi_client(os.path.join(_STATIC_DIR, ARQUIVO_POWERBI_CLIENT))
+
+    threading.Thread(target=_baixar, name="powerbi-client", daemon=True).start()
+
+
+def urls_powerbi_client():
+    """URLs do powerbi-client para o pool, em ordem de preferencia: a de
+    static/ (a partir da raiz do servidor) e a da mesma versao no CDN, usada
+    enquanto o arquivo nao existe ou se o servidor nao o entregar como JS."""
+    if os.path.exists(os.path.join(_STATIC_DIR, ARQUIVO_POWERBI_CLIENT)):
+        return [url_estatico(ARQUIVO_POWERBI_CLIENT, absoluta=True), URL_POWERBI_CLIENT]
+    _baixar_powerbi_client_em_segundo_plano()
+    return [URL_POWERBI_CLIENT]
 
 
-try:
-    db = get_database()
-except Exception as e:  # noqa: BLE001
-    st.error(
-        "Erro ao conectar/inicializar o Supabase. Confira os secrets "
-        "(SUPABASE_URL/SUPABASE_KEY) e o schema (supabase_schema.sql / migration_v3.sql)."
+@st.cache_resource
+def get_embed_broker():
+    # Broker de embed tokens (service principal do Power BI). Opcional: sem os
+    # secrets POWERBI_* os relatorios sao embedados pelo link cru, como antes.
+    broker = EmbedBroker.from_secrets(db._get_secret)
+    if broker is not None:
+        broker.iniciar_renovacao()
+    return broker
+
+
+@st.cache_resource
+def verificador_links() -> VerificadorLinks:
+    # Varredura periodica dos links do catalogo em segundo plano
+    # (LINKS_INTERVALO_S; 0 desliga). LINKS_ALVO redireciona as requisicoes
+    # para outro host (testes com servidor local).
+    verificador = VerificadorLinks.from_secrets(db._get_secret)
+    try:
+        intervalo = int(db._get_secret("LINKS_INTERVALO_S", str(INTERVALO_PADRAO_S)))
+    except ValueError:
+        intervalo = INTERVALO_PADRAO_S
+    verificador.iniciar(get_database(), intervalo)
+    return verificador
+
+
+@st.cache_resource
+def perfilador() -> Perfilador:
+    # Sessoes vistas e perfis armados pelo admin em "Minha conta" (por processo).
+    return Perfilador()
+
+
+# Leituras usadas na gestao de usuarios. Ficam em caches write-through por id
+# (compartilhados entre sessoes) para a tela nao bater no Supabase a cada
+# rerun; as gravacoes aplicam so a linha afetada em vez de limpar tudo.
+USUARIOS_POR_PAGINA = 25
+PREVIA_EM_MASSA_MAX = 50
+ROTULOS_ACOES_EM_MASSA = {
+    "adicionar_areas": "Adicionar áreas",
+    "remover_areas": "Remover áreas",
+    "definir_nivel": "Definir nível hierárquico",
+    "liberar_relatorios": "Liberar relatórios individualmente",
+    "revogar_relatorios": "Revogar liberação individual",
+}
+
+
+@st.cache_resource
+def cache_compartilhado() -> CacheCompartilhado | None:
+    # L2 + invalidacao entre replicas (REDIS_URL); sem Redis, None (so o L1).
+    compartilhado = CacheCompartilhado.from_secrets(db._get_secret)
+    if compartilhado is not None:
+        compartilhado.iniciar()
+    return compartilhado
+
+
+# Com o LISTEN confirmado o banco avisa cada alteracao (triggers com NOTIFY) e
+# o TTL vira so rede de seguranca; sem ele, vale o TTL curto padrao.
+TTL_COM_AVISOS_S = 900
+
+
+def _ttl_caches():
+    """TTL dos caches como funcao, lida a cada consulta: acompanha a escuta
+    cair ou voltar. Captura o Database aqui (pode rodar na thread de LISTEN)."""
+    database = _conectar_database()
+    return lambda: TTL_COM_AVISOS_S if database.escutando else TTL_PADRAO_S
+
+
+def _instante(valor):
+    try:
+        return ler_instante(valor)
+    except ValueError:
+        return None
+
+
+def _ouvir_banco(cache, tabela, por_linha=True):
+    """Liga `cache` aos avisos do banco sobre `tabela`: descarta so a linha
+    avisada (ou o cache todo, com `por_linha=False`). Roda na thread de LISTEN,
+    por isso captura aqui o que precisa em vez de chamar os cache_resource."""
+    compartilhado = cache_compartilhado()
+
+    def _ao_alterar(evento):
+        if evento is None:
+            cache.invalidar(propagar=False)
+            return
+        op, item_id = evento.get("op"), evento.get("id")
+        if por_linha and op in ("INSERT", "UPDATE"):
+            atual = cache.obter(item_id, lambda _id: None)
+            versao = _instante(evento.get("versao"))
+            if atual is not None and (
+                op == "INSERT"
+                or (versao is not None and _instante(atual.get("atualizado_em")) == versao)
+            ):
+                return  # write-through (desta ou de outra replica) ja aplicou
+        if compartilhado is not None:
+            compartilhado.avancar_geracao(cache.nome)
+        if not por_linha:
+            cache.invalidar(propagar=False)
+        elif op == "INSERT":
+            cache.vencer(propagar=False)
+        elif op == "DELETE":
+            cache.remover(item_id, propagar=False)
+        else:
+            cache.invalidar(item_id, propagar=False)
+
+    db.ao_alterar(tabela, _ao_alterar)
+    return cache
+
+
+def _renomear_criador(cache, usuario_id, nome, propagar=True):
+    """Troca, no lugar, o nome do criador nos relatorios dele ja em cache."""
+    for r in cache.linhas(lambda r: r.get("criado_por") == usuario_id):
+        if r.get("criador") != nome:
+            cache.aplicar(r.substituir(criador=nome), propagar=propagar)
+
+
+def _ouvir_criadores(cache):
+    """Liga o catalogo aos avisos de usuarios. Dos usuarios o catalogo so usa o
+    nome do criador (ativo, senao "Sistema"): avisos que nao mexem em username
+    ou ativo sao ignorados e os demais trocam o nome nos cards do criador, sem
+    descartar o catalogo. Mesma regra de thread de `_ouvir_banco`."""
+    database = _conectar_database()
+    compartilhado = cache_compartilhado()
+
+    def _ao_alterar(evento):
+        # Reconexao: o ouvinte de relatorios do mesmo cache ja o descarta.
+        # Usuario novo ainda nao criou relatorio.
+        if evento is None or evento.get("op") == "INSERT":
+            return
+        campos = evento.get("campos")
+        if evento.get("op") == "UPDATE" and campos is not None \
+                and not {"username", "ativo"} & set(campos):
+            return
+        usuario_id = evento.get("id")
+        usuario = None
+        if evento.get("op") != "DELETE":
+            usuario = database.obter_usuario_por_id(usuario_id)
+        if compartilhado is not None:
+            compartilhado.avancar_geracao(cache.nome)
+        _renomear_criador(cache, usuario_id, usuario["username"] if usuario else "Sistema",
+                          propagar=False)
+
+    db.ao_alterar("usuarios", _ao_alterar)
+    return cache
+
+
+@st.cache_resource
+def cache_usuarios() -> CacheIndexado:
+    return _ouvir_banco(
+        CacheIndexado("usuarios", ttl=_ttl_caches(), compartilhado=cache_compartilhado(),
+                      modelo=Usuario),
+        "usuarios",
     )
-    st.exception(e)
-    st.stop()
 
 
-# Leituras usadas na gestao de usuarios. Cacheadas para a tela nao bater no
-# Supabase a cada rerun (evita lentidao); o cache e limpado nas gravacoes.
-@st.cache_data(ttl=120, show_spinner=False)
-def cached_listar_usuarios():
-    return db.listar_usuarios()
+@st.cache_resource
+def cache_relatorios() -> CacheIndexado:
+    # atualizado_em (trigger) versiona as linhas: patch mais antigo que o
+    # cache indica escrita fora de ordem e forca a recarga.
+    return _ouvir_banco(
+        CacheIndexado(
+            "relatorios", versao_de=lambda r: r.get("atualizado_em"),
+            ttl=_ttl_caches(), compartilhado=cache_compartilhado(),
+        ),
+        "relatorios",
+    )
+
+
+@st.cache_resource
+def cache_catalogo() -> CacheIndexado:
+    # Catalogo completo do dashboard (com link e criador), carregado uma vez
+    # para todos os usuarios e filtrado em memoria por permissao; depois so
+    # recebe deltas (listar_relatorios). Depende tambem de usuarios (nome do
+    # criador nos cards), trocado no lugar.
+    cache = CacheIndexado("catalogo", ttl=_ttl_caches(), compartilhado=cache_compartilhado(),
+                          modelo=Relatorio)
+    _ouvir_banco(cache, "relatorios")
+    return _ouvir_criadores(cache)
+
+
+@st.cache_resource
+def cache_grupos() -> CacheIndexado:
+    # Poucas linhas: qualquer aviso recarrega a lista inteira. Depende tambem
+    # de usuarios (contagem de membros: mudar a associacao recalcula a linha
+    # do usuario, que avisa).
+    cache = CacheIndexado("grupos", ttl=_ttl_caches(), compartilhado=cache_compartilhado())
+    _ouvir_banco(cache, "grupos_acesso", por_linha=False)
+    return _ouvir_banco(cache, "usuarios", por_linha=False)
+
+
+def _usuario_casa_filtros(u, busca="", is_admin=None, nivel=None, area=None):
+    if busca and not u["username"].lower().startswith(busca.lower()):
+        return False
+    if is_admin is not None and u["is_admin"] != is_admin:
+        return False
+    if nivel and u["nivel_hierarquia"] != nivel:
+        return False
+    if area and area not in (u["categorias_permitidas"] or []):
+        return False
+    return True
+
+
+def cached_listar_usuarios(busca="", is_admin=None, nivel=None, area=None, pagina=1,
+                           por_pagina=USUARIOS_POR_PAGINA):
+    # Uma pagina por chave de cache: o custo depende do tamanho da pagina, nao
+    # da quantidade de usuarios cadastrados.
+    return cache_usuarios().consulta(
+        ("pagina", busca, is_admin, nivel, area, pagina, por_pagina),
+        lambda: db.listar_usuarios(busca, is_admin, nivel, area, pagina, por_pagina),
+        pred=functools.partial(_usuario_casa_filtros, busca=busca, is_admin=is_admin,
+                               nivel=nivel, area=area),
+        paginada=True,
+    )
+
+
+def cached_obter_usuario(usuario_id):
+    return cache_usuarios().obter(usuario_id, db.obter_usuario_por_id)
 
 
-@st.cache_data(ttl=120, show_spinner=False)
 def cached_listar_relatorios_basico():
-    return db.listar_relatorios_basico()
+    def _carregar():
+        rows = db.listar_relatorios_basico()
+        return rows, len(rows)
+
+    rows, _total = cache_relatorios().consulta(
+        "basico", _carregar, ordem=Database.ordem_relatorio_basico
+    )
+    return rows
+
+
+def _relatorio_casa_busca(r, termo="", categorias=(), nivel=None):
+    termo = termo.lower()
+    if termo and not (r["titulo"].lower().startswith(termo)
+                      or r["categoria"].lower().startswith(termo)):
+        return False
+    if r["categoria"] not in categorias:
+        return False
+    return nivel == "gestao" or r["nivel_hierarquia"] == "operacao"
+
+
+def cached_buscar_relatorios(termo, categorias, nivel, limite=30):
+    """Resultados do typeahead (limitados), em cache por termo/escopo."""
+    categorias = tuple(categorias)
+
+    def _carregar():
+        rows = db.buscar_relatorios_basico(termo, categorias, nivel, limite)
+        return rows, len(rows)
+
+    linhas, _total = cache_relatorios().consulta(
+        ("busca", termo, categorias, nivel, limite),
+        _carregar,
+        pred=functools.partial(_relatorio_casa_busca, termo=termo,
+                               categorias=categorias, nivel=nivel),
+        paginada=True,
+    )
+    return linhas
+
+
+def cached_relatorios_por_ids(ids):
+    return cache_relatorios().obter_varios(list(ids), db.obter_relatorios_basico)
+
+
+def cached_listar_grupos():
+    def _carregar():
+        rows = db.listar_grupos()
+        return rows, len(rows)
+
+    grupos, _total = cache_grupos().consulta(
+        "todos", _carregar, ordem=lambda g: g["nome"].lower()
+    )
+    return grupos
+
+
+# Popularidade vem dos agregados (rollups) de logs_acesso; a agregacao
+# incremental roda junto com a leitura, no maximo a cada 10 minutos.
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_popularidade_relatorios(dias=30):
+    try:
+        db.atualizar_rollups_acesso()
+    except Exception:  # noqa: BLE001  (sem rollup: usa o que ja foi agregado)
+        pass
+    try:
+        return db.popularidade_relatorios(dias)
+    except Exception:  # noqa: BLE001  (schema sem agregados: sem popularidade)
+        return {}
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_atividade_usuarios(dias=30):
+    cached_popularidade_relatorios(dias)  # garante o rollup em dia
+    try:
+        return db.atividade_usuarios(dias)
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_status_links():
+    try:
+        return db.status_links()
+    except Exception:  # noqa: BLE001  (schema sem links_status: sem avisos)
+        return {}
+
+
+def aviso_link(status):
+    """Texto curto do problema do link para o card (vazio quando ok)."""
+    situacao = (status or {}).get("situacao")
+    if situacao in (None, "ok"):
+        return ""
+    if situacao == "lento":
+        return f"Lento ({status['latencia_ms'] / 1000:.1f} s)".replace(".", ",")
+    if status.get("http_status"):
+        return f"{SITUACAO_LABELS[situacao]} (HTTP {status['http_status']})"
+    return SITUACAO_LABELS.get(situacao, situacao)
+
+
+def registrar_acesso(usuario_id, relatorio_id):
+    # Log de uso nao pode impedir a abertura do relatorio.
+    try:
+        db.registrar_acesso(usuario_id, relatorio_id)
+    except Exception:  # noqa: BLE001
+        pass
+
+
+def _write_through(cache, resultado, nova=False):
+    """Aplica no cache a linha devolvida por uma gravacao; sem linha (ex.:
+    banco nao devolveu a representacao), descarta o cache por seguranca."""
+    if isinstance(resultado, (dict, Modelo)):
+        cache.aplicar(resultado, nova=nova)
+    elif resultado:
+        cache.invalidar()
 
 
 def render_logo(width: int, path: str = "logo.png", use_container_width: bool = False):
@@ -210,171 +621,41 @@ def render_logo_centered(path: str, max_width: int, top_margin: int = 0):
     )
 
 
-def apply_professional_theme():
-    st.markdown(
-        """
-        <style>
-            /* ---- Tipografia profissional (Poppins nos titulos + Inter no corpo) ---- */
-            @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&family=Poppins:wght@600;700&display=swap');
-            @import url('https://fonts.googleapis.com/css2?family=Material+Symbols+Outlined:opsz,wght,FILL,GRAD@20..48,100..700,0..1,-50..200');
-            .material-symbols-outlined {
-                font-family: 'Material Symbols Outlined';
-                font-weight: normal; font-style: normal; line-height: 1;
-                vertical-align: middle; -webkit-font-feature-settings: 'liga';
-            }
-
-            :root {
-                --frt-escuro: #14401E;   /* verde escuro da logo */
-                --frt-verde:  #2E7D32;
-                --frt-medio:  #43A047;   /* faixa media da logo */
-                --frt-claro:  #7CB342;   /* faixa clara da logo */
-                --frt-bg:     #F5F8F4;
-                --frt-card:   #FFFFFF;
-                --frt-borda:  #E2E8E0;
-                --frt-texto:  #1D2A22;
-                --frt-suave:  #5B6B60;
-            }
-
-            html, body, .stApp, [data-testid="stSidebar"],
-            input, textarea, button, select, [data-baseweb] {
-                font-family: 'Inter', -apple-system, 'Segoe UI', Roboto, sans-serif;
-            }
-            h1, h2, h3, h4, .portal-title, .sidebar-brand {
-                font-family: 'Poppins', 'Inter', sans-serif !important;
-                color: var(--frt-escuro);
-                letter-spacing: -0.01em;
-            }
-
-            /* ---- Fundo e barra superior ---- */
-            .stApp { background: var(--frt-bg); }
-            [data-testid="stHeader"] {
-                background: #FFFFFF;
-                border-bottom: 3px solid var(--frt-medio);
-            }
-            .block-container, [data-testid="stMainBlockContainer"] { padding-top: 1.4rem; }
-
-            /* ---- Sidebar ---- */
-            [data-testid="stSidebar"] {
-                background: #FFFFFF;
-                border-right: 1px solid var(--frt-borda);
-            }
-            [data-testid="stSidebar"] [data-testid="stImage"] { margin-bottom: 0 !important; }
-            .sidebar-brand {
-                margin: -0.35rem 0 0.05rem 0; text-align: center;
-                font-size: 2rem; font-weight: 700;
-            }
-            .sidebar-subtitle {
-                margin: 0 0 0.1rem 0; text-align: center; color: var(--frt-suave);
-                font-size: 0.82rem; font-weight: 600; letter-spacing: 0.08em;
-                text-transform: uppercase;
-            }
-            .sidebar-user { margin: 0; color: var(--frt-texto); font-size: 1rem; font-weight: 600; }
-
-            /* ---- Titulos do conteudo ---- */
-            .portal-kicker { margin: 0; text-align: center; color: var(--frt-suave);
-                font-size: 0.95rem; font-weight: 500; }
-            .portal-title {
-                margin: 0.2rem 0 0.8rem 0; text-align: center;
-                font-size: 2.4rem; font-weight: 700;
-            }
-
-            /* ---- Botoes ---- */
-            .stButton > button {
-                border-radius: 10px; font-weight: 600; transition: all .15s ease;
-            }
-            .stButton > button[kind="primary"] {
-                background: linear-gradient(90deg, var(--frt-escuro) 0%, var(--frt-medio) 100%);
-                border: none; color: #ffffff; font-weight: 700;
-                box-shadow: 0 2px 6px rgba(20,64,30,.25);
-            }
-            .stButton > button[kind="primary"]:hover {
-                filter: brightness(1.07); transform: translateY(-1px);
-                box-shadow: 0 4px 12px rgba(20,64,30,.3);
-            }
-            .stButton > button[kind="secondary"] { border: 1px solid var(--frt-borda); }
-            .stButton > button[kind="secondary"]:hover {
-                border-color: var(--frt-medio); color: var(--frt-escuro);
-            }
-
-            /* Navegacao da sidebar: itens alinhados a esquerda, estilo menu */
-            [data-testid="stSidebar"] .stButton > button {
-                justify-content: flex-start;
-                padding-left: 0.9rem;
-                font-weight: 600;
-            }
-            [data-testid="stSidebar"] .stButton > button[kind="secondary"] {
-                border-color: transparent;
-                background: transparent;
-                color: var(--frt-texto);
-            }
-            [data-testid="stSidebar"] .stButton > button[kind="secondary"]:hover {
-                background: #F0F5EE;
-                border-color: transparent;
-            }
-
-            /* ---- Cards / expanders (lista de relatorios) ---- */
-            [data-testid="stExpander"] {
-                border: 1px solid var(--frt-borda) !important;
-                border-radius: 12px !important;
-                background: var(--frt-card);
-                box-shadow: 0 1px 3px rgba(20,64,30,.06);
-                transition: box-shadow .15s ease, transform .15s ease, border-color .15s ease;
-                overflow: hidden;
-            }
-            [data-testid="stExpander"]:hover {
-                box-shadow: 0 6px 18px rgba(20,64,30,.12);
-                border-color: var(--frt-claro) !important;
-                transform: translateY(-1px);
-            }
-            [data-testid="stExpander"] summary { font-weight: 600; color: var(--frt-escuro); }
-            [data-testid="stExpander"] summary:hover { color: var(--frt-medio); }
-
-            /* Cards (grade de relatorios e listas) */
-            [data-testid="stVerticalBlockBorderWrapper"] {
-                border-radius: 14px !important;
-                box-shadow: 0 1px 3px rgba(20,64,30,.06);
-                transition: box-shadow .18s ease, transform .18s ease, border-color .18s ease;
-            }
-            [data-testid="stVerticalBlockBorderWrapper"]:hover {
-                box-shadow: 0 10px 24px rgba(20,64,30,.13);
-                transform: translateY(-2px);
-            }
-
-            /* ---- Inputs com foco verde ---- */
-            [data-baseweb="input"]:focus-within, [data-baseweb="select"]:focus-within,
-            [data-baseweb="textarea"]:focus-within, .stTextArea textarea:focus {
-                border-color: var(--frt-medio) !important;
-                box-shadow: 0 0 0 2px rgba(67,160,71,.18) !important;
-            }
+@st.cache_resource
+def _baixar_fontes_em_segundo_plano():
+    """Deploy sem etapa de build (ex.: Streamlit Community Cloud) nao roda
+    scripts/baixar_fontes.py: o processo que nao encontra o subset de icones
+    (o ultimo arquivo que o script grava) o roda uma vez, em segundo plano.
+    Ate terminar, font-display: swap mostra as fontes do sistema."""
+    if os.path.exists(os.path.join(_STATIC_DIR, "fonts", "material-symbols-outlined.woff2")):
+        return
+    subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(_STATIC_DIR), "scripts", "baixar_fontes.py")],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
 
-            /* ---- Detalhes ---- */
-            [data-baseweb="tag"] { background-color: var(--frt-medio) !important; }
-            hr { border-color: var(--frt-borda); }
-            .stAlert { border-radius: 10px; }
 
-            [data-testid="stSidebar"] img,
-            [data-testid="stMainBlockContainer"] img {
-                object-fit: contain !important;
-                height: auto !important;
-                max-width: 100% !important;
-            }
-        </style>
-        """,
+def apply_professional_theme():
+    # O CSS do tema e as fontes sao arquivos estaticos; cada rerun reenvia so
+    # as duas tags <link>, nao a folha de estilo inteira.
+    _baixar_fontes_em_segundo_plano()
+    st.markdown(
+        f'<link rel="stylesheet" href="{url_estatico("fontes.css")}">'
+        f'<link rel="stylesheet" href="{url_estatico("tema.css")}">',
         unsafe_allow_html=True,
     )
 
 
 def apply_sidebar_visibility():
+    # Emite o elemento SEMPRE (vazio quando a sidebar aparece) para nao
+    # deslocar a posicao dos elementos seguintes, como o pool de iframes.
+    css = ""
     if st.session_state.get("ocultar_sidebar", False):
-        st.markdown(
-            """
-            <style>
+        css = """
                 [data-testid="stSidebar"] { display: none !important; }
                 [data-testid="stSidebarCollapsedControl"] { display: none !important; }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
+        """
+    st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
 
 
 def render_page_header(title_text: str):
@@ -391,7 +672,14 @@ def verificar_login(username: str, senha: str):
 
 
 def listar_relatorios(usuario):
-    return db.listar_relatorios_usuario(usuario)
+    def _carregar():
+        rows = db.listar_relatorios_completo()
+        return rows, Database.marca_sincronizacao(r["atualizado_em"] for r in rows)
+
+    catalogo, _total = cache_catalogo().consulta_incremental(
+        "completo", _carregar, db.sincronizar_catalogo, ordem=Database.ordem_catalogo
+    )
+    return db.filtrar_relatorios_usuario(usuario, catalogo)
 
 
 def obter_relatorio_por_id(relatorio_id: int, usuario=None):
@@ -407,8 +695,9 @@ def criar_relatorio(titulo, link_powerbi, descricao, categoria, criado_por, nive
         ok = db.criar_relatorio(
             titulo, link_powerbi, descricao, categoria, criado_por, nivel_hierarquia
         )
+        _write_through(cache_relatorios(), ok, nova=True)
         if ok:
-            cached_listar_relatorios_basico.clear()
+            cache_catalogo().vencer()  # o proximo delta traz o relatorio novo
         return ok
     except Exception as e:
         st.error(f"Erro ao criar relatorio: {e}")
@@ -420,8 +709,9 @@ def atualizar_relatorio(relatorio_id, titulo, link_powerbi, descricao, categoria
         ok = db.atualizar_relatorio(
             relatorio_id, titulo, link_powerbi, descricao, categoria, nivel_hierarquia
         )
+        _write_through(cache_relatorios(), ok)
         if ok:
-            cached_listar_relatorios_basico.clear()
+            cache_catalogo().invalidar(relatorio_id)
         return ok
     except Exception as e:
         st.error(f"Erro ao atualizar relatorio: {e}")
@@ -446,15 +736,16 @@ def excluir_relatorio(relatorio_id):
     try:
         ok = db.excluir_relatorio(relatorio_id)
         if ok:
-            cached_listar_relatorios_basico.clear()
+            cache_relatorios().remover(relatorio_id)
+            cache_catalogo().remover(relatorio_id)
         return ok
     except Exception as e:
         st.error(f"Erro ao excluir relatorio: {e}")
         return False
 
 
-def listar_usuarios():
-    return db.listar_usuarios()
+def listar_usuarios(busca="", is_admin=None, nivel=None, area=None, pagina=1, por_pagina=None):
+    return db.listar_usuarios(busca, is_admin, nivel, area, pagina, por_pagina)
 
 
 def obter_usuario_por_id(usuario_id):
@@ -468,8 +759,7 @@ def criar_usuario(username, senha, is_admin=False, nivel_hierarquia="operacao",
             username, senha, is_admin, nivel_hierarquia,
             categorias_permitidas, relatorios_permitidos,
         )
-        if ok:
-            cached_listar_usuarios.clear()
+        _write_through(cache_usuarios(), ok, nova=True)
         return ok
     except Exception as e:
         msg = str(e).lower()
@@ -487,8 +777,9 @@ def atualizar_usuario(usuario_id, username=None, is_admin=None, nivel_hierarquia
             usuario_id, username, is_admin, nivel_hierarquia,
             categorias_permitidas, relatorios_permitidos,
         )
-        if ok:
-            cached_listar_usuarios.clear()
+        _write_through(cache_usuarios(), ok)
+        if ok and username is not None:
+            _renomear_criador(cache_catalogo(), usuario_id, username)
         return ok
     except Exception as e:
         msg = str(e).lower()
@@ -499,6 +790,120 @@ def atualizar_usuario(usuario_id, username=None, is_admin=None, nivel_hierarquia
         return False
 
 
+def alterar_permissoes_em_massa(acao, valor, filtros, simular=False):
+    """Alteracao em massa (um UPDATE no banco) para os usuarios comuns que
+    casam com `filtros`; devolve os usuarios que mudam, ou None em erro."""
+    try:
+        usuarios = db.alterar_permissoes_em_massa(acao, valor, simular=simular, **filtros)
+    except Exception as e:
+        st.error(f"Erro na alteracao em massa: {e}")
+        return None
+    if not simular:
+        cache = cache_usuarios()
+        for u in usuarios:
+            cache.aplicar(u)
+    return usuarios
+
+
+def _resumo_permissao(u, acao):
+    """Texto do campo que `acao` altera, para a previa da alteracao em massa."""
+    if acao.endswith("_areas"):
+        return ", ".join(u["categorias_permitidas"]) or "(nenhuma área)"
+    if acao == "definir_nivel":
+        return NIVEL_LABELS.get(u["nivel_hierarquia"], u["nivel_hierarquia"])
+    qtd = len(u.get("relatorios_permitidos") or [])
+    return f"{qtd} relatório(s) liberado(s)" if qtd else "Todos das áreas"
+
+
+def definir_grupos_usuario(usuario_id, grupo_ids, atuais=()):
+    try:
+        atualizado = db.definir_grupos_usuario(usuario_id, grupo_ids, atuais)
+    except Exception as e:
+        st.error(f"Erro ao salvar os grupos do usuario: {e}")
+        return False
+    if atualizado is not None:
+        _write_through(cache_usuarios(), atualizado)
+        cache_grupos().invalidar()  # contagem de membros
+    return True
+
+
+def _erro_grupo(acao, e):
+    msg = str(e).lower()
+    if "duplicate" in msg or "unique" in msg:
+        st.error("Já existe um grupo com este nome.")
+    else:
+        st.error(f"Erro ao {acao} grupo: {e}")
+
+
+def criar_grupo(nome, descricao, nivel_hierarquia, categorias_permitidas, relatorios_permitidos):
+    try:
+        ok = db.criar_grupo(nome, descricao, nivel_hierarquia, categorias_permitidas,
+                            relatorios_permitidos)
+        _write_through(cache_grupos(), ok, nova=True)
+        return ok
+    except Exception as e:
+        _erro_grupo("criar", e)
+        return False
+
+
+def atualizar_grupo(grupo_id, nome, descricao, nivel_hierarquia, categorias_permitidas,
+                    relatorios_permitidos):
+    try:
+        ok = db.atualizar_grupo(grupo_id, nome, descricao, nivel_hierarquia,
+                                categorias_permitidas, relatorios_permitidos)
+    except Exception as e:
+        _erro_grupo("atualizar", e)
+        return False
+    if ok:
+        # O banco recalcula as permissoes efetivas dos membros.
+        cache_grupos().invalidar()
+        cache_usuarios().invalidar()
+    return ok
+
+
+def excluir_grupo(grupo_id):
+    try:
+        ok = db.excluir_grupo(grupo_id)
+    except Exception as e:
+        _erro_grupo("excluir", e)
+        return False
+    if ok:
+        cache_grupos().remover(grupo_id)
+        cache_usuarios().invalidar()
+    return ok
+
+
+def seletor_relatorios(prefixo, iniciais, categorias, nivel, rotulo,
+                       rotulo_busca="Buscar relatório", ajuda=None):
+    """Typeahead de relatorios: so vai para o navegador o que ja esta
+    selecionado + ate 30 resultados da busca, restritos a `categorias` e
+    `nivel`. A selecao persiste em session_state[f"{prefixo}_ids"]."""
+    sel_key = f"{prefixo}_ids"
+    if sel_key not in st.session_state:
+        st.session_state[sel_key] = list(iniciais)
+    termo = st.text_input(rotulo_busca, placeholder="Início do título ou da área...",
+                          key=f"{prefixo}_busca")
+    rotulos = {
+        r["id"]: f"{r['categoria']} · {NIVEL_LABELS[r['nivel_hierarquia']]} · {r['titulo']}"
+        for r in cached_relatorios_por_ids(st.session_state[sel_key])
+        + cached_buscar_relatorios(termo.strip(), categorias, nivel)
+    }
+    opcoes = sorted(rotulos, key=lambda i: rotulos[i])
+    selecionados = st.multiselect(
+        rotulo,
+        opcoes,
+        # Ids selecionados cujo relatorio nao existe mais sao descartados.
+        default=[i for i in st.session_state[sel_key] if i in rotulos],
+        format_func=lambda i: rotulos.get(i, f"#{i}"),
+        # Opcoes mudam com a busca: a chave acompanha o conjunto de opcoes e
+        # a selecao persiste em session_state[sel_key].
+        key=f"{prefixo}_{hashlib.sha1(repr(opcoes).encode()).hexdigest()[:8]}",
+        help=ajuda,
+    )
+    st.session_state[sel_key] = list(selecionados)
+    return selecionados
+
+
 def atualizar_senha(usuario_id, nova_senha):
     try:
         return db.atualizar_senha_portal(usuario_id, nova_senha)
@@ -511,7 +916,8 @@ def excluir_usuario(usuario_id):
     try:
         ok = db.excluir_usuario(usuario_id)
         if ok:
-            cached_listar_usuarios.clear()
+            cache_usuarios().remover(usuario_id)
+            _renomear_criador(cache_catalogo(), usuario_id, "Sistema")
         return ok
     except Exception as e:
         st.error(f"Erro ao excluir usuario: {e}")
@@ -536,9 +942,182 @@ def validar_link_powerbi(link):
     return False
 
 
+# Quantos dos relatorios visiveis mais acessados (agregados de logs_acesso)
+# recebem <link rel="prefetch"> da URL que o iframe do pool vai carregar
+# (0 desliga).
+PREFETCH_TOP_N = 3
+# Hosts extras usados pelo embed com token (powerbi-client no CDN).
+_HOSTS_EMBED = ("https://cdn.jsdelivr.net",)
+
+
+def _origem(link):
+    try:
+        partes = urlsplit(link.strip())
+    except ValueError:
+        return None
+    if partes.scheme not in ("http", "https") or not partes.netloc:
+        return None
+    return f"{partes.scheme}://{partes.netloc}".lower()
+
+
+def _mais_acessados(relatorios, popularidade, n):
+    """Os `n` relatorios visiveis mais acessados segundo os agregados de uso
+    (empate: aberturas nesta sessao), fora os que ja estao no pool."""
+    aberturas = st.session_state.get("aberturas") or {}
+    no_pool = {p["id"] for p in st.session_state.get("pool_iframes", [])}
+
+    def _acessos(r):
+        return (popularidade.get(r["id"]) or {}).get("acessos", 0)
+
+    candidatos = [
+        r for r in relatorios
+        if r["id"] not in no_pool and (_acessos(r) or aberturas.get(r["id"]))
+    ]
+    candidatos.sort(key=lambda r: (-_acessos(r), -aberturas.get(r["id"], 0)))
+    return candidatos[:n]
+
+
+def render_dicas_conexao(relatorios, popularidade):
+    """Emite preconnect/dns-prefetch para os hosts distintos dos relatorios
+    visiveis e prefetch dos mais acessados, para o navegador ja ter DNS/TLS
+    resolvidos (e a pagina do relatorio em cache) quando o usuario clicar em
+    "Abrir". O prefetch usa a URL que o pool vai de fato carregar: o link
+    ajustado do iframe ou a embed_url do embed com token."""
+    origens = []
+    for r in relatorios:
+        origem = _origem(r["link_powerbi"])
+        if origem and origem not in origens:
+            origens.append(origem)
+    if any("powerbi.com" in o for o in origens) and get_embed_broker() is not None:
+        origens.extend(h for h in _HOSTS_EMBED if h not in origens)
+
+    tags = []
+    for origem in origens:
+        o = escape(origem, quote=True)
+        tags.append(f'<link rel="preconnect" href="{o}" crossorigin>')
+        tags.append(f'<link rel="dns-prefetch" href="{o}">')
+
+    if PREFETCH_TOP_N:
+        for r in _mais_acessados(relatorios, popularidade, PREFETCH_TOP_N):
+            entrada = _entrada_pool(r["id"], r["link_powerbi"])
+            if entrada is None:
+                continue
+            url = entrada["src"] if entrada["tipo"] == "iframe" else entrada["embed_url"]
+            if _origem(url):
+                tags.append(f'<link rel="prefetch" href="{escape(url, quote=True)}">')
+
+    if tags:
+        st.markdown("".join(tags), unsafe_allow_html=True)
+
+
+# Quantos relatorios abertos ficam vivos (ocultos) no navegador. Limita a
+# memoria do cliente; trocar entre eles nao recarrega o Power BI.
+POOL_IFRAMES_MAX = 3
+
+
+def _entrada_pool(relatorio_id, link):
+    """Entrada do pool de iframes para um relatorio: embed com token (broker
+    configurado e link de workspace) ou iframe com o link cru."""
+    low = link.lower()
+    # Painel Streamlit (cloud *.streamlit.app ou tunel *.ts.net) embeda via iframe.
+    # 1) Acrescenta ?embed=true (sem isso o navegador bloqueia o iframe).
+    # 2) Se houver DASH_TOKEN nos Secrets do Portal, injeta ?token=... para
+    #    liberar o painel exposto na internet. O token vem SO dos Secrets do
+    #    Portal — nunca fica salvo no banco (Supabase guarda a URL limpa).
+    if "streamlit.app" in low or "ts.net" in low:
+        if "embed=" not in low:
+            link = link + ("&" if "?" in link else "?") + "embed=true"
+        try:
+            tok = str(st.secrets["DASH_TOKEN"])
+        except Exception:  # noqa: BLE001  (sem token configurado)
+            tok = ""
+        if tok and "token=" not in link.lower():
+            link = link + "&token=" + tok
+    else:
+        # Relatorio de workspace do Power BI: com o broker configurado, embeda
+        # com embed token (sem passar pelo login da Microsoft no iframe).
+        broker = get_embed_broker()
+        embed = None
+        if broker is not None:
+            try:
+                embed = broker.obter_embed(link)
+            except Exception:  # noqa: BLE001  (falha no token: cai no link cru)
+                embed = None
+        if embed is not None:
+            return {
+                "id": relatorio_id, "tipo": "embed", "token": embed["token"],
+                "embed_url": embed["embed_url"], "report_id": embed["report_id"],
+                "expira_em": embed.get("expira_em"),
+            }
+    if not _origem(link):
+        return None
+    return {"id": relatorio_id, "tipo": "iframe", "src": link}
+
+
+def _relatorio_do_pool(relatorio_id, permissoes):
+    """Linha atual do relatorio (catalogo em cache) se `permissoes` (o usuario
+    atual, ver render_pool_iframes) ainda o liberam; None se foi excluido ou a
+    permissao mudou desde que entrou no pool."""
+    r = cache_catalogo().obter(relatorio_id, db.obter_relatorio_por_id)
+    if r is None or not db.filtrar_relatorios_usuario(permissoes, [r]):
+        return None
+    return r
+
+
+def _entrada_pool_atual(item, relatorio):
+    """Entrada do pool para `item`, reaproveitando a montada em reruns
+    anteriores (guardada no proprio item) enquanto o link nao muda e o embed
+    token nao entra na margem de renovacao."""
+    link = relatorio["link_powerbi"]
+    expira_em = item.get("expira_em")
+    if item.get("entrada") is not None and item.get("link") == link and (
+        expira_em is None or expira_em - time.time() > MARGEM_RENOVACAO_S
+    ):
+        return item["entrada"]
+    entrada = _entrada_pool(relatorio["id"], link)
+    item["link"] = link
+    item["expira_em"] = entrada.pop("expira_em", None) if entrada is not None else None
+    item["entrada"] = entrada
+    return entrada
+
+
+def render_pool_iframes(usuario, ativo_id=None):
+    """Renderiza o pool de iframes (LRU em session_state["pool_iframes"]).
+
+    Chamado em TODO rerun logado e sempre na mesma posicao da pagina, para o
+    componente nao ser remontado: os relatorios ja abertos continuam
+    carregados no navegador e so o ativo fica visivel. A cada rerun a
+    permissao de cada relatorio do pool e conferida de novo (quem a perdeu sai
+    do pool); o embed token so e pedido ao broker perto de expirar.
+
+    A conferencia usa as permissoes efetivas atuais (linha do usuario no
+    cache_usuarios, mantida por write-through e NOTIFY), nao o retrato tirado
+    no login: grupo ou area revogados derrubam o relatorio ja no proximo rerun."""
+    pool = st.session_state.setdefault("pool_iframes", [])
+    # Usuario desativado/excluido: nenhum relatorio do pool continua liberado.
+    permissoes = cached_obter_usuario(usuario["id"]) if pool else None
+    entradas = []
+    for item in list(pool):
+        relatorio = _relatorio_do_pool(item["id"], permissoes) if permissoes else None
+        if relatorio is None:
+            pool.remove(item)
+            continue
+        entrada = _entrada_pool_atual(item, relatorio)
+        if entrada is not None:
+            entradas.append(entrada)
+    if ativo_id is not None and not any(e["id"] == ativo_id for e in entradas):
+        ativo_id = None
+    powerbi_js = urls_powerbi_client() if any(e["tipo"] == "embed" for e in entradas) else None
+    componentes.iframe_pool(entradas, ativo=ativo_id, limite=POOL_IFRAMES_MAX,
+                            powerbi_js=powerbi_js)
+
+
 def render_powerbi_fullscreen(relatorio):
-    # Modo TELA CHEIA: remove margens e limite de largura do portal e estica o
-    # iframe para ocupar quase toda a altura da janela.
+    """Modo TELA CHEIA: ajusta o layout, mostra o botao Voltar e coloca o
+    relatorio no topo do pool de iframes (o iframe em si e desenhado por
+    render_pool_iframes)."""
+    # Remove margens e limite de largura do portal e estica o iframe para
+    # ocupar quase toda a altura da janela.
     st.markdown(
         """
         <style>
@@ -560,56 +1139,583 @@ def render_powerbi_fullscreen(relatorio):
             del st.session_state["ocultar_sidebar_prev"]
         st.rerun()
 
-    link = relatorio["link_powerbi"]
-    low = link.lower()
-    # Painel Streamlit (cloud *.streamlit.app ou tunel *.ts.net) embeda via iframe.
-    # 1) Acrescenta ?embed=true (sem isso o navegador bloqueia o iframe).
-    # 2) Se houver DASH_TOKEN nos Secrets do Portal, injeta ?token=... para
-    #    liberar o painel exposto na internet. O token vem SO dos Secrets do
-    #    Portal — nunca fica salvo no banco (Supabase guarda a URL limpa).
-    if "streamlit.app" in low or "ts.net" in low:
-        if "embed=" not in low:
-            link = link + ("&" if "?" in link else "?") + "embed=true"
-        try:
-            tok = str(st.secrets["DASH_TOKEN"])
-        except Exception:  # noqa: BLE001  (sem token configurado)
-            tok = ""
-        if tok and "token=" not in link.lower():
-            link = link + "&token=" + tok
-    iframe_src = escape(link, quote=True)
-    components.html(
-        f"""
-        <style>html,body{{margin:0;padding:0;height:100%;overflow:hidden;}}</style>
-        <iframe
-            src="{iframe_src}"
-            style="border:0;width:100%;height:100vh;display:block;"
-            allowfullscreen="true">
-        </iframe>
-        """,
-        height=900,
-        scrolling=False,
-    )
+    # LRU: o relatorio aberto vai para o fim (com a entrada ja montada, se
+    # tiver); os mais antigos saem do pool.
+    pool = st.session_state.get("pool_iframes", [])
+    item = next((p for p in pool if p["id"] == relatorio["id"]), {"id": relatorio["id"]})
+    pool = [p for p in pool if p["id"] != relatorio["id"]] + [item]
+    st.session_state["pool_iframes"] = pool[-POOL_IFRAMES_MAX:]
+
+
+# Fragmentos (st.fragment): um clique ou filtro dentro de uma destas regioes
+# reexecuta so a regiao, sem tema, sidebar, cabecalho e o resto do menu. O que
+# muda outra regiao (abrir relatorio, trocar o usuario em edicao, salvar) pede
+# st.rerun() do app inteiro.
+def rerun_fragmento():
+    """Reexecuta so o fragmento atual. Um clique que chega junto de um rerun
+    completo e tratado na execucao completa, onde o escopo "fragment" nao e
+    permitido: nesse caso reexecuta o app."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
 
-apply_professional_theme()
-if "ocultar_sidebar" not in st.session_state:
-    st.session_state["ocultar_sidebar"] = False
-apply_sidebar_visibility()
+def perfilado(nome):
+    """Fragmento com secao propria no perfil do rerun (perfil_rerun.py). Num
+    rerun so do fragmento, que nao passa pelo topo do script, e o fragmento
+    que abre e fecha a captura."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with perfilador().fragmento(nome, st.session_state.get("usuario")):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+@st.fragment
+@perfilado("visualizador")
+def render_visualizador(usuario, menu):
+    """Slot do topo (botao Voltar/avisos da tela cheia) seguido do pool de
+    iframes. Roda em todo rerun completo, sempre na mesma posicao, para o pool
+    nao ser recriado ao entrar/sair da tela cheia; reruns dos outros
+    fragmentos nao o reenviam. Devolve True em modo tela cheia."""
+    slot_topo = st.container()
+    relatorio_tela = None
+    if menu == MENU_DASHBOARD and st.session_state.get("relatorio_em_tela"):
+        relatorio_tela = obter_relatorio_por_id(st.session_state["relatorio_em_tela"], usuario)
+        if relatorio_tela is None:
+            with slot_topo:
+                st.error("Relatorio nao encontrado ou voce nao tem permissao para acessa-lo.")
+            del st.session_state["relatorio_em_tela"]
 
-if "usuario" not in st.session_state:
-    st.session_state.usuario = None
+    em_tela = relatorio_tela is not None
+    if em_tela:
+        with slot_topo:
+            render_powerbi_fullscreen(relatorio_tela)
+    render_pool_iframes(usuario, relatorio_tela["id"] if em_tela else None)
+    return em_tela
 
-if not st.session_state.usuario:
-    if os.path.exists("logo_janelas_1.png"):
-        logo_path = "logo_janelas_1.png"
+
+@st.fragment
+@perfilado("grade")
+def render_grade_dashboard(usuario):
+    is_admin = usuario["is_admin"]
+    relatorios = listar_relatorios(usuario)
+    if not relatorios:
+        st.info("Nenhum relatorio disponivel nas suas categorias.")
     else:
-        logo_path = "logo.png"
-    render_logo_centered(logo_path, 430, top_margin=52)
+        popularidade = cached_popularidade_relatorios()
+        render_dicas_conexao(relatorios, popularidade)
+        # Grade inteira em um componente: filtro/busca/ordenacao rodam no
+        # navegador e so a acao clicada volta para ca.
+        verificador_links()  # sobe a varredura periodica (uma vez por processo)
+        status_links = cached_status_links()
+        # Relatorio ja traz a data formatada: o laco so copia campos.
+        itens = [
+            {
+                "id": r.id,
+                "titulo": r.titulo,
+                "descricao": r.descricao or "",
+                "categoria": r.categoria,
+                "nivel": r.nivel_hierarquia,
+                "nivel_label": NIVEL_LABELS.get(r.nivel_hierarquia, "Operação"),
+                "criador": r.criador or "Sistema",
+                "criado_em": r.criado_em_fmt,
+                "pode_editar": bool(is_admin or r.criado_por == usuario.id),
+                "acessos": popularidade.get(r.id, {}).get("acessos", 0),
+                "link_situacao": status_links.get(r.id, {}).get("situacao", ""),
+                "link_aviso": aviso_link(status_links.get(r.id)),
+            }
+            for r in relatorios
+        ]
+        clique = componentes.grade_relatorios(
+            itens, url_estatico("fontes.css", absoluta=True), url_icones_streamlit(),
+        )
+        if clique and clique.get("nonce") != st.session_state.get("grade_nonce"):
+            st.session_state["grade_nonce"] = clique.get("nonce")
+            alvo = next((r for r in relatorios if r["id"] == clique.get("id")), None)
+            acao = clique.get("acao")
+            if alvo is None:
+                pass
+            elif acao == "abrir":
+                if "ocultar_sidebar_prev" not in st.session_state:
+                    st.session_state["ocultar_sidebar_prev"] = st.session_state.get("ocultar_sidebar", False)
+                st.session_state["ocultar_sidebar"] = True
+                st.session_state["relatorio_em_tela"] = alvo["id"]
+                registrar_acesso(usuario["id"], alvo["id"])
+                aberturas = st.session_state.setdefault("aberturas", {})
+                aberturas[alvo["id"]] = aberturas.get(alvo["id"], 0) + 1
+                st.rerun()
+            elif is_admin or alvo["criado_por"] == usuario["id"]:
+                if acao == "editar":
+                    st.session_state["editar_relatorio"] = alvo["id"]
+                    st.session_state["menu_destino"] = MENU_NOVO_RELATORIO
+                    st.rerun()
+                elif acao == "excluir":
+                    if excluir_relatorio(alvo["id"]):
+                        st.success("Relatorio excluido.")
+                        rerun_fragmento()
 
-    st.markdown('<h1 class="portal-title">Portal Power BI</h1>', unsafe_allow_html=True)
 
-    st.markdown("---")
-    col1, col2, col3 = st.columns([1, 2, 1])
+@st.fragment
+@perfilado("form_usuario")
+def render_form_usuario():
+    modo_edicao = "editar_usuario_id" in st.session_state
+    user_data = None
+    if modo_edicao:
+        # Busca direta por id (uma linha), sem varrer a lista de usuarios.
+        user_data = cached_obter_usuario(st.session_state["editar_usuario_id"])
+        if user_data is None:
+            st.warning("Usuário não encontrado (pode ter sido removido).")
+            del st.session_state["editar_usuario_id"]
+            st.rerun()
+
+    # Chave estavel por usuario (ou por sessao de criacao): garante que ao trocar
+    # de usuario os campos recarreguem os valores certos, sem estado preso.
+    if modo_edicao:
+        fid = f"edit{user_data['id']}"
+        st.subheader(f":material/edit: Editando usuário: {user_data['username']}")
+    else:
+        fid = f"novo{st.session_state.get('novo_user_nonce', 0)}"
+        st.subheader(":material/person_add: Criar novo usuário")
+
+    st.markdown("**Dados de acesso**")
+    novo_username = st.text_input(
+        "Nome de usuário *",
+        value=(user_data["username"] if modo_edicao else ""),
+        key=f"u_username_{fid}",
+    )
+    if modo_edicao:
+        alterar_senha = st.checkbox("Alterar senha?", key=f"u_chsenha_{fid}")
+    else:
+        alterar_senha = True
+    if alterar_senha:
+        c_s1, c_s2 = st.columns(2)
+        nova_senha = c_s1.text_input("Senha *", type="password", key=f"u_senha_{fid}")
+        confirmar_senha = c_s2.text_input("Confirmar senha *", type="password", key=f"u_csenha_{fid}")
+    else:
+        nova_senha = ""
+        confirmar_senha = ""
+
+    st.markdown("**Perfil e hierarquia**")
+    col_perfil, col_nivel = st.columns(2)
+    with col_perfil:
+        perfil = st.radio(
+            "Perfil",
+            ["Usuário comum", "Administrador"],
+            index=1 if (modo_edicao and user_data["is_admin"]) else 0,
+            key=f"u_perfil_{fid}",
+            help="Administrador enxerga todos os relatórios e gerencia usuários.",
+        )
+        user_is_admin = perfil == "Administrador"
+    with col_nivel:
+        if user_is_admin:
+            st.radio("Nível hierárquico", ["Gestão"], index=0, disabled=True, key=f"u_niveladm_{fid}")
+            nivel_sel = "gestao"
+        else:
+            nivel_atual = user_data["nivel_hierarquia"] if modo_edicao else "operacao"
+            nivel_idx = (
+                NIVEIS_HIERARQUIA.index(nivel_atual)
+                if nivel_atual in NIVEIS_HIERARQUIA
+                else NIVEIS_HIERARQUIA.index("operacao")
+            )
+            nivel_sel = st.radio(
+                "Nível hierárquico",
+                NIVEIS_HIERARQUIA,
+                index=nivel_idx,
+                format_func=lambda n: NIVEL_LABELS[n],
+                key=f"u_nivel_{fid}",
+                help="Gestão vê relatórios de gestão e de operação; Operação vê só os de operação.",
+            )
+
+    grupos_sel = None
+    if user_is_admin:
+        st.info("Administrador enxerga todos os relatórios — áreas, liberação individual e "
+                "grupos não se aplicam.")
+        areas_final = list(CATEGORIAS_PADRAO)
+        indiv_sel = []
+    else:
+        st.markdown("**Filtro primário — áreas de atuação**")
+        areas_default = [
+            a for a in (user_data["categorias_permitidas"] if modo_edicao else ["GERAL"])
+            if a in CATEGORIAS_PADRAO
+        ]
+        areas_sel = st.multiselect(
+            "Áreas que o usuário pode acessar",
+            CATEGORIAS_PADRAO,
+            default=areas_default,
+            key=f"u_areas_{fid}",
+            help="O usuário só enxerga relatórios destas áreas.",
+        )
+        areas_final = areas_sel if areas_sel else ["GERAL"]
+
+        st.markdown("**Filtro secundário — liberação individual**")
+        indiv_sel = seletor_relatorios(
+            f"u_indiv_{fid}",
+            user_data["relatorios_permitidos"] if modo_edicao else [],
+            areas_final, nivel_sel,
+            "Relatórios liberados individualmente",
+            rotulo_busca="Buscar relatório para liberar",
+            ajuda=("Deixe VAZIO para liberar todos os relatórios das áreas. Se marcar relatórios, "
+                   "o usuário verá APENAS esses (sempre dentro das áreas e do nível permitidos)."),
+        )
+
+        grupos_todos = cached_listar_grupos()
+        if grupos_todos:
+            st.markdown("**Grupos de acesso**")
+            nomes_grupos = {g["id"]: g["nome"] for g in grupos_todos}
+            grupos_sel = st.multiselect(
+                "Grupos do usuário",
+                list(nomes_grupos),
+                default=[g for g in sorted(user_data["grupos"] if modo_edicao else []) if g in nomes_grupos],
+                format_func=lambda g: nomes_grupos.get(g, f"#{g}"),
+                key=f"u_grupos_{fid}",
+                help=("Somam-se às permissões acima: o usuário vê também o que cada grupo "
+                      "libera (áreas, nível e liberação individual do grupo)."),
+            )
+
+    st.markdown("")
+    col_salvar, col_cancelar = st.columns(2)
+    salvar = col_salvar.button(
+        "Salvar alterações" if modo_edicao else "Criar usuário",
+        icon=":material/save:", type="primary", use_container_width=True, key=f"u_salvar_{fid}",
+    )
+    cancelar = False
+    if modo_edicao:
+        cancelar = col_cancelar.button(
+            "Cancelar", icon=":material/close:", type="secondary",
+            use_container_width=True, key=f"u_cancelar_{fid}",
+        )
+
+    if cancelar:
+        del st.session_state["editar_usuario_id"]
+        rerun_fragmento()
+
+    if salvar:
+        checar_senha = (not modo_edicao) or alterar_senha
+        erro = None
+        if not novo_username:
+            erro = "Informe o nome de usuário."
+        elif checar_senha:
+            if not nova_senha or not confirmar_senha:
+                erro = "Preencha e confirme a senha."
+            elif nova_senha != confirmar_senha:
+                erro = "As senhas não coincidem."
+            elif len(nova_senha) < 6:
+                erro = "A senha deve ter pelo menos 6 caracteres."
+
+        if erro:
+            st.error(erro)
+        elif modo_edicao:
+            ok = atualizar_usuario(
+                user_data["id"], username=novo_username, is_admin=user_is_admin,
+                nivel_hierarquia=nivel_sel, categorias_permitidas=areas_final,
+                relatorios_permitidos=indiv_sel,
+            )
+            if ok:
+                if alterar_senha:
+                    atualizar_senha(user_data["id"], nova_senha)
+                if grupos_sel is not None:
+                    definir_grupos_usuario(user_data["id"], grupos_sel, user_data["grupos"])
+                st.success("Usuário atualizado com sucesso.")
+                del st.session_state["editar_usuario_id"]
+                st.rerun()
+        else:
+            criado = criar_usuario(novo_username, nova_senha, user_is_admin, nivel_sel, areas_final,
+                                   indiv_sel)
+            if criado:
+                if grupos_sel and isinstance(criado, Usuario):
+                    definir_grupos_usuario(criado["id"], grupos_sel)
+                st.success(f"Usuário {novo_username} criado com sucesso.")
+                st.session_state["novo_user_nonce"] = st.session_state.get("novo_user_nonce", 0) + 1
+                st.rerun()
+
+
+@st.fragment
+@perfilado("lista_usuarios")
+def render_lista_usuarios():
+    st.markdown("##### Usuários cadastrados")
+    f_busca, f_perfil, f_nivel, f_area = st.columns([2, 1, 1, 1])
+    busca_u = f_busca.text_input("Buscar usuário", placeholder="Início do nome de usuário...",
+                                 key="u_lista_busca")
+    perfil_f = f_perfil.selectbox("Perfil", ["Todos", "Administrador", "Usuário comum"],
+                                  key="u_lista_perfil")
+    nivel_f = f_nivel.selectbox("Nível", ["Todos"] + NIVEIS_HIERARQUIA,
+                                format_func=lambda n: NIVEL_LABELS.get(n, n), key="u_lista_nivel")
+    area_f = f_area.selectbox("Área", ["Todas"] + CATEGORIAS_PADRAO, key="u_lista_area")
+    filtros_u = {
+        "busca": busca_u.strip(),
+        "is_admin": None if perfil_f == "Todos" else perfil_f == "Administrador",
+        "nivel": None if nivel_f == "Todos" else nivel_f,
+        "area": None if area_f == "Todas" else area_f,
+    }
+    # Filtro novo volta para a primeira pagina.
+    if st.session_state.get("u_lista_filtros") != filtros_u:
+        st.session_state["u_lista_filtros"] = filtros_u
+        st.session_state["u_lista_pagina"] = 1
+    pagina_u = st.session_state.get("u_lista_pagina", 1)
+
+    usuarios_db, total_u = cached_listar_usuarios(pagina=pagina_u, **filtros_u)
+    total_paginas = max(1, -(-total_u // USUARIOS_POR_PAGINA))
+    if pagina_u > total_paginas:
+        st.session_state["u_lista_pagina"] = total_paginas
+        rerun_fragmento()
+
+    if not usuarios_db:
+        st.info("Nenhum usuário encontrado." if total_u == 0 and any(filtros_u.values())
+                else "Nenhum usuário cadastrado.")
+    else:
+        for user in usuarios_db:
+            with st.container(border=True):
+                c1, c2, c3 = st.columns([3, 1, 1])
+                with c1:
+                    linhas = [
+                        f"Usuário: {user['username']}",
+                        f"Tipo: {'Administrador' if user['is_admin'] else 'Usuário comum'}",
+                    ]
+                    if not user["is_admin"]:
+                        linhas.append(f"Nível: {NIVEL_LABELS.get(user.get('nivel_hierarquia'), 'Operação')}")
+                        linhas.append(f"Áreas: {', '.join(user['categorias_permitidas'][:6])}"
+                                      + (f" … (+{len(user['categorias_permitidas']) - 6})"
+                                         if len(user["categorias_permitidas"]) > 6 else ""))
+                        qtd_indiv = len(user.get("relatorios_permitidos") or [])
+                        if qtd_indiv:
+                            linhas.append(f"Liberação individual: {qtd_indiv} relatório(s) — vê apenas esses")
+                        if user.get("grupos"):
+                            nomes_grupos = {g["id"]: g["nome"] for g in cached_listar_grupos()}
+                            linhas.append("Grupos: " + ", ".join(
+                                nomes_grupos.get(g, f"#{g}") for g in sorted(user["grupos"])
+                            ))
+                    linhas.append(f"Criado em: {user.criado_em_fmt}")
+                    st.markdown("<br>".join(escape(l) for l in linhas), unsafe_allow_html=True)
+                with c2:
+                    if st.button("Editar", icon=":material/edit:", key=f"edit_{user['id']}", type="secondary"):
+                        # O formulario e outro fragmento: precisa do rerun completo.
+                        st.session_state["editar_usuario_id"] = user["id"]
+                        st.rerun()
+                with c3:
+                    if user["username"] != "admin":
+                        if st.button("Excluir", icon=":material/delete:", key=f"delete_{user['id']}", type="secondary"):
+                            if excluir_usuario(user["id"]):
+                                st.success(f"Usuário {user['username']} excluído.")
+                                if st.session_state.get("editar_usuario_id") == user["id"]:
+                                    del st.session_state["editar_usuario_id"]
+                                    st.rerun()
+                                rerun_fragmento()
+
+    p_ant, p_info, p_prox = st.columns([1, 2, 1])
+    if p_ant.button("Anterior", icon=":material/chevron_left:", key="u_lista_ant",
+                    disabled=pagina_u <= 1, use_container_width=True):
+        st.session_state["u_lista_pagina"] = pagina_u - 1
+        rerun_fragmento()
+    p_info.markdown(
+        f"<div style='text-align:center;color:#5B6B60;padding-top:.45rem'>"
+        f"Página {pagina_u} de {total_paginas} · {total_u} usuário(s)</div>",
+        unsafe_allow_html=True,
+    )
+    if p_prox.button("Próxima", icon=":material/chevron_right:", key="u_lista_prox",
+                     disabled=pagina_u >= total_paginas, use_container_width=True):
+        st.session_state["u_lista_pagina"] = pagina_u + 1
+        rerun_fragmento()
+
+    st.markdown("---")
+    st.markdown("##### Alteração em massa")
+    if filtros_u["is_admin"]:
+        st.info("Administradores enxergam tudo: a alteração em massa vale só para usuários comuns.")
+    else:
+        # Mesmos filtros da lista acima, mas sobre todas as paginas.
+        filtro_massa = {k: filtros_u[k] for k in ("busca", "nivel", "area")}
+        st.caption(
+            "Vale para todos os usuários comuns que casam com os filtros da lista acima "
+            "(não só esta página), em uma única gravação no banco."
+        )
+        c_acao, c_valor = st.columns([1, 2])
+        acao_m = c_acao.selectbox("Operação", list(ROTULOS_ACOES_EM_MASSA),
+                                  format_func=ROTULOS_ACOES_EM_MASSA.get, key="m_acao")
+        with c_valor:
+            if acao_m.endswith("_areas"):
+                valor_m = st.multiselect("Áreas", CATEGORIAS_PADRAO, key="m_areas")
+            elif acao_m == "definir_nivel":
+                valor_m = st.radio("Nível hierárquico", NIVEIS_HIERARQUIA, horizontal=True,
+                                   format_func=lambda n: NIVEL_LABELS[n], key="m_nivel")
+            else:
+                valor_m = seletor_relatorios("m_rel", [], CATEGORIAS_PADRAO, "gestao", "Relatórios")
+
+        # A previa so vale para a mesma operacao, valor e filtros.
+        pedido_m = (acao_m, repr(valor_m), repr(sorted(filtro_massa.items())))
+        c_prev, c_apl = st.columns(2)
+        if c_prev.button("Pré-visualizar", icon=":material/preview:", key="m_previa_btn",
+                         disabled=not valor_m, use_container_width=True):
+            afetados_m = alterar_permissoes_em_massa(acao_m, valor_m, filtro_massa, simular=True)
+            if afetados_m is not None:
+                st.session_state["m_previa"] = (pedido_m, afetados_m)
+        previa_m = st.session_state.get("m_previa")
+        if previa_m is not None and previa_m[0] != pedido_m:
+            previa_m = None
+
+        if previa_m is not None:
+            afetados_m = previa_m[1]
+            if not afetados_m:
+                st.info("Nenhum usuário seria alterado (todos já estão assim).")
+            else:
+                st.markdown(f"**{len(afetados_m)} usuário(s) serão alterados.**")
+                if acao_m == "revogar_relatorios":
+                    sem_lista = sum(1 for u in afetados_m if not u["relatorios_permitidos"])
+                    if sem_lista:
+                        st.warning(f"{sem_lista} usuário(s) ficam sem liberação individual e passam a "
+                                   "ver TODOS os relatórios das suas áreas.")
+                elif acao_m == "remover_areas":
+                    sem_area = sum(1 for u in afetados_m if not u["categorias_permitidas"])
+                    if sem_area:
+                        st.warning(f"{sem_area} usuário(s) ficam sem nenhuma área e não verão relatórios.")
+                elif acao_m == "liberar_relatorios":
+                    st.caption("Quem não tem liberação individual já vê todos os relatórios das "
+                               "suas áreas e não é alterado.")
+                amostra = afetados_m[:PREVIA_EM_MASSA_MAX]
+                atuais = {
+                    u["id"]: u
+                    for u in cache_usuarios().obter_varios([u["id"] for u in amostra],
+                                                           db.obter_usuarios_por_ids)
+                }
+                st.dataframe(
+                    [
+                        {
+                            "Usuário": u["username"],
+                            "Antes": _resumo_permissao(atuais[u["id"]], acao_m) if u["id"] in atuais else "",
+                            "Depois": _resumo_permissao(u, acao_m),
+                        }
+                        for u in amostra
+                    ],
+                    hide_index=True, use_container_width=True,
+                )
+                if len(afetados_m) > len(amostra):
+                    st.caption(f"Mostrando {len(amostra)} de {len(afetados_m)}.")
+
+        total_m = len(previa_m[1]) if previa_m is not None else 0
+        if c_apl.button(f"Aplicar a {total_m} usuário(s)" if total_m else "Aplicar",
+                        icon=":material/done_all:", type="primary", key="m_aplicar",
+                        disabled=not total_m, use_container_width=True,
+                        help="Pré-visualize antes: o botão só libera com a prévia da operação atual."):
+            alterados_m = alterar_permissoes_em_massa(acao_m, valor_m, filtro_massa)
+            if alterados_m is not None:
+                del st.session_state["m_previa"]
+                st.session_state.pop("m_rel_ids", None)
+                st.success(f"{len(alterados_m)} usuário(s) atualizado(s).")
+                rerun_fragmento()
+
+
+def render_perfil_reruns(usuario):
+    st.subheader(":material/speed: Perfil de reruns")
+    st.caption(
+        "Mede onde vai o tempo dos próximos reruns de uma sessão: seções da página, "
+        "chamadas ao banco, amostras da pilha e crescimento do session_state. "
+        "Só aparecem as sessões atendidas por esta réplica."
+    )
+    perf = perfilador()
+    sessoes = perf.sessoes()
+    rotulos = {
+        s["sessao_id"]: f"{s['username']} · sessão {s['sessao_id'][:8]} · "
+                        f"último rerun às {datetime.fromtimestamp(s['visto_em']):%H:%M:%S}"
+        for s in sessoes
+    }
+    c_sessao, c_qtd, c_armar = st.columns([3, 1, 1], vertical_alignment="bottom")
+    alvo = c_sessao.selectbox("Sessão", list(rotulos), format_func=rotulos.get, key="perf_sessao")
+    qtd = c_qtd.number_input("Reruns", min_value=1, max_value=MAX_RERUNS, value=5, key="perf_reruns")
+    if c_armar.button("Perfilar", icon=":material/play_arrow:", type="primary", key="perf_armar",
+                      disabled=alvo is None, use_container_width=True):
+        perf.armar(alvo, qtd, por=usuario["username"])
+        st.rerun()
+    for s in sessoes:
+        if s["restantes"]:
+            c_aviso, c_cancelar = st.columns([4, 1], vertical_alignment="center")
+            c_aviso.info(f"Aguardando {s['restantes']} rerun(s) de {s['username']} "
+                         f"(sessão {s['sessao_id'][:8]}).")
+            if c_cancelar.button("Cancelar", key=f"perf_cancelar_{s['sessao_id']}",
+                                 use_container_width=True):
+                perf.cancelar(s["sessao_id"])
+                st.rerun()
+
+    capturas = perf.capturas()
+    if not capturas:
+        st.caption("Nenhum rerun perfilado ainda.")
+        return
+    st.markdown("##### Reruns perfilados")
+    linhas = []
+    totais = {}
+    for c in reversed(capturas):
+        secoes = c.secoes_ms()
+        for nome, (ms, chamadas) in secoes.items():
+            total = totais.setdefault(nome, [0.0, 0])
+            total[0] += ms
+            total[1] += chamadas
+        banco = [v for nome, v in secoes.items() if nome.startswith("db.")]
+        crescimento, chaves = c.crescimento_estado()
+        linhas.append({
+            "Início": f"{datetime.fromtimestamp(c.inicio_em):%H:%M:%S}",
+            "Usuário": c.username,
+            "Sessão": c.sessao_id[:8],
+            "Origem": c.origem,
+            "Tempo (ms)": round(c.duracao_ms),
+            "Banco (ms)": round(sum(ms for ms, _n in banco)),
+            "Chamadas ao banco": sum(n for _ms, n in banco),
+            "session_state (KB)": round(sum(c.estado_depois.values()) / 1024, 1),
+            "Crescimento (KB)": round(crescimento / 1024, 1),
+            "Chaves que mais cresceram": ", ".join(f"{k} (+{b / 1024:.1f} KB)" for k, b in chaves),
+        })
+    st.dataframe(linhas, hide_index=True, use_container_width=True)
+
+    st.markdown("##### Tempo por seção (todos os reruns acima)")
+    st.dataframe(
+        sorted(
+            (
+                {"Seção": nome, "Total (ms)": round(ms, 1), "Vezes": n,
+                 "Média (ms)": round(ms / n, 1)}
+                for nome, (ms, n) in totais.items()
+            ),
+            key=lambda linha: -linha["Total (ms)"],
+        ),
+        hide_index=True, use_container_width=True,
+    )
+    c_baixar, c_descartar = st.columns(2)
+    c_baixar.download_button(
+        "Baixar flame graph (speedscope)", data=functools.partial(para_speedscope, capturas),
+        file_name=f"perfil_reruns_{datetime.now():%Y%m%d_%H%M%S}.speedscope.json",
+        mime="application/json", icon=":material/download:", key="perf_baixar",
+        use_container_width=True,
+    )
+    if c_descartar.button("Descartar capturas", icon=":material/delete:", key="perf_descartar",
+                          use_container_width=True):
+        perf.descartar()
+        st.rerun()
+    st.caption("Abra o arquivo em speedscope.app: cada rerun tem um perfil de seções "
+               "(tema, sidebar, menu, chamadas ao banco) e um de amostras da pilha.")
+
+
+# Perfil sob demanda: sem armacao pelo admin, so registra a sessao.
+perfil = perfilador().iniciar_rerun(st.session_state.get("usuario"))
+
+with perfil.secao("tema"):
+    apply_professional_theme()
+    if "ocultar_sidebar" not in st.session_state:
+        st.session_state["ocultar_sidebar"] = False
+    apply_sidebar_visibility()
+
+if "usuario" not in st.session_state:
+    st.session_state.usuario = None
+
+if not st.session_state.usuario:
+    if os.path.exists("logo_janelas_1.png"):
+        logo_path = "logo_janelas_1.png"
+    else:
+        logo_path = "logo.png"
+    render_logo_centered(logo_path, 430, top_margin=52)
+
+    st.markdown('<h1 class="portal-title">Portal Power BI</h1>', unsafe_allow_html=True)
+
+    st.markdown("---")
+    col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
         with st.form("login_form", border=False):
             st.subheader(":material/lock: Acesso ao sistema")
@@ -638,7 +1744,7 @@ if not st.session_state.usuario:
 usuario = st.session_state.usuario
 is_admin = usuario["is_admin"]
 
-with st.sidebar:
+with st.sidebar, perfil.secao("sidebar"):
     sidebar_logo = "logo_sidebar.png" if os.path.exists("logo_sidebar.png") else "logo.png"
     render_logo(0, sidebar_logo, use_container_width=True)
     st.markdown('<h2 class="sidebar-brand">Grupo FRT</h2>', unsafe_allow_html=True)
@@ -677,6 +1783,8 @@ with st.sidebar:
     ]
     if is_admin:
         _nav.append((MENU_GERENCIAR_USUARIOS, ":material/group:", "Usuários"))
+        _nav.append((MENU_GRUPOS, ":material/groups:", "Grupos de acesso"))
+        _nav.append((MENU_USO, ":material/insights:", "Uso dos relatórios"))
     _nav.append((MENU_MINHA_CONTA, ":material/manage_accounts:", "Minha conta"))
 
     for _valor, _icone, _rotulo in _nav:
@@ -691,135 +1799,38 @@ with st.sidebar:
     st.markdown("---")
     if st.button("Sair", icon=":material/logout:", use_container_width=True, type="secondary"):
         st.session_state.usuario = None
+        st.session_state.pop("pool_iframes", None)
         st.rerun()
 
 # Em modo tela cheia (relatorio aberto) nao mostra cabecalho nem divisoria,
 # para o relatorio ocupar a tela inteira.
-_em_tela = menu == MENU_DASHBOARD and st.session_state.get("relatorio_em_tela")
-if _em_tela:
-    pass
-elif menu == MENU_DASHBOARD:
-    render_page_header("Dashboard de Relatórios")
-elif menu == MENU_NOVO_RELATORIO:
-    if "editar_relatorio" in st.session_state:
-        render_page_header("Editar relatório")
+if render_visualizador(usuario, menu):
+    st.stop()
+
+with perfil.secao("cabecalho"):
+    if menu == MENU_DASHBOARD:
+        render_page_header("Dashboard de Relatórios")
+    elif menu == MENU_NOVO_RELATORIO:
+        if "editar_relatorio" in st.session_state:
+            render_page_header("Editar relatório")
+        else:
+            render_page_header("Adicionar novo relatório")
+    elif menu == MENU_GERENCIAR_USUARIOS:
+        render_page_header("Gerenciamento de usuários")
+    elif menu == MENU_GRUPOS:
+        render_page_header("Grupos de acesso")
+    elif menu == MENU_USO:
+        render_page_header("Uso dos relatórios")
     else:
-        render_page_header("Adicionar novo relatório")
-elif menu == MENU_GERENCIAR_USUARIOS:
-    render_page_header("Gerenciamento de usuários")
-else:
-    render_page_header("Minha conta")
+        render_page_header("Minha conta")
 
-if not _em_tela:
     st.markdown("---")
 
+# O ramo do menu fica aberto ate o fim do rerun (ou st.stop/st.rerun).
+perfil.abrir(f"menu:{menu}")
 
 if menu == MENU_DASHBOARD:
-    relatorios = listar_relatorios(usuario)
-    if st.session_state.get("relatorio_em_tela"):
-        relatorio_tela = obter_relatorio_por_id(st.session_state["relatorio_em_tela"], usuario)
-        if relatorio_tela is None:
-            st.error("Relatorio nao encontrado ou voce nao tem permissao para acessa-lo.")
-            del st.session_state["relatorio_em_tela"]
-        else:
-            render_powerbi_fullscreen(relatorio_tela)
-            st.stop()
-
-    if not relatorios:
-        st.info("Nenhum relatorio disponivel nas suas categorias.")
-    else:
-        col1, col2 = st.columns(2)
-        with col1:
-            categorias_disponiveis = sorted(list({r["categoria"] for r in relatorios}))
-            filtro_cat = st.selectbox("Filtrar por categoria", ["Todas"] + categorias_disponiveis)
-        with col2:
-            buscar = st.text_input("Buscar relatorio", placeholder="Digite titulo ou descricao...")
-
-        relatorios_filtrados = relatorios
-        if filtro_cat != "Todas":
-            relatorios_filtrados = [r for r in relatorios_filtrados if r["categoria"] == filtro_cat]
-        if buscar:
-            termo = buscar.lower()
-            relatorios_filtrados = [
-                r
-                for r in relatorios_filtrados
-                if termo in r["titulo"].lower() or (r["descricao"] and termo in r["descricao"].lower())
-            ]
-
-        st.markdown(
-            "<div style='font-family:Poppins,Inter,sans-serif;font-weight:600;"
-            "font-size:1.15rem;color:#14401E;margin:.2rem 0 .9rem'>"
-            f"Relatórios disponíveis <span style='color:#5B6B60;font-weight:500'>"
-            f"({len(relatorios_filtrados)})</span></div>",
-            unsafe_allow_html=True,
-        )
-        if not relatorios_filtrados:
-            st.info("Nenhum relatorio encontrado para o filtro/busca selecionados.")
-
-        NCOLS = 3
-        for inicio in range(0, len(relatorios_filtrados), NCOLS):
-            linha = relatorios_filtrados[inicio:inicio + NCOLS]
-            for col, relatorio in zip(st.columns(NCOLS), linha):
-                with col:
-                    with st.container(border=True):
-                        desc = relatorio["descricao"] or "Sem descrição"
-                        desc_short = (desc[:110] + "…") if len(desc) > 110 else desc
-                        _nivel = relatorio.get("nivel_hierarquia", "operacao")
-                        _is_gestao = _nivel == "gestao"
-                        _nivel_bg = "#14401E" if _is_gestao else "#EAF0EE"
-                        _nivel_fg = "#FFFFFF" if _is_gestao else "#5B6B60"
-                        st.markdown(
-                            "<span style='display:inline-block;background:#E6F0E2;"
-                            "color:#14401E;font-size:.7rem;font-weight:700;letter-spacing:.04em;"
-                            "text-transform:uppercase;padding:3px 10px;border-radius:999px'>"
-                            f"{escape(relatorio['categoria'])}</span>"
-                            f"<span style='display:inline-block;margin-left:.35rem;background:{_nivel_bg};"
-                            f"color:{_nivel_fg};font-size:.7rem;font-weight:700;letter-spacing:.04em;"
-                            "text-transform:uppercase;padding:3px 10px;border-radius:999px'>"
-                            f"{escape(NIVEL_LABELS.get(_nivel, 'Operação'))}</span>"
-                            "<div style='font-family:Poppins,Inter,sans-serif;font-weight:700;"
-                            "font-size:1.02rem;color:#14401E;margin:.45rem 0 .2rem;line-height:1.25;"
-                            "height:2.5em;overflow:hidden;display:-webkit-box;-webkit-line-clamp:2;"
-                            "-webkit-box-orient:vertical'>"
-                            f"{escape(relatorio['titulo'])}</div>"
-                            "<div style='color:#5B6B60;font-size:.85rem;line-height:1.35;"
-                            "height:2.7em;margin-bottom:.35rem;overflow:hidden;display:-webkit-box;"
-                            "-webkit-line-clamp:2;-webkit-box-orient:vertical'>"
-                            f"{escape(desc_short)}</div>"
-                            "<div style='color:#93A096;font-size:.72rem;margin-bottom:.7rem;"
-                            "display:flex;align-items:center;gap:.3rem'>"
-                            "<span class='material-symbols-outlined' style='font-size:15px'>person</span>"
-                            f"{escape(relatorio['criador'] or 'Sistema')}"
-                            "<span style='margin:0 .25rem'>·</span>"
-                            "<span class='material-symbols-outlined' style='font-size:15px'>event</span>"
-                            f"{fmt_data(relatorio['criado_em'])}</div>",
-                            unsafe_allow_html=True,
-                        )
-                        if st.button("Abrir", icon=":material/open_in_full:",
-                                     key=f"open_{relatorio['id']}",
-                                     use_container_width=True, type="primary"):
-                            if "ocultar_sidebar_prev" not in st.session_state:
-                                st.session_state["ocultar_sidebar_prev"] = st.session_state.get("ocultar_sidebar", False)
-                            st.session_state["ocultar_sidebar"] = True
-                            st.session_state["relatorio_em_tela"] = relatorio["id"]
-                            st.rerun()
-
-                        if is_admin or relatorio["criado_por"] == usuario["id"]:
-                            ce, cd = st.columns(2)
-                            with ce:
-                                if st.button("Editar", icon=":material/edit:",
-                                             key=f"edit_{relatorio['id']}",
-                                             use_container_width=True):
-                                    st.session_state["editar_relatorio"] = relatorio["id"]
-                                    st.session_state["menu_destino"] = MENU_NOVO_RELATORIO
-                                    st.rerun()
-                            with cd:
-                                if st.button("Excluir", icon=":material/delete:",
-                                             key=f"del_{relatorio['id']}",
-                                             use_container_width=True):
-                                    if excluir_relatorio(relatorio["id"]):
-                                        st.success("Relatorio excluido.")
-                                        st.rerun()
+    render_grade_dashboard(usuario)
 
 elif menu == MENU_NOVO_RELATORIO:
     if "editar_relatorio" in st.session_state:
@@ -910,197 +1921,249 @@ elif menu == MENU_GERENCIAR_USUARIOS:
         st.error("Acesso restrito. Apenas administradores podem gerenciar usuarios.")
         st.stop()
 
-    usuarios_db = cached_listar_usuarios()
-    modo_edicao = "editar_usuario_id" in st.session_state
-    user_data = None
-    if modo_edicao:
-        user_data = next(
-            (u for u in usuarios_db if u["id"] == st.session_state["editar_usuario_id"]), None
-        )
-        if user_data is None:
-            st.warning("Usuário não encontrado (pode ter sido removido).")
-            del st.session_state["editar_usuario_id"]
+    render_form_usuario()
+    st.markdown("---")
+    render_lista_usuarios()
+
+elif menu == MENU_GRUPOS:
+    if not is_admin:
+        st.error("Acesso restrito. Apenas administradores gerenciam grupos de acesso.")
+        st.stop()
+
+    grupos = cached_listar_grupos()
+    grupo_edit = None
+    if "editar_grupo_id" in st.session_state:
+        grupo_edit = next((g for g in grupos if g["id"] == st.session_state["editar_grupo_id"]), None)
+        if grupo_edit is None:
+            st.warning("Grupo não encontrado (pode ter sido removido).")
+            del st.session_state["editar_grupo_id"]
             st.rerun()
 
-    # Chave estavel por usuario (ou por sessao de criacao): garante que ao trocar
-    # de usuario os campos recarreguem os valores certos, sem estado preso.
-    if modo_edicao:
-        fid = f"edit{user_data['id']}"
-        st.subheader(f":material/edit: Editando usuário: {user_data['username']}")
+    if grupo_edit is not None:
+        gid = f"edit{grupo_edit['id']}"
+        st.subheader(f":material/edit: Editando grupo: {grupo_edit['nome']}")
     else:
-        fid = f"novo{st.session_state.get('novo_user_nonce', 0)}"
-        st.subheader(":material/person_add: Criar novo usuário")
+        gid = f"novo{st.session_state.get('novo_grupo_nonce', 0)}"
+        st.subheader(":material/group_add: Criar novo grupo")
+    st.caption(
+        "Cada membro vê, além do que as próprias permissões liberam, o que o grupo libera: "
+        "relatórios das áreas do grupo compatíveis com o nível do grupo (ou só os "
+        "relatórios marcados abaixo, se houver)."
+    )
 
-    st.markdown("**Dados de acesso**")
-    novo_username = st.text_input(
-        "Nome de usuário *",
-        value=(user_data["username"] if modo_edicao else ""),
-        key=f"u_username_{fid}",
+    c_nome, c_nivel_g = st.columns([2, 1])
+    nome_g = c_nome.text_input("Nome do grupo *", value=grupo_edit["nome"] if grupo_edit else "",
+                               key=f"g_nome_{gid}")
+    nivel_atual_g = grupo_edit["nivel_hierarquia"] if grupo_edit else "operacao"
+    nivel_g = c_nivel_g.radio(
+        "Nível hierárquico", NIVEIS_HIERARQUIA, index=NIVEIS_HIERARQUIA.index(nivel_atual_g),
+        format_func=lambda n: NIVEL_LABELS[n], horizontal=True, key=f"g_nivel_{gid}",
+    )
+    descricao_g = st.text_input("Descrição", value=grupo_edit["descricao"] if grupo_edit else "",
+                                key=f"g_descricao_{gid}")
+    areas_g = st.multiselect(
+        "Áreas liberadas pelo grupo", CATEGORIAS_PADRAO,
+        default=[a for a in (grupo_edit["categorias_permitidas"] if grupo_edit else [])
+                 if a in CATEGORIAS_PADRAO],
+        key=f"g_areas_{gid}",
+    )
+    rels_g = seletor_relatorios(
+        f"g_rels_{gid}",
+        grupo_edit["relatorios_permitidos"] if grupo_edit else [],
+        areas_g, nivel_g,
+        "Relatórios liberados pelo grupo",
+        ajuda=("Deixe VAZIO para liberar todos os relatórios das áreas do grupo. Se marcar "
+               "relatórios, o grupo libera APENAS esses."),
     )
-    if modo_edicao:
-        alterar_senha = st.checkbox("Alterar senha?", key=f"u_chsenha_{fid}")
-    else:
-        alterar_senha = True
-    if alterar_senha:
-        c_s1, c_s2 = st.columns(2)
-        nova_senha = c_s1.text_input("Senha *", type="password", key=f"u_senha_{fid}")
-        confirmar_senha = c_s2.text_input("Confirmar senha *", type="password", key=f"u_csenha_{fid}")
-    else:
-        nova_senha = ""
-        confirmar_senha = ""
 
-    st.markdown("**Perfil e hierarquia**")
-    col_perfil, col_nivel = st.columns(2)
-    with col_perfil:
-        perfil = st.radio(
-            "Perfil",
-            ["Usuário comum", "Administrador"],
-            index=1 if (modo_edicao and user_data["is_admin"]) else 0,
-            key=f"u_perfil_{fid}",
-            help="Administrador enxerga todos os relatórios e gerencia usuários.",
-        )
-        user_is_admin = perfil == "Administrador"
-    with col_nivel:
-        if user_is_admin:
-            st.radio("Nível hierárquico", ["Gestão"], index=0, disabled=True, key=f"u_niveladm_{fid}")
-            nivel_sel = "gestao"
+    c_salvar_g, c_cancelar_g = st.columns(2)
+    salvar_g = c_salvar_g.button(
+        "Salvar alterações" if grupo_edit else "Criar grupo",
+        icon=":material/save:", type="primary", use_container_width=True, key=f"g_salvar_{gid}",
+    )
+    if grupo_edit is not None and c_cancelar_g.button(
+        "Cancelar", icon=":material/close:", type="secondary", use_container_width=True,
+        key=f"g_cancelar_{gid}",
+    ):
+        del st.session_state["editar_grupo_id"]
+        st.rerun()
+
+    if salvar_g:
+        if not nome_g.strip():
+            st.error("Informe o nome do grupo.")
+        elif not areas_g:
+            st.error("Escolha ao menos uma área.")
+        elif grupo_edit is not None:
+            if atualizar_grupo(grupo_edit["id"], nome_g, descricao_g, nivel_g, areas_g, rels_g):
+                st.success("Grupo atualizado; as permissões dos membros já foram recalculadas.")
+                del st.session_state["editar_grupo_id"]
+                st.rerun()
+        elif criar_grupo(nome_g, descricao_g, nivel_g, areas_g, rels_g):
+            st.success(f"Grupo {nome_g.strip()} criado. Adicione membros em Usuários.")
+            st.session_state["novo_grupo_nonce"] = st.session_state.get("novo_grupo_nonce", 0) + 1
+            st.rerun()
+
+    st.markdown("---")
+    st.markdown("##### Grupos cadastrados")
+    if not grupos:
+        st.info("Nenhum grupo cadastrado.")
+    for grupo in grupos:
+        with st.container(border=True):
+            c1, c2, c3 = st.columns([3, 1, 1])
+            with c1:
+                linhas = [f"Grupo: {grupo['nome']}"]
+                if grupo["descricao"]:
+                    linhas.append(grupo["descricao"])
+                linhas.append(f"Nível: {NIVEL_LABELS.get(grupo['nivel_hierarquia'], 'Operação')}")
+                linhas.append("Áreas: " + (", ".join(grupo["categorias_permitidas"]) or "(nenhuma)"))
+                if grupo["relatorios_permitidos"]:
+                    linhas.append(f"Liberação individual: {len(grupo['relatorios_permitidos'])} "
+                                  "relatório(s) — libera apenas esses")
+                linhas.append(f"Membros: {grupo['membros']}")
+                st.markdown("<br>".join(escape(l) for l in linhas), unsafe_allow_html=True)
+            with c2:
+                if st.button("Editar", icon=":material/edit:", key=f"g_edit_{grupo['id']}",
+                             type="secondary"):
+                    st.session_state["editar_grupo_id"] = grupo["id"]
+                    st.rerun()
+            with c3:
+                if st.button("Excluir", icon=":material/delete:", key=f"g_delete_{grupo['id']}",
+                             type="secondary",
+                             help="Os membros perdem o acesso que vinha só deste grupo."):
+                    if excluir_grupo(grupo["id"]):
+                        if st.session_state.get("editar_grupo_id") == grupo["id"]:
+                            del st.session_state["editar_grupo_id"]
+                        st.success(f"Grupo {grupo['nome']} excluído.")
+                        st.rerun()
+
+elif menu == MENU_USO:
+    if not is_admin:
+        st.error("Acesso restrito. Apenas administradores veem o uso dos relatórios.")
+        st.stop()
+
+    dias_uso = st.selectbox("Período", [7, 30, 90], index=1,
+                            format_func=lambda d: f"Últimos {d} dias", key="uso_dias")
+    popularidade = cached_popularidade_relatorios(dias_uso)
+    catalogo = cached_listar_relatorios_basico()
+    por_id = {r["id"]: r for r in catalogo}
+
+    col_top, col_sem = st.columns(2)
+    with col_top:
+        st.markdown("##### Relatórios mais acessados")
+        top = sorted(
+            (i for i in popularidade if i in por_id), key=lambda i: -popularidade[i]["acessos"]
+        )[:15]
+        if not top:
+            st.info("Nenhum acesso registrado no período.")
         else:
-            nivel_atual = user_data["nivel_hierarquia"] if modo_edicao else "operacao"
-            nivel_idx = (
-                NIVEIS_HIERARQUIA.index(nivel_atual)
-                if nivel_atual in NIVEIS_HIERARQUIA
-                else NIVEIS_HIERARQUIA.index("operacao")
+            st.dataframe(
+                [
+                    {
+                        "Relatório": por_id[i]["titulo"],
+                        "Área": por_id[i]["categoria"],
+                        "Acessos": popularidade[i]["acessos"],
+                        "Último acesso": fmt_data(popularidade[i]["ultimo_dia"])[:10],
+                    }
+                    for i in top
+                ],
+                hide_index=True, use_container_width=True,
             )
-            nivel_sel = st.radio(
-                "Nível hierárquico",
-                NIVEIS_HIERARQUIA,
-                index=nivel_idx,
-                format_func=lambda n: NIVEL_LABELS[n],
-                key=f"u_nivel_{fid}",
-                help="Gestão vê relatórios de gestão e de operação; Operação vê só os de operação.",
+    with col_sem:
+        st.markdown("##### Relatórios sem uso no período")
+        sem_uso = [r for r in catalogo if r["id"] not in popularidade]
+        if not sem_uso:
+            st.success("Todos os relatórios tiveram acesso no período.")
+        else:
+            st.caption(f"{len(sem_uso)} de {len(catalogo)} relatório(s) sem nenhum acesso.")
+            st.dataframe(
+                [{"Relatório": r["titulo"], "Área": r["categoria"]} for r in sem_uso],
+                hide_index=True, use_container_width=True,
             )
 
-    if user_is_admin:
-        st.info("Administrador enxerga todos os relatórios — áreas e liberação individual não se aplicam.")
-        areas_final = list(CATEGORIAS_PADRAO)
-        indiv_sel = []
+    st.markdown("##### Usuários mais ativos")
+    atividade = cached_atividade_usuarios(dias_uso)
+    top_u = sorted(atividade, key=lambda i: -atividade[i]["acessos"])[:15]
+    if not top_u:
+        st.info("Nenhum acesso registrado no período.")
     else:
-        st.markdown("**Filtro primário — áreas de atuação**")
-        areas_default = [
-            a for a in (user_data["categorias_permitidas"] if modo_edicao else ["GERAL"])
-            if a in CATEGORIAS_PADRAO
-        ]
-        areas_sel = st.multiselect(
-            "Áreas que o usuário pode acessar",
-            CATEGORIAS_PADRAO,
-            default=areas_default,
-            key=f"u_areas_{fid}",
-            help="O usuário só enxerga relatórios destas áreas.",
-        )
-        areas_final = areas_sel if areas_sel else ["GERAL"]
-
-        st.markdown("**Filtro secundário — liberação individual**")
-        rel_basico = cached_listar_relatorios_basico()
-        rel_label = {
-            r["id"]: f"{r['categoria']} · {NIVEL_LABELS[r['nivel_hierarquia']]} · {r['titulo']}"
-            for r in rel_basico
+        nomes = {
+            u["id"]: u["username"]
+            for u in cache_usuarios().obter_varios(top_u, db.obter_usuarios_por_ids)
         }
-        rel_ids = [r["id"] for r in rel_basico]
-        indiv_default = [
-            i for i in (user_data["relatorios_permitidos"] if modo_edicao else []) if i in rel_label
-        ]
-        indiv_sel = st.multiselect(
-            "Relatórios liberados individualmente",
-            rel_ids,
-            default=indiv_default,
-            format_func=lambda i: rel_label.get(i, f"#{i}"),
-            key=f"u_indiv_{fid}",
-            help=("Deixe VAZIO para liberar todos os relatórios das áreas. Se marcar relatórios, "
-                  "o usuário verá APENAS esses (sempre dentro das áreas e do nível permitidos)."),
+        st.dataframe(
+            [
+                {
+                    "Usuário": nomes.get(i, f"#{i}"),
+                    "Acessos": atividade[i]["acessos"],
+                    "Último acesso": fmt_data(atividade[i]["ultimo_dia"])[:10],
+                }
+                for i in top_u
+            ],
+            hide_index=True, use_container_width=True,
         )
 
-    st.markdown("")
-    col_salvar, col_cancelar = st.columns(2)
-    salvar = col_salvar.button(
-        "Salvar alterações" if modo_edicao else "Criar usuário",
-        icon=":material/save:", type="primary", use_container_width=True, key=f"u_salvar_{fid}",
-    )
-    cancelar = False
-    if modo_edicao:
-        cancelar = col_cancelar.button(
-            "Cancelar", icon=":material/close:", type="secondary",
-            use_container_width=True, key=f"u_cancelar_{fid}",
+    st.markdown("---")
+    c_tit_links, c_btn_links = st.columns([3, 1])
+    c_tit_links.markdown("##### Saúde dos links")
+    if c_btn_links.button("Verificar agora", icon=":material/network_check:", key="links_verificar",
+                          use_container_width=True):
+        with st.spinner("Verificando os links do catálogo..."):
+            try:
+                verificador_links().varrer(db)
+            except Exception as e:  # noqa: BLE001
+                st.error(f"Erro ao verificar os links: {e}")
+        cached_status_links.clear()
+    status_links = cached_status_links()
+    if not status_links:
+        st.info("Nenhuma verificação registrada ainda.")
+    else:
+        por_situacao = {}
+        for verif in status_links.values():
+            por_situacao[verif["situacao"]] = por_situacao.get(verif["situacao"], 0) + 1
+        colunas_sit = st.columns(len(SITUACAO_LABELS))
+        for col, (situacao, rotulo) in zip(colunas_sit, SITUACAO_LABELS.items()):
+            col.metric(rotulo, por_situacao.get(situacao, 0))
+        ultima = max(v["verificado_em"] for v in status_links.values())
+        st.caption(f"Última verificação: {fmt_data(ultima)}")
+
+        problemas = sorted(
+            (i for i in status_links if i in por_id and status_links[i]["situacao"] != "ok"),
+            key=lambda i: (status_links[i]["situacao"] == "lento", -(status_links[i]["latencia_ms"] or 0)),
         )
-
-    if cancelar:
-        del st.session_state["editar_usuario_id"]
-        st.rerun()
-
-    if salvar:
-        checar_senha = (not modo_edicao) or alterar_senha
-        erro = None
-        if not novo_username:
-            erro = "Informe o nome de usuário."
-        elif checar_senha:
-            if not nova_senha or not confirmar_senha:
-                erro = "Preencha e confirme a senha."
-            elif nova_senha != confirmar_senha:
-                erro = "As senhas não coincidem."
-            elif len(nova_senha) < 6:
-                erro = "A senha deve ter pelo menos 6 caracteres."
-
-        if erro:
-            st.error(erro)
-        elif modo_edicao:
-            ok = atualizar_usuario(
-                user_data["id"], username=novo_username, is_admin=user_is_admin,
-                nivel_hierarquia=nivel_sel, categorias_permitidas=areas_final,
-                relatorios_permitidos=indiv_sel,
+        if problemas:
+            st.dataframe(
+                [
+                    {
+                        "Relatório": por_id[i]["titulo"],
+                        "Situação": SITUACAO_LABELS.get(status_links[i]["situacao"]),
+                        "HTTP": status_links[i]["http_status"],
+                        "Latência (ms)": status_links[i]["latencia_ms"],
+                        "Host": status_links[i]["host"],
+                        "Erro": status_links[i]["erro"] or "",
+                    }
+                    for i in problemas
+                ],
+                hide_index=True, use_container_width=True,
             )
-            if ok:
-                if alterar_senha:
-                    atualizar_senha(user_data["id"], nova_senha)
-                st.success("Usuário atualizado com sucesso.")
-                del st.session_state["editar_usuario_id"]
-                st.rerun()
         else:
-            if criar_usuario(novo_username, nova_senha, user_is_admin, nivel_sel, areas_final, indiv_sel):
-                st.success(f"Usuário {novo_username} criado com sucesso.")
-                st.session_state["novo_user_nonce"] = st.session_state.get("novo_user_nonce", 0) + 1
-                st.rerun()
-
-    st.markdown("---")
-    st.markdown("##### Usuários cadastrados")
-    if not usuarios_db:
-        st.info("Nenhum usuário cadastrado.")
-    else:
-        for user in usuarios_db:
-            with st.container(border=True):
-                c1, c2, c3 = st.columns([3, 1, 1])
-                with c1:
-                    st.write(f"Usuário: {user['username']}")
-                    st.write(f"Tipo: {'Administrador' if user['is_admin'] else 'Usuário comum'}")
-                    if not user["is_admin"]:
-                        st.write(f"Nível: {NIVEL_LABELS.get(user.get('nivel_hierarquia'), 'Operação')}")
-                        st.write(f"Áreas: {', '.join(user['categorias_permitidas'][:6])}"
-                                 + (f" … (+{len(user['categorias_permitidas']) - 6})"
-                                    if len(user["categorias_permitidas"]) > 6 else ""))
-                        qtd_indiv = len(user.get("relatorios_permitidos") or [])
-                        if qtd_indiv:
-                            st.write(f"Liberação individual: {qtd_indiv} relatório(s) — vê apenas esses")
-                    st.write(f"Criado em: {fmt_data(user['criado_em'])}")
-                with c2:
-                    if st.button("Editar", icon=":material/edit:", key=f"edit_{user['id']}", type="secondary"):
-                        st.session_state["editar_usuario_id"] = user["id"]
-                        st.rerun()
-                with c3:
-                    if user["username"] != "admin":
-                        if st.button("Excluir", icon=":material/delete:", key=f"delete_{user['id']}", type="secondary"):
-                            if excluir_usuario(user["id"]):
-                                if st.session_state.get("editar_usuario_id") == user["id"]:
-                                    del st.session_state["editar_usuario_id"]
-                                st.success(f"Usuário {user['username']} excluído.")
-                                st.rerun()
+            st.success("Todos os links responderam bem na última verificação.")
+
+        st.markdown("###### Latência por host")
+        por_host = {}
+        for verif in status_links.values():
+            por_host.setdefault(verif["host"] or "(sem host)", []).append(verif)
+        linhas_host = []
+        for host, itens_host in por_host.items():
+            latencias = sorted(v["latencia_ms"] for v in itens_host if v["latencia_ms"] is not None)
+            linhas_host.append({
+                "Host": host,
+                "Links": len(itens_host),
+                "Mediana (ms)": latencias[len(latencias) // 2] if latencias else None,
+                "Máxima (ms)": latencias[-1] if latencias else None,
+                "Com problema": sum(1 for v in itens_host if v["situacao"] != "ok"),
+            })
+        linhas_host.sort(key=lambda h: -(h["Mediana (ms)"] or 0))
+        st.dataframe(linhas_host, hide_index=True, use_container_width=True)
 
 elif menu == MENU_MINHA_CONTA:
     col1, col2 = st.columns([1, 2])
@@ -1116,6 +2179,12 @@ elif menu == MENU_MINHA_CONTA:
             qtd_indiv = len(usuario.get("relatorios_permitidos") or [])
             if qtd_indiv:
                 st.caption(f"Acesso restrito a {qtd_indiv} relatório(s) liberado(s) individualmente.")
+            if usuario.get("grupos"):
+                nomes_grupos = {g["id"]: g["nome"] for g in cached_listar_grupos()}
+                st.write("Grupos: " + ", ".join(
+                    nomes_grupos.get(g, f"#{g}") for g in sorted(usuario["grupos"])
+                ))
+                st.caption("Nível e áreas acima já somam as permissões dos grupos.")
 
     with col2:
         st.subheader(":material/password: Alterar senha")
@@ -1138,6 +2207,10 @@ elif menu == MENU_MINHA_CONTA:
                         if atualizar_senha(usuario["id"], nova_senha):
                             st.success("Senha alterada com sucesso.")
 
+    if is_admin:
+        st.markdown("---")
+        render_perfil_reruns(usuario)
+
 
 st.markdown("---")
 st.caption(f"Portal Power BI v3.0 (Supabase) | Usuário {usuario['username']}")
@@ -0,0 +1,162 @@
+"""Camada de cache compartilhada entre replicas do portal (opcional).
+
+Com varias replicas atras do balanceador, cada `CacheIndexado` e privado do
+processo: toda replica consulta o Supabase por conta propria e so enxerga a
+gravacao de outra replica quando o TTL vence. Esta camada resolve as duas
+coisas com um servidor compativel com o protocolo Redis (`REDIS_URL`):
+
+- L2: o resultado de cada consulta (linhas, total) fica no Redis, entao uma
+  replica carrega do banco e as demais leem de la. As chaves levam a
+  "geracao" do cache (`<prefixo>:<nome>:geracao`), incrementada a cada
+  gravacao: entradas antigas deixam de ser lidas sem precisar apaga-las;
+- invalidacao: cada gravacao local e publicada no canal de pub/sub e as
+  outras replicas aplicam o mesmo patch (`aplicar`/`remover`/`invalidar`) no
+  seu `CacheIndexado`.
+
+Sem `REDIS_URL` (ou sem o pacote `redis`) nao ha camada compartilhada: o L2
+so duplicaria, no mesmo processo, o que o `CacheIndexado` ja guarda. Falha do
+Redis nunca derruba a tela: a leitura cai direto no banco.
+"""
+
+import hashlib
+import json
+import threading
+import uuid
+
+from cache_portal import TTL_PADRAO_S
+
+PREFIXO_PADRAO = "portal"
+INTERVALO_RECONEXAO_S = 5
+
+
+def _para_json(valor):
+    # Modelos (modelos.py) viajam como dict; o resto (ex.: datas) como texto.
+    para_dict = getattr(valor, "para_dict", None)
+    return para_dict() if para_dict is not None else str(valor)
+
+
+class CacheCompartilhado:
+    def __init__(self, backend, prefixo=PREFIXO_PADRAO, ttl=TTL_PADRAO_S):
+        self._backend = backend
+        self.prefixo = prefixo
+        self.ttl = ttl
+        self.canal = f"{prefixo}:invalidacao"
+        self.remoto = hasattr(backend, "pubsub")
+        # Identifica esta replica para ignorar as proprias publicacoes.
+        self._origem = uuid.uuid4().hex
+        self._caches = {}  # nome -> CacheIndexado
+        self._parar = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_secrets(cls, get_secret):
+        """Redis quando `REDIS_URL` esta definido e o pacote `redis` instalado;
+        senao None (sem L2: os caches ficam so no processo)."""
+        url = get_secret("REDIS_URL")
+        prefixo = get_secret("REDIS_PREFIXO", PREFIXO_PADRAO) or PREFIXO_PADRAO
+        if url:
+            try:
+                import redis
+            except ImportError:
+                redis = None
+            if redis is not None:
+                backend = redis.Redis.from_url(
+                    url, decode_responses=True, socket_timeout=2,
+                    socket_connect_timeout=2, health_check_interval=30,
+                )
+                return cls(backend, prefixo=prefixo)
+        return None
+
+    def registrar(self, cache):
+        """Associa um `CacheIndexado` (pelo nome) as invalidacoes recebidas."""
+        self._caches[cache.nome] = cache
+
+    # ------------------------------------------------------------------ L2
+    def _chave_geracao(self, nome):
+        return f"{self.prefixo}:{nome}:geracao"
+
+    def consulta(self, nome, chave, carregar, ttl=None):
+        """(linhas, total) da consulta `chave` do cache `nome`: le do L2 ou
+        chama `carregar()` e grava o resultado para as outras replicas, com a
+        validade `ttl` do cache que pediu (padrao: a desta camada)."""
+        try:
+            geracao = self._backend.get(self._chave_geracao(nome)) or "0"
+            resumo = hashlib.sha1(repr(chave).encode("utf-8")).hexdigest()
+            chave_l2 = f"{self.prefixo}:{nome}:{geracao}:{resumo}"
+            bruto = self._backend.get(chave_l2)
+        except Exception:  # noqa: BLE001  (Redis fora: vai direto ao banco)
+            return carregar()
+        if bruto is not None:
+            linhas, total = json.loads(bruto)
+            return linhas, total
+        linhas, total = carregar()
+        try:
+            # Gravado na geracao lida ANTES do carregar: se houve escrita no
+            # meio, o resultado fica em uma geracao que ninguem mais le.
+            self._backend.set(
+                chave_l2, json.dumps([linhas, total], default=_para_json),
+                ex=max(1, int(self.ttl if ttl is None else ttl)),
+            )
+        except Exception:  # noqa: BLE001
+            pass
+        return linhas, total
+
+    # ---------------------------------------------------------- invalidacao
+    def avancar_geracao(self, nome):
+        """Torna obsoletas todas as entradas L2 de `nome`."""
+        try:
+            self._backend.incr(self._chave_geracao(nome))
+        except Exception:  # noqa: BLE001
+            pass
+
+    def publicar(self, nome, acao, **dados):
+        """Avanca a geracao do L2 de `nome` e avisa as outras replicas."""
+        evento = dict(dados, origem=self._origem, nome=nome, acao=acao)
+        self.avancar_geracao(nome)
+        try:
+            self._backend.publish(self.canal, json.dumps(evento, default=_para_json))
+        except Exception:  # noqa: BLE001  (sem Redis: outras replicas ficam no TTL)
+            pass
+
+    def _receber(self, bruto):
+        try:
+            evento = json.loads(bruto)
+        except (TypeError, ValueError):
+            return
+        if evento.get("origem") == self._origem:
+            return
+        cache = self._caches.get(evento.get("nome"))
+        if cache is not None:
+            cache.receber(evento)
+
+    def _invalidar_tudo(self):
+        for cache in list(self._caches.values()):
+            cache.invalidar(propagar=False)
+
+    def _escutar(self):
+        while not self._parar.is_set():
+            try:
+                pubsub = self._backend.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.canal)
+                # Mensagens perdidas enquanto a assinatura estava caida: o que
+                # esta em memoria pode estar velho.
+                self._invalidar_tudo()
+                while not self._parar.is_set():
+                    msg = pubsub.get_message(timeout=1.0)
+                    if msg and msg.get("type") == "message":
+                        self._receber(msg["data"])
+            except Exception:  # noqa: BLE001  (reconecta depois de um intervalo)
+                self._parar.wait(INTERVALO_RECONEXAO_S)
+
+    def iniciar(self):
+        """Assina o canal de invalidacao em uma thread daemon (so com Redis)."""
+        if not self.remoto or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(
+            target=self._escutar, name="cache-compartilhado", daemon=True
+        )
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
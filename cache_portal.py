@@ -0,0 +1,329 @@
+"""Cache write-through, indexado por id, para as listas do portal.
+
+Substitui o `cached_*.clear()` a cada gravacao: as funcoes de escrita do app
+aplicam a linha devolvida pelo banco (`aplicar`/`remover`) e so a entrada
+afetada muda. Recarga completa so acontece por TTL ou quando a versao da
+linha gravada e mais antiga que a do cache (escrita fora de ordem).
+
+Tres formas de consulta ficam em cache, todas guardando apenas ids:
+- lista completa (`paginada=False`): mantida em dia pelos patches, com filtro
+  (`pred`) e ordenacao (`ordem`) aplicados no proprio cache;
+- pagina (`paginada=True`): alteracao que mantem a linha na pagina so faz o
+  patch; criacao/exclusao (que deslocam a paginacao) descartam as paginas, o
+  que custa uma consulta de uma pagina, nunca a tabela inteira;
+- lista incremental (`consulta_incremental`): lista completa que, vencida,
+  busca so o delta desde a sua marca em vez de recarregar tudo.
+
+Linhas lidas por id (`obter`/`obter_varios`) tambem vencem pelo TTL, contado
+da carga de cada linha, e as que nao estao em nenhuma consulta sao limitadas a
+cerca de `max_avulsas` (as mais antigas saem primeiro).
+
+Com um `CacheCompartilhado` (cache_compartilhado.py) as consultas tambem
+passam por um L2 comum as replicas, e cada `aplicar`/`remover`/`invalidar`
+local e publicado para as outras replicas repetirem o mesmo patch.
+
+Com `modelo` (ex.: modelos.Usuario), linhas que chegam como dict (L2 ou
+patch de outra replica, ambos em JSON) voltam a ser o modelo antes de entrar
+no cache.
+"""
+
+import threading
+import time
+
+TTL_PADRAO_S = 120
+# Lista incremental: recarga inteira periodica, rede de seguranca para o que
+# um delta nao enxerga (ex.: log de exclusoes ja purgado).
+RECARGA_TOTAL_S = 6 * 3600
+# Teto de linhas avulsas (lidas por id, fora de qualquer consulta em cache);
+# as carregadas ha mais tempo saem primeiro.
+MAX_LINHAS_AVULSAS = 2000
+
+
+class CacheIndexado:
+    def __init__(self, nome, versao_de=None, ttl=TTL_PADRAO_S, compartilhado=None,
+                 modelo=None, max_avulsas=MAX_LINHAS_AVULSAS):
+        self.nome = nome
+        # Numero ou funcao sem argumentos, lida a cada consulta (ex.: TTL que
+        # depende de o LISTEN estar confirmado naquele momento).
+        self._ttl = ttl
+        self._modelo = modelo
+        # Funcao linha -> versao comparavel (ex.: atualizado_em); None = sem versao.
+        self._versao_de = versao_de
+        self._lock = threading.RLock()
+        self._linhas = {}     # id -> linha
+        # id -> instante da carga (ou do ultimo patch), em ordem de carga.
+        self._carregadas_em = {}
+        self._max_avulsas = max_avulsas
+        self._teto_poda = max_avulsas
+        # chave -> {"ids", "total", "em", "pred", "ordem", "paginada"[, "marca", "carregada_em"]}
+        self._consultas = {}
+        self._compartilhado = compartilhado
+        if compartilhado is not None:
+            compartilhado.registrar(self)
+
+    @property
+    def ttl(self):
+        return self._ttl() if callable(self._ttl) else self._ttl
+
+    # ------------------------------------------------------------- leitura
+    def _montar(self, linha):
+        if self._modelo is not None and isinstance(linha, dict):
+            return self._modelo.de_dict(linha)
+        return linha
+
+    def _vencida(self, consulta):
+        return time.time() - consulta["em"] > self.ttl
+
+    def _guardar(self, linha, agora=None):
+        item_id = linha["id"]
+        self._linhas[item_id] = linha
+        self._carregadas_em.pop(item_id, None)
+        self._carregadas_em[item_id] = time.time() if agora is None else agora
+
+    def _descartar(self, item_id):
+        self._linhas.pop(item_id, None)
+        self._carregadas_em.pop(item_id, None)
+
+    def _fresca(self, item_id):
+        return time.time() - self._carregadas_em.get(item_id, 0) <= self.ttl
+
+    def _podar(self):
+        """Mantem as linhas avulsas perto de `max_avulsas`, descartando as
+        carregadas ha mais tempo. As das consultas em cache ficam; o conjunto
+        delas so e recalculado quando o total passa do teto (custo amortizado)."""
+        if len(self._linhas) <= self._teto_poda:
+            return
+        presas = set()
+        for c in self._consultas.values():
+            presas.update(c["ids"])
+        avulsas = [i for i in self._carregadas_em if i not in presas]
+        for item_id in avulsas[:max(0, len(avulsas) - self._max_avulsas // 2)]:
+            self._descartar(item_id)
+        self._teto_poda = len(self._linhas) + self._max_avulsas // 2
+
+    def consulta(self, chave, carregar, pred=None, ordem=None, paginada=False):
+        """Devolve (linhas, total) da consulta `chave`, chamando `carregar()`
+        -> (linhas, total) so quando ela nao esta em cache ou venceu."""
+        with self._lock:
+            c = self._consultas.get(chave)
+            if c is not None and not self._vencida(c):
+                linhas = [self._linhas.get(i) for i in c["ids"]]
+                if all(linha is not None for linha in linhas):
+                    return linhas, c["total"]
+        if self._compartilhado is not None:
+            linhas, total = self._compartilhado.consulta(self.nome, chave, carregar, ttl=self.ttl)
+            linhas = [self._montar(linha) for linha in linhas]
+        else:
+            linhas, total = carregar()
+        with self._lock:
+            agora = time.time()
+            for linha in linhas:
+                self._guardar(linha, agora)
+            self._consultas[chave] = {
+                "ids": [linha["id"] for linha in linhas],
+                "total": total,
+                "em": agora,
+                "pred": pred,
+                "ordem": ordem,
+                "paginada": paginada,
+            }
+        return list(linhas), total
+
+    def consulta_incremental(self, chave, carregar, delta, ordem=None,
+                             recarga_total=RECARGA_TOTAL_S):
+        """Lista completa mantida por sincronizacao incremental.
+
+        `carregar()` -> (linhas, marca) so na primeira leitura, depois de um
+        `invalidar()` total ou a cada `recarga_total` segundos (passa pelo L2
+        com a marca junto). Vencida pelo TTL, por `vencer()` ou por
+        `invalidar(id)`, a consulta chama `delta(marca)` -> (alteradas,
+        ids_removidos, nova_marca) e aplica so isso: o custo acompanha o volume
+        de mudancas, nao o tamanho da lista."""
+        with self._lock:
+            c = self._consultas.get(chave)
+            if c is not None and time.time() - c["carregada_em"] > recarga_total:
+                c = None
+            if c is not None and not self._vencida(c):
+                linhas = [self._linhas.get(i) for i in c["ids"]]
+                if all(linha is not None for linha in linhas):
+                    return linhas, c["total"]
+            marca = c["marca"] if c is not None else None
+
+        if marca is None:
+            if self._compartilhado is not None:
+                linhas, marca = self._compartilhado.consulta(
+                    self.nome, chave, carregar, ttl=self.ttl
+                )
+                linhas = [self._montar(linha) for linha in linhas]
+            else:
+                linhas, marca = carregar()
+            with self._lock:
+                agora = time.time()
+                for linha in linhas:
+                    self._guardar(linha, agora)
+                self._consultas[chave] = {
+                    "ids": [linha["id"] for linha in linhas],
+                    "total": len(linhas),
+                    "em": agora,
+                    "pred": None,
+                    "ordem": ordem,
+                    "paginada": False,
+                    "marca": marca,
+                    "carregada_em": agora,
+                }
+            return list(linhas), len(linhas)
+
+        alteradas, removidos, marca = delta(marca)
+        with self._lock:
+            c = self._consultas.get(chave)
+            if c is not None:
+                # Exclusoes antes das alteracoes: um relatorio excluido e
+                # restaurado dentro do mesmo delta volta para a lista.
+                removidos = set(removidos)
+                for item_id in removidos:
+                    self._descartar(item_id)
+                ids = [i for i in c["ids"] if i not in removidos]
+                presentes = set(ids)
+                for linha in alteradas:
+                    self._guardar(linha)
+                    if linha["id"] not in presentes:
+                        ids.append(linha["id"])
+                        presentes.add(linha["id"])
+                linhas = [self._linhas.get(i) for i in ids]
+                if all(linha is not None for linha in linhas):
+                    if ordem is not None:
+                        linhas.sort(key=ordem)
+                    c.update(ids=[linha["id"] for linha in linhas], total=len(linhas),
+                             em=time.time(), marca=marca)
+                    return linhas, c["total"]
+                # Linha descartada que o delta nao trouxe: recarga inteira.
+                del self._consultas[chave]
+        return self.consulta_incremental(chave, carregar, delta, ordem, recarga_total)
+
+    def obter(self, item_id, carregar):
+        """Linha por id; `carregar(item_id)` so e chamado em cache miss ou
+        quando a linha foi carregada ha mais que o TTL."""
+        with self._lock:
+            linha = self._linhas.get(item_id)
+            if linha is not None and self._fresca(item_id):
+                return linha
+        linha = carregar(item_id)
+        if linha is not None:
+            with self._lock:
+                self._guardar(linha)
+                self._podar()
+        return linha
+
+    def obter_varios(self, ids, carregar_varios):
+        """Linhas de varios ids; `carregar_varios(faltantes)` busca so os que
+        nao estao em cache (ou venceram), em uma chamada. Ids inexistentes sao
+        omitidos."""
+        with self._lock:
+            achadas = {i: self._linhas[i] for i in ids if i in self._linhas and self._fresca(i)}
+        faltantes = [i for i in ids if i not in achadas]
+        if faltantes:
+            novas = carregar_varios(faltantes)
+            with self._lock:
+                for linha in novas:
+                    self._guardar(linha)
+                    achadas[linha["id"]] = linha
+                self._podar()
+        return [achadas[i] for i in ids if i in achadas]
+
+    def linhas(self, pred=None):
+        """Linhas ja em cache (opcionalmente so as que passam em `pred`), sem
+        ir ao banco; para patches que dependem de outro campo que nao o id."""
+        with self._lock:
+            return [linha for linha in self._linhas.values() if pred is None or pred(linha)]
+
+    # ------------------------------------------------------------- escrita
+    def _propagar(self, acao, **dados):
+        if self._compartilhado is not None:
+            self._compartilhado.publicar(self.nome, acao, **dados)
+
+    def receber(self, evento):
+        """Repete aqui um patch publicado por outra replica."""
+        acao = evento.get("acao")
+        if acao == "aplicar" and isinstance(evento.get("linha"), dict):
+            self.aplicar(evento["linha"], nova=bool(evento.get("nova")), propagar=False)
+        elif acao == "remover":
+            self.remover(evento.get("id"), propagar=False)
+        elif acao == "vencer":
+            self.vencer(propagar=False)
+        else:
+            self.invalidar(evento.get("id"), propagar=False)
+
+    def aplicar(self, linha, nova=False, propagar=True):
+        """Write-through de uma linha criada (`nova`) ou alterada."""
+        linha = self._montar(linha)
+        item_id = linha["id"]
+        with self._lock:
+            atual = self._linhas.get(item_id)
+            if (
+                self._versao_de is not None and atual is not None
+                and (self._versao_de(linha) or "") < (self._versao_de(atual) or "")
+            ):
+                # Versao fora de ordem: o cache nao e confiavel, recarrega tudo.
+                self.invalidar(propagar=propagar)
+                return
+            self._guardar(linha)
+            for chave, c in list(self._consultas.items()):
+                casa = c["pred"] is None or c["pred"](linha)
+                presente = item_id in c["ids"]
+                if c["paginada"]:
+                    if (nova and casa) or casa != presente:
+                        del self._consultas[chave]
+                    continue
+                if casa and not presente:
+                    c["ids"].append(item_id)
+                    c["total"] += 1
+                elif presente and not casa:
+                    c["ids"].remove(item_id)
+                    c["total"] -= 1
+                if c["ordem"] is not None and casa:
+                    c["ids"].sort(key=lambda i: c["ordem"](self._linhas[i]))
+            self._podar()
+        if propagar:
+            self._propagar("aplicar", linha=linha, nova=nova)
+
+    def remover(self, item_id, propagar=True):
+        with self._lock:
+            self._descartar(item_id)
+            for chave, c in list(self._consultas.items()):
+                if c["paginada"]:
+                    del self._consultas[chave]
+                elif item_id in c["ids"]:
+                    c["ids"].remove(item_id)
+                    c["total"] -= 1
+        if propagar:
+            self._propagar("remover", id=item_id)
+
+    def invalidar(self, item_id=None, propagar=True):
+        """Descarta uma linha (e as consultas que a contem) ou o cache todo.
+        Listas incrementais nao sao descartadas por uma linha: vencem e a
+        proxima leitura busca o delta."""
+        with self._lock:
+            if item_id is None:
+                self._linhas.clear()
+                self._carregadas_em.clear()
+                self._consultas.clear()
+                self._teto_poda = self._max_avulsas
+            else:
+                self._descartar(item_id)
+                for chave, c in list(self._consultas.items()):
+                    if "marca" in c:
+                        c["em"] = 0
+                    elif item_id in c["ids"]:
+                        del self._consultas[chave]
+        if propagar:
+            self._propagar("invalidar", id=item_id)
+
+    def vencer(self, propagar=True):
+        """Vence todas as consultas sem descartar linhas: as comuns recarregam
+        na proxima leitura e as incrementais so buscam o delta (ex.: linha nova
+        que ainda nao esta em nenhuma lista)."""
+        with self._lock:
+            for c in self._consultas.values():
+                c["em"] = 0
+        if propagar:
+            self._propagar("vencer")
@@ -0,0 +1,57 @@
+"""Componentes customizados do portal (HTML/JS estatico, sem build de frontend).
+
+Cada componente vive em uma pasta com um index.html que fala o protocolo de
+componentes do Streamlit (postMessage) diretamente.
+"""
+
+import os
+
+import streamlit.components.v1 as components
+
+_BASE = os.path.dirname(os.path.abspath(__file__))
+
+_iframe_pool = components.declare_component(
+    "iframe_pool", path=os.path.join(_BASE, "iframe_pool")
+)
+
+
+def iframe_pool(entradas, ativo=None, limite=3, altura=900, powerbi_js=None,
+                key="iframe_pool"):
+    """Pool de iframes persistente no navegador.
+
+    `entradas` e a lista (LRU, do menos para o mais recente) dos relatorios
+    mantidos vivos: {"id", "tipo": "iframe", "src"} ou {"id", "tipo": "embed",
+    "token", "embed_url", "report_id"}. So o `ativo` fica visivel; com `ativo`
+    None o componente ocupa altura zero mas mantem os iframes carregados.
+    Precisa ser chamado sempre na mesma posicao da pagina para nao remontar.
+    `powerbi_js` sao as URLs do powerbi-client em ordem de preferencia
+    (obrigatorias se houver embeds): a absoluta do arquivo em static/ e a do
+    CDN; cada uma so e tentada se a anterior falhar."""
+    _iframe_pool(
+        entradas=entradas, ativo=ativo, limite=limite, altura=altura,
+        powerbi_js=powerbi_js, key=key, default=None,
+    )
+
+
+_grade_relatorios = components.declare_component(
+    "grade_relatorios", path=os.path.join(_BASE, "grade_relatorios")
+)
+
+
+def grade_relatorios(itens, fontes_css=None, icones_reserva=None, key="grade_relatorios"):
+    """Grade de cards de relatorios com filtro por categoria, busca e ordenacao
+    feitos no navegador (sem rerun a cada tecla).
+
+    `itens`: lista de {"id", "titulo", "descricao", "categoria", "nivel",
+    "nivel_label", "criador", "criado_em" (ja formatado), "pode_editar",
+    "acessos", "link_situacao", "link_aviso"}, na ordem "mais recentes". Com
+    `link_aviso` o card mostra o problema do link (verificador_links) e, se
+    o link estiver quebrado ou indisponivel, fica esmaecido.
+    Devolve a ultima acao clicada, {"acao": "abrir"|"editar"|"excluir", "id",
+    "nonce"}, ou None. O valor persiste entre reruns: use o `nonce` para
+    tratar cada clique uma unica vez. `fontes_css` e a URL (absoluta) da folha
+    de fontes self-hosted, carregada uma vez dentro do iframe; `icones_reserva`,
+    a URL de uma fonte Material Symbols Rounded declarada no iframe para os
+    icones nao virarem texto quando o subset self-hosted faltar."""
+    return _grade_relatorios(itens=itens, fontes_css=fontes_css,
+                             icones_reserva=icones_reserva, key=key, default=None)
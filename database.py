@@ -1,10 +1,17 @@
 import hashlib
+import json
 import os
+import re
+import threading
+from datetime import timedelta
 
 import streamlit as st
-from passlib.hash import pbkdf2_sha256
-import psycopg
-from supabase import create_client
+
+from database_async import DatabaseAsync
+from modelos import Relatorio, Usuario, ler_instante
+
+# supabase, psycopg e passlib sao importados onde sao usados pela primeira
+# vez: importar este modulo (ex.: na tela de login) nao paga o custo deles.
 
 
 # Areas de atuacao (filtro PRIMARIO de acesso por relatorio).
@@ -29,6 +36,28 @@ NIVEIS_HIERARQUIA = ["gestao", "operacao"]
 NIVEL_LABELS = {"gestao": "Gestão", "operacao": "Operação"}
 NIVEL_PADRAO = "operacao"
 
+# Operacoes aceitas por alterar_permissoes_em_massa (rpc permissoes_em_massa).
+ACOES_EM_MASSA = (
+    "adicionar_areas",
+    "remover_areas",
+    "definir_nivel",
+    "liberar_relatorios",
+    "revogar_relatorios",
+)
+
+# Canal do NOTIFY disparado pelos triggers de relatorios/usuarios.
+CANAL_ALTERACOES = "portal_alteracoes"
+INTERVALO_RECONEXAO_ESCUTA_S = 5
+# Espera pela volta do NOTIFY de sonda que confirma o LISTEN.
+TIMEOUT_SONDA_ESCUTA_S = 10
+
+# Delta do catalogo: relê esta margem antes da marca. atualizado_em e o inicio
+# da transacao, entao uma gravacao confirmada depois de uma leitura pode ter
+# horario anterior a marca dela; reaplicar linhas ja vistas e inofensivo.
+MARGEM_DELTA_S = 60
+# Marca de um catalogo vazio: o primeiro delta le tudo o que existir.
+MARCA_INICIAL = "1970-01-01T00:00:00+00:00"
+
 # Mapeamento de categorias antigas -> novas (migracao automatica de dados).
 _MAPA_CATEGORIAS_LEGADO = {
     "Geral": "GERAL",
@@ -55,9 +84,22 @@ class Database:
         "id,titulo,link_powerbi,descricao,categoria,nivel_hierarquia,"
         "criado_por,criado_em,atualizado_em"
     )
+    _COLS_USUARIO = (
+        "id,username,is_admin,nivel_hierarquia,"
+        "categorias_permitidas,relatorios_permitidos,criado_em,permissoes_efetivas"
+    )
 
     def __init__(self):
         self.supabase = self._create_client()
+        # Mesmo projeto, cliente assincrono: consultas independentes em paralelo.
+        self._async = DatabaseAsync(
+            self._get_secret("SUPABASE_URL"), self._get_secret("SUPABASE_KEY")
+        )
+        self._ouvintes = {}  # tabela -> [callback(evento | None)]
+        self._parar_escuta = threading.Event()
+        # So ligado com o LISTEN confirmado (sonda voltou) e a conexao de pe.
+        self._escuta_confirmada = threading.Event()
+        self._thread_escuta = None
         self.init_database()
 
     # ----------------------------------------------------------------- infra
@@ -71,6 +113,8 @@ class Database:
         key = self._get_secret("SUPABASE_KEY")
         if not url or not key:
             raise RuntimeError("SUPABASE_URL e SUPABASE_KEY sao obrigatorios.")
+        from supabase import create_client
+
         return create_client(url, key)
 
     def _create_schema_if_needed(self):
@@ -85,7 +129,7 @@ class Database:
         schema_sql = """
         create table if not exists public.usuarios (
             id bigint generated by default as identity primary key,
-            username text unique not null,
+            username text not null,
             email text unique,
             password_hash text not null,
             is_admin boolean not null default false,
@@ -93,6 +137,7 @@ class Database:
             nivel_hierarquia text not null default 'operacao',
             categorias_permitidas jsonb not null default '[]'::jsonb,
             relatorios_permitidos jsonb not null default '[]'::jsonb,
+            excluido_em timestamptz,
             criado_em timestamptz not null default now()
         );
 
@@ -106,16 +151,143 @@ class Database:
             tags text,
             criado_por bigint references public.usuarios(id) on delete set null,
             ativo boolean not null default true,
+            excluido_em timestamptz,
             criado_em timestamptz not null default now(),
             atualizado_em timestamptz not null default now()
         );
 
+        -- Bases antigas: logs_acesso era uma tabela comum. Ela e renomeada e os dados
+        -- sao copiados para a versao particionada logo abaixo (ids preservados, a
+        -- marca d'agua dos agregados continua valida).
+        do $$
+        begin
+            if exists (
+                select 1 from pg_class
+                where oid = to_regclass('public.logs_acesso') and relkind = 'r'
+            ) then
+                alter table public.logs_acesso rename to logs_acesso_legado;
+                alter index if exists public.logs_acesso_pkey rename to logs_acesso_legado_pkey;
+            end if;
+        end $$;
+
+        -- Log de acessos particionado por mes de data_acesso: consultas por periodo
+        -- so leem as particoes do intervalo e a retencao descarta particoes inteiras
+        -- (sem DELETE em massa). A particao padrao recebe o que cair fora dos meses
+        -- criados; criar_particoes_logs_acesso() move essas linhas para o mes certo.
         create table if not exists public.logs_acesso (
-            id bigint generated by default as identity primary key,
+            id bigserial,
             usuario_id bigint references public.usuarios(id) on delete set null,
             relatorio_id bigint references public.relatorios(id) on delete set null,
-            data_acesso timestamptz not null default now()
-        );
+            data_acesso timestamptz not null default now(),
+            primary key (id, data_acesso)
+        ) partition by range (data_acesso);
+        create table if not exists public.logs_acesso_padrao
+            partition of public.logs_acesso default;
+
+        create index if not exists idx_logs_acesso_data_brin
+            on public.logs_acesso using brin (data_acesso);
+        create index if not exists idx_logs_acesso_usuario on public.logs_acesso(usuario_id);
+        create index if not exists idx_logs_acesso_relatorio on public.logs_acesso(relatorio_id);
+
+        -- Cria as particoes mensais (UTC) de `p_desde` ate `p_meses_a_frente` meses
+        -- adiante. Idempotente; devolve quantas criou.
+        create or replace function public.criar_particoes_logs_acesso(
+            p_meses_a_frente integer default 3,
+            p_desde timestamptz default now()
+        )
+        returns integer
+        language plpgsql
+        as $$
+        declare
+            v_mes timestamp := date_trunc('month', p_desde at time zone 'UTC');
+            v_ultimo timestamp := date_trunc('month', now() at time zone 'UTC')
+                                  + make_interval(months => p_meses_a_frente);
+            v_de timestamptz;
+            v_ate timestamptz;
+            v_nome text;
+            v_criadas integer := 0;
+        begin
+            while v_mes <= v_ultimo loop
+                v_nome := 'logs_acesso_' || to_char(v_mes, 'YYYY_MM');
+                v_de := v_mes at time zone 'UTC';
+                v_ate := (v_mes + interval '1 month') at time zone 'UTC';
+                if to_regclass('public.' || v_nome) is null then
+                    -- Cria solta, traz as linhas do mes que estao na particao padrao e
+                    -- so entao anexa (anexar com essas linhas na padrao falharia).
+                    execute format(
+                        'create table public.%I (like public.logs_acesso including defaults)', v_nome
+                    );
+                    execute format(
+                        'insert into public.%I select * from public.logs_acesso_padrao'
+                        ' where data_acesso >= $1 and data_acesso < $2', v_nome
+                    ) using v_de, v_ate;
+                    delete from public.logs_acesso_padrao
+                    where data_acesso >= v_de and data_acesso < v_ate;
+                    execute format(
+                        'alter table public.logs_acesso attach partition public.%I'
+                        ' for values from (%L) to (%L)', v_nome, v_de, v_ate
+                    );
+                    v_criadas := v_criadas + 1;
+                end if;
+                v_mes := v_mes + interval '1 month';
+            end loop;
+            return v_criadas;
+        end;
+        $$;
+
+        -- Retencao: desanexa e remove as particoes mensais anteriores aos ultimos
+        -- `p_manter_meses` meses. Os agregados de uso sao atualizados antes, entao a
+        -- popularidade historica nao se perde. Com `p_simular` so lista as particoes.
+        create or replace function public.remover_particoes_logs_acesso(
+            p_manter_meses integer default 12,
+            p_simular boolean default false
+        )
+        returns setof text
+        language plpgsql
+        as $$
+        declare
+            v_corte date := (date_trunc('month', now() at time zone 'UTC')
+                             - make_interval(months => p_manter_meses))::date;
+            v_nome text;
+        begin
+            if not p_simular then
+                perform public.atualizar_rollups_acesso();
+            end if;
+            for v_nome in
+                select c.relname
+                from pg_inherits i
+                join pg_class c on c.oid = i.inhrelid
+                where i.inhparent = 'public.logs_acesso'::regclass
+                  and c.relname ~ '^logs_acesso_[0-9]{4}_[0-9]{2}$'
+                  and to_date(substr(c.relname, 13), 'YYYY_MM') < v_corte
+                order by c.relname
+            loop
+                if not p_simular then
+                    execute format('alter table public.logs_acesso detach partition public.%I', v_nome);
+                    execute format('drop table public.%I', v_nome);
+                end if;
+                return next v_nome;
+            end loop;
+        end;
+        $$;
+
+        do $$
+        begin
+            if to_regclass('public.logs_acesso_legado') is not null then
+                perform public.criar_particoes_logs_acesso(
+                    3, coalesce((select min(data_acesso) from public.logs_acesso_legado), now())
+                );
+                insert into public.logs_acesso (id, usuario_id, relatorio_id, data_acesso)
+                select id, usuario_id, relatorio_id, data_acesso from public.logs_acesso_legado;
+                perform setval(
+                    pg_get_serial_sequence('public.logs_acesso', 'id'),
+                    greatest((select max(id) from public.logs_acesso), 1)
+                );
+                drop table public.logs_acesso_legado;
+            end if;
+        end $$;
+
+        select public.criar_particoes_logs_acesso(3);
 
         -- Migracao de bases existentes: adiciona colunas novas se faltarem.
         alter table public.usuarios
@@ -124,11 +296,127 @@ class Database:
             add column if not exists relatorios_permitidos jsonb not null default '[]'::jsonb;
         alter table public.relatorios
             add column if not exists nivel_hierarquia text not null default 'operacao';
+        alter table public.usuarios add column if not exists excluido_em timestamptz;
+        alter table public.relatorios add column if not exists excluido_em timestamptz;
 
-        create index if not exists idx_relatorios_categoria on public.relatorios(categoria);
-        create index if not exists idx_relatorios_nivel on public.relatorios(nivel_hierarquia);
         create index if not exists idx_relatorios_criado_por on public.relatorios(criado_por);
-        create index if not exists idx_usuarios_username on public.usuarios(username);
+        -- Exclusao logica: as leituras do portal so enxergam linhas com `ativo`, entao
+        -- os indices das consultas sao parciais (`where ativo`) e ignoram o que aguarda
+        -- a purga. Formatos de consulta: ver scripts/analisar_indices.py.
+        -- Catalogo por area (categoria in (...) order by criado_em desc) e completo.
+        create index if not exists idx_relatorios_ativos_cat_nivel_criado
+            on public.relatorios(categoria, nivel_hierarquia, criado_em desc) where ativo;
+        create index if not exists idx_relatorios_ativos_criado_em
+            on public.relatorios(criado_em desc) where ativo;
+        -- Username unico so entre ativos: um usuario excluido nao prende o nome.
+        create unique index if not exists uq_usuarios_username_ativo
+            on public.usuarios(username) where ativo;
+        alter table public.usuarios drop constraint if exists usuarios_username_key;
+        -- Paginacao da lista de usuarios (ordem criado_em desc) e filtro por area.
+        create index if not exists idx_usuarios_ativos_criado_em
+            on public.usuarios(criado_em desc, id desc) where ativo;
+        create index if not exists idx_usuarios_ativos_categorias
+            on public.usuarios using gin (categorias_permitidas jsonb_path_ops) where ativo;
+        -- Typeahead de relatorios e busca de usuarios (prefixo, ILIKE).
+        create extension if not exists pg_trgm;
+        create index if not exists idx_relatorios_ativos_titulo_trgm
+            on public.relatorios using gin (titulo gin_trgm_ops) where ativo;
+        create index if not exists idx_usuarios_ativos_username_trgm
+            on public.usuarios using gin (username gin_trgm_ops) where ativo;
+        -- Fila da purga: inativos por data de exclusao.
+        create index if not exists idx_relatorios_excluidos
+            on public.relatorios(excluido_em) where not ativo;
+        create index if not exists idx_usuarios_excluidos
+            on public.usuarios(excluido_em) where not ativo;
+        -- excluido_em vem do relogio do banco, nao do cliente: marcado quando `ativo`
+        -- vira false (e limpo se a linha voltar a ativa). O app so grava ativo = false.
+        create or replace function public.marcar_excluido_em()
+        returns trigger
+        language plpgsql
+        as $$
+        begin
+            new.excluido_em = case when new.ativo then null else now() end;
+            return new;
+        end;
+        $$;
+
+        drop trigger if exists trg_usuarios_excluido_em on public.usuarios;
+        create trigger trg_usuarios_excluido_em
+        before update of ativo on public.usuarios
+        for each row
+        when (old.ativo is distinct from new.ativo)
+        execute function public.marcar_excluido_em();
+
+        drop trigger if exists trg_relatorios_excluido_em on public.relatorios;
+        create trigger trg_relatorios_excluido_em
+        before update of ativo on public.relatorios
+        for each row
+        when (old.ativo is distinct from new.ativo)
+        execute function public.marcar_excluido_em();
+        -- Substituidos pelas versoes parciais acima (ou redundantes).
+        drop index if exists public.idx_relatorios_categoria;
+        drop index if exists public.idx_relatorios_nivel;
+        drop index if exists public.idx_relatorios_cat_nivel_criado;
+        drop index if exists public.idx_relatorios_criado_em;
+        drop index if exists public.idx_relatorios_titulo_trgm;
+        drop index if exists public.idx_usuarios_username;
+        drop index if exists public.idx_usuarios_criado_em;
+        drop index if exists public.idx_usuarios_categorias;
+        drop index if exists public.idx_usuarios_username_trgm;
+
+        -- Remove fisicamente ate `p_lote` relatorios e `p_lote` usuarios inativos ha
+        -- mais de `p_carencia_dias` dias (e o log de exclusoes do mesmo periodo). Lotes pequenos seguram locks por pouco tempo
+        -- (as FKs de logs_acesso e criado_por sao indexadas); chame em loop ate
+        -- devolver zero (scripts/purgar_inativos.py).
+        create or replace function public.purgar_inativos(
+            p_lote integer default 500,
+            p_carencia_dias integer default 30
+        )
+        returns table (tabela text, removidas integer)
+        language plpgsql
+        as $$
+        declare
+            v_limite timestamptz := now() - make_interval(days => p_carencia_dias);
+        begin
+            with alvo as (
+                select id from public.relatorios
+                where not ativo and excluido_em < v_limite
+                order by excluido_em
+                limit p_lote
+                for update skip locked
+            )
+            delete from public.relatorios r using alvo where r.id = alvo.id;
+            get diagnostics removidas = row_count;
+            tabela := 'relatorios';
+            return next;
+
+            with alvo as (
+                select id from public.usuarios
+                where not ativo and excluido_em < v_limite
+                order by excluido_em
+                limit p_lote
+                for update skip locked
+            )
+            delete from public.usuarios u using alvo where u.id = alvo.id;
+            get diagnostics removidas = row_count;
+            tabela := 'usuarios';
+            return next;
+
+            -- Log de exclusoes: o app recarrega o catalogo inteiro bem antes disso.
+            with alvo as (
+                select relatorio_id from public.relatorios_exclusoes
+                where excluido_em < v_limite
+                order by excluido_em
+                limit p_lote
+                for update skip locked
+            )
+            delete from public.relatorios_exclusoes e using alvo
+            where e.relatorio_id = alvo.relatorio_id;
+            get diagnostics removidas = row_count;
+            tabela := 'relatorios_exclusoes';
+            return next;
+        end;
+        $$;
 
         create or replace function public.set_relatorio_updated_at()
         returns trigger
@@ -146,16 +434,586 @@ class Database:
         for each row
         execute function public.set_relatorio_updated_at();
 
+        -- Sincronizacao incremental do catalogo: o app busca so os relatorios com
+        -- atualizado_em depois da sua ultima marca e, para saber o que sumiu, as
+        -- linhas deste log (a exclusao logica tira o relatorio das leituras `where
+        -- ativo`, e um DELETE nao deixa linha nenhuma).
+        create table if not exists public.relatorios_exclusoes (
+            relatorio_id bigint primary key,
+            excluido_em timestamptz not null default now()
+        );
+        create index if not exists idx_relatorios_exclusoes_excluido_em
+            on public.relatorios_exclusoes(excluido_em);
+        create index if not exists idx_relatorios_ativos_atualizado_em
+            on public.relatorios(atualizado_em) where ativo;
+
+        create or replace function public.registrar_exclusao_relatorio()
+        returns trigger
+        language plpgsql
+        as $$
+        begin
+            insert into public.relatorios_exclusoes (relatorio_id, excluido_em)
+            values (old.id, now())
+            on conflict (relatorio_id) do update set excluido_em = excluded.excluido_em;
+            return null;
+        end;
+        $$;
+
+        -- Exclusao logica (ativo -> false) ou DELETE de relatorio ainda ativo (a
+        -- purga so apaga inativos, ja registrados).
+        drop trigger if exists trg_relatorios_exclusao on public.relatorios;
+        create trigger trg_relatorios_exclusao
+        after update of ativo on public.relatorios
+        for each row
+        when (old.ativo and not new.ativo)
+        execute function public.registrar_exclusao_relatorio();
+
+        drop trigger if exists trg_relatorios_exclusao_delete on public.relatorios;
+        create trigger trg_relatorios_exclusao_delete
+        after delete on public.relatorios
+        for each row
+        when (old.ativo)
+        execute function public.registrar_exclusao_relatorio();
+
+        -- Saude dos links (verificador_links.py): ultima verificacao de cada
+        -- relatorio, sobrescrita a cada varredura.
+        create table if not exists public.links_status (
+            relatorio_id bigint primary key references public.relatorios(id) on delete cascade,
+            situacao text not null,
+            http_status integer,
+            latencia_ms integer,
+            host text,
+            erro text,
+            verificado_em timestamptz not null default now()
+        );
+
+        -- Avisa os processos do portal (LISTEN portal_alteracoes) de cada linha
+        -- gravada, venha a escrita do app, de outra replica ou do SQL Editor. O payload
+        -- leva so tabela, operacao, id, a versao (atualizado_em, quando existir) e, em
+        -- UPDATE, os nomes das colunas que mudaram (quem so depende de algumas ignora
+        -- o resto).
+        create or replace function public.notificar_alteracao()
+        returns trigger
+        language plpgsql
+        as $$
+        declare
+            v_linha jsonb := to_jsonb(case when tg_op = 'DELETE' then old else new end);
+            v_campos jsonb;
+        begin
+            if tg_op = 'UPDATE' then
+                select coalesce(jsonb_agg(n.key), '[]'::jsonb) into v_campos
+                from jsonb_each(v_linha) n
+                where n.value is distinct from to_jsonb(old) -> n.key;
+            end if;
+            perform pg_notify(
+                'portal_alteracoes',
+                json_build_object(
+                    'tabela', tg_table_name,
+                    'op', tg_op,
+                    'id', v_linha -> 'id',
+                    'versao', v_linha -> 'atualizado_em',
+                    'campos', v_campos
+                )::text
+            );
+            return null;
+        end;
+        $$;
+
+        drop trigger if exists trg_relatorios_notificar on public.relatorios;
+        create trigger trg_relatorios_notificar
+        after insert or update or delete on public.relatorios
+        for each row
+        execute function public.notificar_alteracao();
+
+        -- Troca de senha (password_hash) nao muda nada que esteja em cache.
+        drop trigger if exists trg_usuarios_notificar on public.usuarios;
+        create trigger trg_usuarios_notificar
+        after insert or delete or update of username, is_admin, ativo, nivel_hierarquia,
+            categorias_permitidas, relatorios_permitidos, permissoes_efetivas on public.usuarios
+        for each row
+        execute function public.notificar_alteracao();
+
+        -- Grupos de acesso: perfis (areas, nivel, liberacao individual) compartilhados
+        -- por varios usuarios. Mudar um grupo e um UPDATE de uma linha; os triggers
+        -- abaixo rematerializam as permissoes efetivas so dos membros.
+        create table if not exists public.grupos_acesso (
+            id bigint generated by default as identity primary key,
+            nome text not null unique,
+            descricao text,
+            nivel_hierarquia text not null default 'operacao',
+            categorias_permitidas jsonb not null default '[]'::jsonb,
+            relatorios_permitidos jsonb not null default '[]'::jsonb,
+            criado_em timestamptz not null default now(),
+            atualizado_em timestamptz not null default now()
+        );
+
+        create table if not exists public.usuarios_grupos (
+            usuario_id bigint not null references public.usuarios(id) on delete cascade,
+            grupo_id bigint not null references public.grupos_acesso(id) on delete cascade,
+            primary key (usuario_id, grupo_id)
+        );
+        create index if not exists idx_usuarios_grupos_grupo on public.usuarios_grupos(grupo_id);
+
+        -- Permissoes efetivas (proprias + grupos), materializadas na linha do usuario:
+        -- {"grupos": [ids], "nivel": maior nivel, "areas": uniao das areas,
+        --  "concessoes": [{"nivel", "areas", "relatorios"}, ...]}.
+        -- Cada concessao vale como hoje (area E nivel E, se houver, liberacao
+        -- individual); o usuario ve o que qualquer concessao libera. Fontes com o
+        -- mesmo nivel e a mesma liberacao individual viram uma concessao so.
+        alter table public.usuarios add column if not exists permissoes_efetivas jsonb;
+
+        create or replace function public.permissoes_efetivas_de(
+            p_usuario_id bigint,
+            p_nivel text,
+            p_areas jsonb,
+            p_relatorios jsonb
+        )
+        returns jsonb
+        language sql
+        stable
+        as $$
+            with fontes as (
+                select p_nivel as nivel,
+                       coalesce(p_areas, '[]'::jsonb) as areas,
+                       coalesce(p_relatorios, '[]'::jsonb) as relatorios
+                union all
+                select g.nivel_hierarquia, g.categorias_permitidas, g.relatorios_permitidos
+                from public.usuarios_grupos ug
+                join public.grupos_acesso g on g.id = ug.grupo_id
+                where ug.usuario_id = p_usuario_id
+            ),
+            concessoes as (
+                select f.nivel, f.relatorios, jsonb_agg(distinct a.x) as areas
+                from fontes f
+                cross join lateral jsonb_array_elements(f.areas) a(x)
+                group by f.nivel, f.relatorios
+            )
+            select jsonb_build_object(
+                'grupos', coalesce(
+                    (select jsonb_agg(ug.grupo_id order by ug.grupo_id)
+                     from public.usuarios_grupos ug where ug.usuario_id = p_usuario_id),
+                    '[]'::jsonb),
+                'nivel', case when exists (select 1 from concessoes c where c.nivel = 'gestao')
+                              then 'gestao' else 'operacao' end,
+                'areas', coalesce(
+                    (select jsonb_agg(distinct a.x)
+                     from concessoes c cross join lateral jsonb_array_elements(c.areas) a(x)),
+                    '[]'::jsonb),
+                'concessoes', coalesce(
+                    (select jsonb_agg(jsonb_build_object(
+                         'nivel', c.nivel, 'areas', c.areas, 'relatorios', c.relatorios))
+                     from concessoes c),
+                    '[]'::jsonb)
+            )
+        $$;
+
+        -- Rematerializa os usuarios `p_usuarios`; so grava quem mudou. Devolve quantos.
+        create or replace function public.recalcular_permissoes_efetivas(p_usuarios bigint[])
+        returns integer
+        language plpgsql
+        as $$
+        declare
+            v_qtd integer;
+        begin
+            with calculadas as (
+                select u.id,
+                       public.permissoes_efetivas_de(
+                           u.id, u.nivel_hierarquia, u.categorias_permitidas, u.relatorios_permitidos
+                       ) as efetivas
+                from public.usuarios u
+                where u.id = any(p_usuarios)
+            )
+            update public.usuarios u
+            set permissoes_efetivas = c.efetivas
+            from calculadas c
+            where u.id = c.id and u.permissoes_efetivas is distinct from c.efetivas;
+            get diagnostics v_qtd = row_count;
+            return v_qtd;
+        end;
+        $$;
+
+        -- Permissoes proprias alteradas: recalcula na propria linha, antes de gravar.
+        create or replace function public.usuarios_calcular_permissoes()
+        returns trigger
+        language plpgsql
+        as $$
+        begin
+            new.permissoes_efetivas := public.permissoes_efetivas_de(
+                new.id, new.nivel_hierarquia, new.categorias_permitidas, new.relatorios_permitidos
+            );
+            return new;
+        end;
+        $$;
+
+        drop trigger if exists trg_usuarios_permissoes on public.usuarios;
+        create trigger trg_usuarios_permissoes
+        before insert or update of nivel_hierarquia, categorias_permitidas, relatorios_permitidos
+        on public.usuarios
+        for each row
+        execute function public.usuarios_calcular_permissoes();
+
+        -- Entrada/saida de grupos: um recalculo por comando, para todos os envolvidos
+        -- (inclui a remocao em cascata ao excluir um grupo).
+        create or replace function public.usuarios_grupos_recalcular()
+        returns trigger
+        language plpgsql
+        as $$
+        begin
+            if tg_op = 'INSERT' then
+                perform public.recalcular_permissoes_efetivas(array(select distinct usuario_id from novos));
+            else
+                perform public.recalcular_permissoes_efetivas(array(select distinct usuario_id from antigos));
+            end if;
+            return null;
+        end;
+        $$;
+
+        drop trigger if exists trg_usuarios_grupos_inserir on public.usuarios_grupos;
+        create trigger trg_usuarios_grupos_inserir
+        after insert on public.usuarios_grupos
+        referencing new table as novos
+        for each statement
+        execute function public.usuarios_grupos_recalcular();
+
+        drop trigger if exists trg_usuarios_grupos_remover on public.usuarios_grupos;
+        create trigger trg_usuarios_grupos_remover
+        after delete on public.usuarios_grupos
+        referencing old table as antigos
+        for each statement
+        execute function public.usuarios_grupos_recalcular();
+
+        -- Grupo alterado: recalcula os membros dos grupos do comando.
+        create or replace function public.grupos_acesso_recalcular()
+        returns trigger
+        language plpgsql
+        as $$
+        begin
+            perform public.recalcular_permissoes_efetivas(array(
+                select distinct ug.usuario_id
+                from public.usuarios_grupos ug
+                join novos n on n.id = ug.grupo_id
+            ));
+            return null;
+        end;
+        $$;
+
+        drop trigger if exists trg_grupos_acesso_recalcular on public.grupos_acesso;
+        create trigger trg_grupos_acesso_recalcular
+        after update on public.grupos_acesso
+        referencing new table as novos
+        for each statement
+        execute function public.grupos_acesso_recalcular();
+
+        drop trigger if exists trg_grupos_acesso_updated_at on public.grupos_acesso;
+        create trigger trg_grupos_acesso_updated_at
+        before update on public.grupos_acesso
+        for each row
+        execute function public.set_relatorio_updated_at();
+
+        drop trigger if exists trg_grupos_acesso_notificar on public.grupos_acesso;
+        create trigger trg_grupos_acesso_notificar
+        after insert or update or delete on public.grupos_acesso
+        for each row
+        execute function public.notificar_alteracao();
+
+        -- Usuarios anteriores aos grupos.
+        update public.usuarios
+        set permissoes_efetivas = public.permissoes_efetivas_de(
+            id, nivel_hierarquia, categorias_permitidas, relatorios_permitidos
+        )
+        where permissoes_efetivas is null;
+
+        -- Alteracao de permissoes em massa: um unico UPDATE para todos os usuarios
+        -- comuns ativos que casam com os filtros (os mesmos da lista de usuarios).
+        -- Devolve so as linhas que mudam, ja com os valores novos (inclusive as
+        -- permissoes efetivas); com p_simular nada e gravado (pre-visualizacao). Acoes e p_valor:
+        --   adicionar_areas / remover_areas        lista de areas
+        --   definir_nivel                          'gestao' ou 'operacao'
+        --   liberar_relatorios / revogar_relatorios lista de ids de relatorio
+        -- liberar_relatorios so altera quem ja tem liberacao individual: para os
+        -- demais, lista vazia significa "todos os relatorios das areas".
+        drop function if exists public.permissoes_em_massa(text, jsonb, text, text, text, bigint[], boolean);
+        create or replace function public.permissoes_em_massa(
+            p_acao text,
+            p_valor jsonb,
+            p_busca text default null,
+            p_nivel text default null,
+            p_area text default null,
+            p_ids bigint[] default null,
+            p_simular boolean default false
+        )
+        returns table (
+            id bigint,
+            username text,
+            is_admin boolean,
+            nivel_hierarquia text,
+            categorias_permitidas jsonb,
+            relatorios_permitidos jsonb,
+            criado_em timestamptz,
+            permissoes_efetivas jsonb
+        )
+        language sql
+        as $$
+            with alvo as (
+                select
+                    u.id, u.username, u.is_admin, u.criado_em,
+                    u.nivel_hierarquia as nivel_antes,
+                    u.categorias_permitidas as areas_antes,
+                    u.relatorios_permitidos as rels_antes,
+                    case when p_acao = 'definir_nivel' then p_valor #>> '{}'
+                         else u.nivel_hierarquia end as nivel_depois,
+                    case p_acao
+                        when 'adicionar_areas' then u.categorias_permitidas || coalesce(
+                            (select jsonb_agg(v.x) from jsonb_array_elements(p_valor) v(x)
+                             where not u.categorias_permitidas @> jsonb_build_array(v.x)),
+                            '[]'::jsonb)
+                        when 'remover_areas' then coalesce(
+                            (select jsonb_agg(e.x order by e.i)
+                             from jsonb_array_elements(u.categorias_permitidas) with ordinality e(x, i)
+                             where not p_valor @> jsonb_build_array(e.x)),
+                            '[]'::jsonb)
+                        else u.categorias_permitidas
+                    end as areas_depois,
+                    case
+                        when p_acao = 'liberar_relatorios'
+                             and jsonb_array_length(u.relatorios_permitidos) > 0
+                            then u.relatorios_permitidos || coalesce(
+                                (select jsonb_agg(v.x) from jsonb_array_elements(p_valor) v(x)
+                                 where not u.relatorios_permitidos @> jsonb_build_array(v.x)),
+                                '[]'::jsonb)
+                        when p_acao = 'revogar_relatorios' then coalesce(
+                            (select jsonb_agg(e.x order by e.i)
+                             from jsonb_array_elements(u.relatorios_permitidos) with ordinality e(x, i)
+                             where not p_valor @> jsonb_build_array(e.x)),
+                            '[]'::jsonb)
+                        else u.relatorios_permitidos
+                    end as rels_depois
+                from public.usuarios u
+                where u.ativo and not u.is_admin
+                  and (p_ids is null or u.id = any(p_ids))
+                  and (p_busca is null or u.username ilike p_busca)
+                  and (p_nivel is null or u.nivel_hierarquia = p_nivel)
+                  and (p_area is null or u.categorias_permitidas @> jsonb_build_array(p_area))
+                for update of u
+            ),
+            mudam as (
+                select * from alvo
+                where nivel_depois is distinct from nivel_antes
+                   or areas_depois is distinct from areas_antes
+                   or rels_depois is distinct from rels_antes
+            ),
+            gravados as (
+                update public.usuarios u
+                set nivel_hierarquia = m.nivel_depois,
+                    categorias_permitidas = m.areas_depois,
+                    relatorios_permitidos = m.rels_depois
+                from mudam m
+                where u.id = m.id and not p_simular
+                returning u.id
+            )
+            select m.id, m.username, m.is_admin, m.nivel_depois, m.areas_depois,
+                   m.rels_depois, m.criado_em,
+                   public.permissoes_efetivas_de(m.id, m.nivel_depois, m.areas_depois, m.rels_depois)
+            from mudam m
+            order by m.criado_em desc, m.id desc
+        $$;
+
+        -- Agregados de uso (popularidade) alimentados incrementalmente a partir de
+        -- logs_acesso, usando logs_acesso.id como marca d'agua (rollup_estado).
+        create table if not exists public.acessos_relatorio_dia (
+            relatorio_id bigint not null,
+            dia date not null,
+            acessos integer not null default 0,
+            primary key (relatorio_id, dia)
+        );
+        create index if not exists idx_acessos_relatorio_dia_dia on public.acessos_relatorio_dia(dia);
+
+        create table if not exists public.acessos_usuario_dia (
+            usuario_id bigint not null,
+            dia date not null,
+            acessos integer not null default 0,
+            primary key (usuario_id, dia)
+        );
+        create index if not exists idx_acessos_usuario_dia_dia on public.acessos_usuario_dia(dia);
+
+        create table if not exists public.rollup_estado (
+            nome text primary key,
+            ultimo_id bigint not null default 0,
+            atualizado_em timestamptz not null default now()
+        );
+
+        create or replace function public.atualizar_rollups_acesso()
+        returns bigint
+        language plpgsql
+        as $$
+        declare
+            v_de bigint;
+            v_ate bigint;
+        begin
+            -- Um agregador por vez; quem nao pega o lock sai sem esperar.
+            if not pg_try_advisory_xact_lock(hashtext('rollups_acesso')) then
+                return 0;
+            end if;
+            insert into public.rollup_estado (nome) values ('logs_acesso') on conflict do nothing;
+            select ultimo_id into v_de from public.rollup_estado where nome = 'logs_acesso' for update;
+            -- So agrega linhas com alguns segundos de idade: ids de transacoes ainda
+            -- abertas nao ficam para tras da marca d'agua.
+            select coalesce(max(id), v_de) into v_ate
+            from public.logs_acesso
+            where id > v_de and data_acesso < now() - interval '30 seconds';
+            if v_ate <= v_de then
+                return 0;
+            end if;
+
+            insert into public.acessos_relatorio_dia as a (relatorio_id, dia, acessos)
+            select relatorio_id, (data_acesso at time zone 'America/Sao_Paulo')::date, count(*)
+            from public.logs_acesso
+            where id > v_de and id <= v_ate and relatorio_id is not null
+            group by 1, 2
+            on conflict (relatorio_id, dia) do update set acessos = a.acessos + excluded.acessos;
+
+            insert into public.acessos_usuario_dia as a (usuario_id, dia, acessos)
+            select usuario_id, (data_acesso at time zone 'America/Sao_Paulo')::date, count(*)
+            from public.logs_acesso
+            where id > v_de and id <= v_ate and usuario_id is not null
+            group by 1, 2
+            on conflict (usuario_id, dia) do update set acessos = a.acessos + excluded.acessos;
+
+            update public.rollup_estado
+            set ultimo_id = v_ate, atualizado_em = now()
+            where nome = 'logs_acesso';
+            return v_ate - v_de;
+        end;
+        $$;
+
+        create or replace function public.popularidade_relatorios(p_dias integer default 30)
+        returns table (relatorio_id bigint, acessos bigint, ultimo_dia date)
+        language sql
+        stable
+        as $$
+            select relatorio_id, sum(acessos)::bigint, max(dia)
+            from public.acessos_relatorio_dia
+            where dia > current_date - p_dias
+            group by relatorio_id
+        $$;
+
+        create or replace function public.atividade_usuarios(p_dias integer default 30)
+        returns table (usuario_id bigint, acessos bigint, ultimo_dia date)
+        language sql
+        stable
+        as $$
+            select usuario_id, sum(acessos)::bigint, max(dia)
+            from public.acessos_usuario_dia
+            where dia > current_date - p_dias
+            group by usuario_id
+        $$;
+
         alter table public.usuarios disable row level security;
         alter table public.relatorios disable row level security;
+        alter table public.acessos_relatorio_dia disable row level security;
+        alter table public.acessos_usuario_dia disable row level security;
+        alter table public.rollup_estado disable row level security;
+        alter table public.grupos_acesso disable row level security;
+        alter table public.usuarios_grupos disable row level security;
+        alter table public.relatorios_exclusoes disable row level security;
+        alter table public.links_status disable row level security;
         """
 
+        import psycopg
+
         with psycopg.connect(db_url, autocommit=True) as conn:
             with conn.cursor() as cur:
                 cur.execute(schema_sql)
 
+    # ----------------------------------------------------- LISTEN/NOTIFY
+    def ao_alterar(self, tabela, callback):
+        """Registra `callback(evento)` para as alteracoes de `tabela` avisadas
+        pelo banco. `evento` e {"tabela", "op", "id", "versao"}, ou None quando
+        avisos podem ter sido perdidos (reconexao): descarte tudo."""
+        self._ouvintes.setdefault(tabela, []).append(callback)
+
+    @property
+    def escutando(self):
+        """True so enquanto a conexao de LISTEN esta de pe e ja recebeu de
+        volta um aviso (thread viva sem conexao, ou pooler que descarta
+        NOTIFY, nao contam)."""
+        return self._escuta_confirmada.is_set()
+
+    def _confirmar_escuta(self, conn):
+        # NOTIFY de sonda na propria conexao: so volta se os avisos chegam de
+        # fato (o pooler em modo transacao aceita o LISTEN e perde o NOTIFY).
+        sonda = os.urandom(8).hex()
+        conn.execute("select pg_notify(%s, %s)",
+                     (CANAL_ALTERACOES, json.dumps({"sonda": sonda})))
+        for aviso in conn.notifies(timeout=TIMEOUT_SONDA_ESCUTA_S):
+            try:
+                if json.loads(aviso.payload).get("sonda") == sonda:
+                    return True
+            except ValueError:
+                continue
+        return False
+
+    def _despachar(self, evento, tabela=None):
+        for nome, callbacks in list(self._ouvintes.items()):
+            if tabela is not None and nome != tabela:
+                continue
+            for callback in list(callbacks):
+                try:
+                    callback(evento)
+                except Exception:  # noqa: BLE001  (um ouvinte nao derruba os outros)
+                    pass
+
+    def _escutar(self, db_url):
+        import psycopg
+
+        while not self._parar_escuta.is_set():
+            try:
+                with psycopg.connect(db_url, autocommit=True) as conn:
+                    conn.execute(f"listen {CANAL_ALTERACOES}")
+                    if not self._confirmar_escuta(conn):
+                        raise RuntimeError("LISTEN sem avisos (pooler em modo transacao?)")
+                    self._escuta_confirmada.set()
+                    # Conectou (ou reconectou): o que chegou antes nao foi visto.
+                    self._despachar(None)
+                    while not self._parar_escuta.is_set():
+                        for aviso in conn.notifies(timeout=5.0):
+                            try:
+                                evento = json.loads(aviso.payload)
+                            except ValueError:
+                                continue
+                            if evento.get("tabela"):  # sondas (desta ou de outra replica) nao
+                                self._despachar(evento, evento["tabela"])
+            except Exception:  # noqa: BLE001  (queda de conexao: tenta de novo)
+                pass
+            finally:
+                self._escuta_confirmada.clear()
+            self._parar_escuta.wait(INTERVALO_RECONEXAO_ESCUTA_S)
+
+    def iniciar_escuta(self):
+        """Abre uma conexao dedicada (SUPABASE_DB_URL) com LISTEN no canal dos
+        triggers e repassa cada aviso aos ouvintes, em uma thread daemon.
+        Devolve False quando nao ha SUPABASE_DB_URL (caches ficam so no TTL).
+        O pooler em modo transacao (porta 6543) nao entrega NOTIFY: use a
+        conexao direta ou o pooler em modo sessao (5432)."""
+        db_url = self._get_secret("SUPABASE_DB_URL")
+        if not db_url:
+            return False
+        if self._thread_escuta is not None and self._thread_escuta.is_alive():
+            return True
+        self._parar_escuta.clear()
+        self._thread_escuta = threading.Thread(
+            target=self._escutar, args=(db_url,), name="db-listen", daemon=True
+        )
+        self._thread_escuta.start()
+        return True
+
+    def parar_escuta(self):
+        self._parar_escuta.set()
+
     # ---------------------------------------------------------------- senhas
     def hash_password(self, password: str) -> str:
+        from passlib.hash import pbkdf2_sha256
+
         return pbkdf2_sha256.hash(password)
 
     @staticmethod
@@ -167,6 +1025,8 @@ class Database:
         # Tenta verificar hash moderno (pbkdf2_sha256).
         try:
             if stored_hash and stored_hash.startswith("$pbkdf2-sha256$"):
+                from passlib.hash import pbkdf2_sha256
+
                 return pbkdf2_sha256.verify(password, stored_hash), False
         except Exception:
             pass
@@ -203,38 +1063,77 @@ class Database:
             return True
         return normalizar_nivel(nivel_relatorio) == "operacao"
 
+    @classmethod
+    def _concessoes(cls, efetivas, nivel=None, areas=None, relatorios=None):
+        """Concessoes de acesso ({"nivel", "areas", "relatorios"}) materializadas
+        em `permissoes_efetivas` (proprias + grupos) ou, sem elas, so as
+        permissoes proprias. O Usuario as guarda ja como conjuntos."""
+        fontes = efetivas.get("concessoes") if isinstance(efetivas, dict) else None
+        if fontes is None:
+            fontes = [{"nivel": nivel, "areas": areas, "relatorios": relatorios}]
+        return [
+            {
+                "nivel": normalizar_nivel(c.get("nivel")),
+                "areas": list(c.get("areas") or []),
+                "relatorios": cls._parse_relatorios_permitidos(c.get("relatorios") or []),
+            }
+            for c in fontes
+        ]
+
+    def _concessoes_usuario(self, usuario):
+        """Concessoes do usuario como tuplas (areas, nivel, relatorios) com
+        conjuntos, prontas para avaliar muitos relatorios. O Usuario ja as
+        traz assim; um dict (ex.: linha crua) e convertido aqui."""
+        if isinstance(usuario, Usuario):
+            return usuario.concessoes
+        return Usuario(concessoes=usuario.get("concessoes") or self._concessoes(
+            None, usuario.get("nivel_hierarquia"), usuario.get("categorias_permitidas"),
+            usuario.get("relatorios_permitidos"),
+        )).concessoes
+
+    def _concessoes_liberam(self, concessoes, relatorio_id, categoria, nivel_relatorio):
+        return any(
+            categoria in areas
+            and self._hierarquia_ok(nivel, nivel_relatorio)
+            and (not relatorios or relatorio_id in relatorios)
+            for areas, nivel, relatorios in concessoes
+        )
+
     def _pode_ver_relatorio(self, usuario, r):
         """Regra de visibilidade de um relatorio (linha crua do banco) para um usuario.
 
-        Nao-admin enxerga se, ao mesmo tempo:
-          - a area (categoria) esta entre as suas areas permitidas (filtro primario);
-          - a hierarquia do relatorio e compativel com o nivel do usuario;
-          - e, se houver liberacao individual definida, o relatorio esta na lista
-            (filtro secundario restritivo).
+        Nao-admin enxerga se alguma das suas concessoes (permissoes proprias ou
+        de um grupo) libera o relatorio, isto e, ao mesmo tempo:
+          - a area (categoria) esta entre as areas da concessao (filtro primario);
+          - a hierarquia do relatorio e compativel com o nivel da concessao;
+          - e, se a concessao tiver liberacao individual, o relatorio esta na
+            lista (filtro secundario restritivo).
         O criador sempre acessa o proprio relatorio (para editar/visualizar).
         """
         if usuario.get("is_admin"):
             return True
         if r.get("criado_por") is not None and r.get("criado_por") == usuario.get("id"):
             return True
-
-        areas = usuario.get("categorias_permitidas") or []
-        if (r.get("categoria") or "GERAL") not in areas:
-            return False
-        if not self._hierarquia_ok(usuario.get("nivel_hierarquia"), r.get("nivel_hierarquia")):
-            return False
-        permitidos = usuario.get("relatorios_permitidos") or []
-        if permitidos and r.get("id") not in permitidos:
-            return False
-        return True
+        return self._concessoes_liberam(
+            self._concessoes_usuario(usuario), r.get("id"),
+            r.get("categoria") or "GERAL", r.get("nivel_hierarquia"),
+        )
 
     # ------------------------------------------------------------ init/seed
     def _smoke_test_schema(self):
         # Falha se as colunas novas ainda nao existirem -> dispara a migracao.
-        self.supabase.table("usuarios").select(
-            "id,nivel_hierarquia,relatorios_permitidos"
-        ).limit(1).execute()
-        self.supabase.table("relatorios").select("id,nivel_hierarquia").limit(1).execute()
+        self._async.reunir_sync(
+            lambda c: c.table("usuarios").select("id,relatorios_permitidos,excluido_em,permissoes_efetivas").limit(1),
+            lambda c: c.table("relatorios").select("id,nivel_hierarquia,excluido_em").limit(1),
+            lambda c: c.table("rollup_estado").select("nome,ultimo_id").limit(1),
+            lambda c: c.table("grupos_acesso").select("id").limit(1),
+            lambda c: c.table("relatorios_exclusoes").select("relatorio_id,excluido_em").limit(1),
+            lambda c: c.table("links_status").select("relatorio_id,situacao").limit(1),
+            # Funcao mais recente do schema; p_ids vazio nao casa com ninguem.
+            lambda c: c.rpc("permissoes_em_massa", {
+                "p_acao": "definir_nivel", "p_valor": NIVEL_PADRAO, "p_ids": [], "p_simular": True,
+            }),
+        )
 
     def init_database(self):
         try:
@@ -243,19 +1142,26 @@ class Database:
             self._create_schema_if_needed()
             self._smoke_test_schema()
 
-        self._garantir_admin()
-        self._migrar_categorias_legado()
-        self._backfill_padroes()
-
-    def _garantir_admin(self):
-        admin = (
-            self.supabase.table("usuarios")
-            .select("id")
-            .eq("username", "admin")
-            .limit(1)
-            .execute()
+        # As leituras do boot sao independentes entre si: vao todas juntas.
+        legados = [antigo for antigo, novo in _MAPA_CATEGORIAS_LEGADO.items() if antigo != novo]
+        admin, usuarios, *sondas = self._async.reunir_sync(
+            lambda c: c.table("usuarios").select("id").eq("username", "admin").eq("ativo", True).limit(1),
+            lambda c: c.table("usuarios").select("id,is_admin,categorias_permitidas"),
+            *(
+                lambda c, antigo=antigo: (
+                    c.table("relatorios").select("id").eq("categoria", antigo).limit(1)
+                )
+                for antigo in legados
+            ),
+        )
+        self._garantir_admin(bool(admin.data))
+        self._migrar_categorias_legado(
+            [antigo for antigo, sonda in zip(legados, sondas) if sonda.data]
         )
-        if not admin.data:
+        self._backfill_padroes(usuarios.data or [])
+
+    def _garantir_admin(self, admin_existe):
+        if not admin_existe:
             initial_admin_password = self._get_secret("ADMIN_INITIAL_PASSWORD")
             if not initial_admin_password:
                 raise RuntimeError(
@@ -272,34 +1178,24 @@ class Database:
                 }
             ).execute()
 
-    def _migrar_categorias_legado(self):
+    def _migrar_categorias_legado(self, presentes):
         # Remapeia categorias antigas dos relatorios para as novas (maiusculas).
-        # Idempotente: apos a migracao nao ha mais valores legados.
-        for antigo, novo in _MAPA_CATEGORIAS_LEGADO.items():
-            if antigo == novo:
-                continue
-            achou = (
-                self.supabase.table("relatorios")
-                .select("id")
-                .eq("categoria", antigo)
-                .limit(1)
-                .execute()
-            )
-            if achou.data:
-                (
-                    self.supabase.table("relatorios")
-                    .update({"categoria": novo})
+        # Idempotente: apos a migracao nao ha mais valores legados. `presentes`
+        # sao as categorias antigas que ainda tem relatorio (sondadas no boot).
+        self._async.reunir_sync(
+            *(
+                lambda c, antigo=antigo: (
+                    c.table("relatorios")
+                    .update({"categoria": _MAPA_CATEGORIAS_LEGADO[antigo]})
                     .eq("categoria", antigo)
-                    .execute()
                 )
-
-    def _backfill_padroes(self):
-        users = (
-            self.supabase.table("usuarios")
-            .select("id,is_admin,categorias_permitidas")
-            .execute()
+                for antigo in presentes
+            )
         )
-        for user in users.data or []:
+
+    def _backfill_padroes(self, users):
+        atualizacoes = []
+        for user in users:
             cats = user.get("categorias_permitidas")
             novas = None
             if isinstance(cats, list) and cats:
@@ -312,12 +1208,15 @@ class Database:
             elif not cats:
                 novas = CATEGORIAS_PADRAO if user.get("is_admin") else ["GERAL"]
             if novas is not None:
-                (
-                    self.supabase.table("usuarios")
-                    .update({"categorias_permitidas": novas})
-                    .eq("id", user["id"])
-                    .execute()
+                atualizacoes.append((user["id"], novas))
+        self._async.reunir_sync(
+            *(
+                lambda c, user_id=user_id, novas=novas: (
+                    c.table("usuarios").update({"categorias_permitidas": novas}).eq("id", user_id)
                 )
+                for user_id, novas in atualizacoes
+            )
+        )
 
     # ----------------------------------------------------------------- auth
     def autenticar_usuario(self, username: str, password: str):
@@ -325,9 +1224,10 @@ class Database:
             self.supabase.table("usuarios")
             .select(
                 "id,username,password_hash,is_admin,nivel_hierarquia,"
-                "categorias_permitidas,relatorios_permitidos"
+                "categorias_permitidas,relatorios_permitidos,permissoes_efetivas"
             )
             .eq("username", username)
+            .eq("ativo", True)
             .limit(1)
             .execute()
         )
@@ -347,73 +1247,157 @@ class Database:
                 .execute()
             )
 
-        is_admin = bool(usuario.get("is_admin", False))
+        sessao = self._montar_usuario(usuario)
+        return sessao.substituir(
+            **self._permissoes_sessao(sessao), criado_em=None, autenticado=True
+        )
+
+    @staticmethod
+    def _permissoes_sessao(u):
+        """Nivel/areas/liberacao individual EFETIVOS (proprios + grupos) de um
+        usuario montado: o que vale para a sessao dele."""
+        concessoes = u.concessoes
+        if u.is_admin:
+            return {"nivel_hierarquia": "gestao", "categorias_permitidas": list(CATEGORIAS_PADRAO)}
+        areas = set().union(*(a for a, _nivel, _rels in concessoes))
+        restritas = [rels for _areas, _nivel, rels in concessoes]
         return {
-            "id": usuario["id"],
-            "username": usuario["username"],
-            "is_admin": is_admin,
-            "nivel_hierarquia": normalizar_nivel(usuario.get("nivel_hierarquia")),
-            "categorias_permitidas": self._parse_categorias(
-                usuario.get("categorias_permitidas"), is_admin
+            "nivel_hierarquia": (
+                "gestao" if any(n == "gestao" for _a, n, _r in concessoes) else NIVEL_PADRAO
             ),
-            "relatorios_permitidos": self._parse_relatorios_permitidos(
-                usuario.get("relatorios_permitidos")
+            "categorias_permitidas": (
+                [a for a in CATEGORIAS_PADRAO if a in areas]
+                + sorted(a for a in areas if a not in CATEGORIAS_PADRAO)
+            ),
+            # Lista so quando TODA concessao e restrita (para exibicao).
+            "relatorios_permitidos": (
+                sorted(set().union(*restritas)) if restritas and all(restritas) else []
             ),
-            "autenticado": True,
         }
 
     # ------------------------------------------------------------ relatorios
-    def _usuarios_map_por_id(self):
-        resp = self.supabase.table("usuarios").select("id,username").execute()
+    @staticmethod
+    def _consulta_usuarios_map(cliente):
+        return cliente.table("usuarios").select("id,username").eq("ativo", True)
+
+    @staticmethod
+    def _usuarios_map(resp):
         return {u["id"]: u["username"] for u in (resp.data or [])}
 
     def _montar_relatorio(self, r, user_map):
-        return {
-            "id": r["id"],
-            "titulo": r["titulo"],
-            "link_powerbi": r["link_powerbi"],
-            "descricao": r.get("descricao"),
-            "categoria": r.get("categoria") or "GERAL",
-            "nivel_hierarquia": normalizar_nivel(r.get("nivel_hierarquia")),
-            "criado_por": r.get("criado_por"),
-            "criado_em": r.get("criado_em"),
-            "atualizado_em": r.get("atualizado_em") or r.get("criado_em"),
-            "criador": user_map.get(r.get("criado_por"), "Sistema"),
-        }
+        return Relatorio(
+            id=r["id"],
+            titulo=r["titulo"],
+            link_powerbi=r["link_powerbi"],
+            descricao=r.get("descricao"),
+            categoria=r.get("categoria") or "GERAL",
+            nivel_hierarquia=normalizar_nivel(r.get("nivel_hierarquia")),
+            criado_por=r.get("criado_por"),
+            criado_em=r.get("criado_em"),
+            atualizado_em=r.get("atualizado_em") or r.get("criado_em"),
+            criador=user_map.get(r.get("criado_por"), "Sistema"),
+        )
+
+    def filtrar_relatorios_usuario(self, usuario, relatorios):
+        """Aplica area, hierarquia e liberacao individual a relatorios ja
+        montados (ex.: o catalogo completo em cache), mantendo a ordem."""
+        if usuario["is_admin"]:
+            return list(relatorios)
+        concessoes = self._concessoes_usuario(usuario)
+        return [
+            r for r in relatorios
+            if self._concessoes_liberam(concessoes, r["id"], r["categoria"], r["nivel_hierarquia"])
+        ]
+
+    def _mapa_criadores(self, linhas):
+        """{id: username} so dos criadores de `linhas`, nao de todos os usuarios
+        (a tabela inteira tambem esbarraria no limite de linhas do PostgREST)."""
+        criadores = sorted({r["criado_por"] for r in linhas if r.get("criado_por") is not None})
+        if not criadores:
+            return {}
+        return self._usuarios_map(
+            self._consulta_usuarios_map(self.supabase).in_("id", criadores).execute()
+        )
+
+    def listar_relatorios_completo(self):
+        """Catalogo inteiro (linhas montadas, mais recentes primeiro), para ser
+        cacheado uma vez e filtrado por usuario com filtrar_relatorios_usuario."""
+        resp = (
+            self.supabase.table("relatorios").select(self._COLS_RELATORIO)
+            .eq("ativo", True).order("criado_em", desc=True)
+            .execute()
+        )
+        linhas = resp.data or []
+        user_map = self._mapa_criadores(linhas)
+        return [self._montar_relatorio(r, user_map) for r in linhas]
+
+    @staticmethod
+    def ordem_catalogo(r):
+        # Mais recentes primeiro, como listar_relatorios_completo.
+        return -ler_instante(r["criado_em"]).timestamp(), -r["id"]
+
+    @staticmethod
+    def marca_sincronizacao(instantes, marca=None):
+        """Maior instante (ISO) entre `instantes` e `marca`: de onde parte o
+        proximo delta do catalogo (sincronizar_catalogo)."""
+        vistos = [ler_instante(i) for i in instantes if i]
+        if marca:
+            vistos.append(ler_instante(marca))
+        return max(vistos).isoformat() if vistos else MARCA_INICIAL
+
+    def sincronizar_catalogo(self, desde):
+        """Delta do catalogo desde a marca `desde`: (relatorios criados ou
+        alterados, ids excluidos, nova marca). Le so as linhas com
+        atualizado_em posterior (indice parcial) e o log relatorios_exclusoes,
+        alimentado por trigger: o custo acompanha o volume de mudancas, nao o
+        tamanho do catalogo."""
+        limite = (ler_instante(desde) - timedelta(seconds=MARGEM_DELTA_S)).isoformat()
+        resp, exclusoes = self._async.reunir_sync(
+            lambda c: (
+                c.table("relatorios").select(self._COLS_RELATORIO)
+                .eq("ativo", True).gt("atualizado_em", limite)
+            ),
+            lambda c: (
+                c.table("relatorios_exclusoes").select("relatorio_id,excluido_em")
+                .gt("excluido_em", limite)
+            ),
+        )
+        linhas = resp.data or []
+        exclusoes = exclusoes.data or []
+        user_map = self._mapa_criadores(linhas)
+        marca = self.marca_sincronizacao(
+            [r.get("atualizado_em") for r in linhas] + [e["excluido_em"] for e in exclusoes],
+            desde,
+        )
+        return (
+            [self._montar_relatorio(r, user_map) for r in linhas],
+            [e["relatorio_id"] for e in exclusoes],
+            marca,
+        )
 
     def listar_relatorios_usuario(self, usuario):
+        areas = usuario.get("categorias_permitidas") or []
+        if not usuario["is_admin"] and not areas:
+            return []
+
         query = (
             self.supabase.table("relatorios")
             .select(self._COLS_RELATORIO)
+            .eq("ativo", True)
             .order("criado_em", desc=True)
         )
         if not usuario["is_admin"]:
-            areas = usuario.get("categorias_permitidas") or []
-            if not areas:
-                return []
             query = query.in_("categoria", areas)
-
-        resp = query.execute()
-        user_map = self._usuarios_map_por_id()
-        permitidos = set(usuario.get("relatorios_permitidos") or [])
-        nivel_user = usuario.get("nivel_hierarquia")
-
-        relatorios = []
-        for r in resp.data or []:
-            if not usuario["is_admin"]:
-                if not self._hierarquia_ok(nivel_user, r.get("nivel_hierarquia")):
-                    continue
-                if permitidos and r["id"] not in permitidos:
-                    continue
-            relatorios.append(self._montar_relatorio(r, user_map))
-        return relatorios
+        linhas = query.execute().data or []
+        user_map = self._mapa_criadores(linhas)
+        return self.filtrar_relatorios_usuario(
+            usuario, [self._montar_relatorio(r, user_map) for r in linhas]
+        )
 
     def obter_relatorio_por_id(self, relatorio_id, usuario=None):
         resp = (
-            self.supabase.table("relatorios")
-            .select(self._COLS_RELATORIO)
-            .eq("id", relatorio_id)
-            .limit(1)
+            self.supabase.table("relatorios").select(self._COLS_RELATORIO)
+            .eq("id", relatorio_id).eq("ativo", True).limit(1)
             .execute()
         )
         if not resp.data:
@@ -422,31 +1406,80 @@ class Database:
         # Defesa em profundidade: so devolve se o usuario tiver permissao de ver.
         if usuario is not None and not self._pode_ver_relatorio(usuario, r):
             return None
-        return self._montar_relatorio(r, self._usuarios_map_por_id())
+        # So o nome do criador deste relatorio, nao a tabela de usuarios.
+        user_map = {}
+        if r.get("criado_por") is not None:
+            user_map = self._usuarios_map(
+                self._consulta_usuarios_map(self.supabase).eq("id", r["criado_por"]).execute()
+            )
+        return self._montar_relatorio(r, user_map)
+
+    @staticmethod
+    def _montar_relatorio_basico(r):
+        return {
+            "id": r["id"],
+            "titulo": r["titulo"],
+            "categoria": r.get("categoria") or "GERAL",
+            "nivel_hierarquia": normalizar_nivel(r.get("nivel_hierarquia")),
+            "atualizado_em": r.get("atualizado_em") or r.get("criado_em"),
+        }
+
+    @staticmethod
+    def ordem_relatorio_basico(r):
+        return (r["categoria"], r["titulo"].lower())
 
     def listar_relatorios_basico(self):
         # Lista enxuta (id/titulo/categoria/nivel) para o multiselect de
         # liberacao individual na gestao de usuarios.
         resp = (
             self.supabase.table("relatorios")
-            .select("id,titulo,categoria,nivel_hierarquia")
+            .select(self._COLS_RELATORIO_BASICO)
+            .eq("ativo", True)
             .execute()
         )
-        rows = [
-            {
-                "id": r["id"],
-                "titulo": r["titulo"],
-                "categoria": r.get("categoria") or "GERAL",
-                "nivel_hierarquia": normalizar_nivel(r.get("nivel_hierarquia")),
-            }
-            for r in (resp.data or [])
-        ]
-        rows.sort(key=lambda r: (r["categoria"], r["titulo"].lower()))
+        rows = [self._montar_relatorio_basico(r) for r in (resp.data or [])]
+        rows.sort(key=self.ordem_relatorio_basico)
         return rows
 
+    _COLS_RELATORIO_BASICO = "id,titulo,categoria,nivel_hierarquia,criado_em,atualizado_em"
+
+    def buscar_relatorios_basico(self, termo="", categorias=None, nivel=None, limite=30):
+        """Typeahead do picker de liberacao individual: relatorios cujo titulo
+        ou categoria comeca com `termo`, ja restritos as `categorias` e ao
+        `nivel` do usuario sendo editado (so o que ele poderia ver)."""
+        query = self.supabase.table("relatorios").select(self._COLS_RELATORIO_BASICO).eq("ativo", True)
+        if categorias is not None:
+            if not categorias:
+                return []
+            query = query.in_("categoria", list(categorias))
+        if nivel is not None and normalizar_nivel(nivel) == "operacao":
+            query = query.eq("nivel_hierarquia", "operacao")
+        # Remove caracteres reservados da sintaxe de filtro do PostgREST/LIKE.
+        termo = re.sub(r'[,()"\\*%_:]', " ", termo or "").strip()
+        if termo:
+            query = query.or_(f"titulo.ilike.{termo}*,categoria.ilike.{termo}*")
+        resp = query.order("titulo").limit(limite).execute()
+        rows = [self._montar_relatorio_basico(r) for r in (resp.data or [])]
+        rows.sort(key=self.ordem_relatorio_basico)
+        return rows
+
+    def obter_relatorios_basico(self, ids):
+        """Linhas enxutas dos relatorios `ids` (hidrata rotulos ja liberados)."""
+        ids = self._parse_relatorios_permitidos(list(ids or []))
+        if not ids:
+            return []
+        resp = (
+            self.supabase.table("relatorios")
+            .select(self._COLS_RELATORIO_BASICO)
+            .in_("id", ids)
+            .eq("ativo", True)
+            .execute()
+        )
+        return [self._montar_relatorio_basico(r) for r in (resp.data or [])]
+
     def criar_relatorio(self, titulo, link_powerbi, descricao, categoria, criado_por,
                         nivel_hierarquia="operacao"):
-        self.supabase.table("relatorios").insert(
+        resp = self.supabase.table("relatorios").insert(
             {
                 "titulo": titulo,
                 "link_powerbi": link_powerbi,
@@ -456,11 +1489,12 @@ class Database:
                 "criado_por": criado_por,
             }
         ).execute()
-        return True
+        # Devolve a linha enxuta gravada (write-through no catalogo do app).
+        return self._montar_relatorio_basico(resp.data[0]) if resp.data else True
 
     def atualizar_relatorio(self, relatorio_id, titulo, link_powerbi, descricao, categoria,
                            nivel_hierarquia="operacao"):
-        (
+        resp = (
             self.supabase.table("relatorios")
             .update(
                 {
@@ -474,70 +1508,176 @@ class Database:
             .eq("id", relatorio_id)
             .execute()
         )
-        return True
+        return self._montar_relatorio_basico(resp.data[0]) if resp.data else True
+
+    @staticmethod
+    def _marca_exclusao():
+        # excluido_em fica com o now() do banco (trigger marcar_excluido_em).
+        return {"ativo": False}
 
     def excluir_relatorio(self, relatorio_id):
-        self.supabase.table("relatorios").delete().eq("id", relatorio_id).execute()
+        # Exclusao logica: so marca a linha (sem tocar nas FKs de logs_acesso);
+        # a remocao fisica fica para scripts/purgar_inativos.py, em lotes.
+        (
+            self.supabase.table("relatorios")
+            .update(self._marca_exclusao())
+            .eq("id", relatorio_id)
+            .eq("ativo", True)
+            .execute()
+        )
         return True
 
-    # -------------------------------------------------------------- usuarios
-    def listar_usuarios(self):
+    # --------------------------------------------------------------- acessos
+    def registrar_acesso(self, usuario_id, relatorio_id):
+        self.supabase.table("logs_acesso").insert(
+            {"usuario_id": usuario_id, "relatorio_id": relatorio_id}
+        ).execute()
+        return True
+
+    def atualizar_rollups_acesso(self):
+        """Agrega (incremental, a partir da marca d'agua) os logs novos nas
+        tabelas por relatorio/dia e usuario/dia. Devolve quantos ids avancou."""
+        resp = self.supabase.rpc("atualizar_rollups_acesso").execute()
+        return int(resp.data or 0)
+
+    # ---------------------------------------------------------------- links
+    _COLS_LINK_STATUS = "relatorio_id,situacao,http_status,latencia_ms,host,erro,verificado_em"
+
+    def links_para_verificar(self):
+        resp = self.supabase.table("relatorios").select("id,link_powerbi").eq("ativo", True).execute()
+        return resp.data or []
+
+    def registrar_status_links(self, resultados):
+        """Grava (upsert por relatorio) o resultado de uma varredura."""
+        colunas = self._COLS_LINK_STATUS.split(",")
+        linhas = [{c: r.get(c) for c in colunas} for r in resultados]
+        if linhas:
+            self.supabase.table("links_status").upsert(linhas, on_conflict="relatorio_id").execute()
+        return True
+
+    def status_links(self):
+        """{relatorio_id: ultima verificacao do link}."""
+        resp = self.supabase.table("links_status").select(self._COLS_LINK_STATUS).execute()
+        return {r["relatorio_id"]: r for r in (resp.data or [])}
+
+    def ultima_verificacao_links(self):
         resp = (
+            self.supabase.table("links_status")
+            .select("verificado_em")
+            .order("verificado_em", desc=True)
+            .limit(1)
+            .execute()
+        )
+        return resp.data[0]["verificado_em"] if resp.data else None
+
+    @staticmethod
+    def _por_id(rows, chave):
+        return {
+            int(r[chave]): {"acessos": int(r.get("acessos") or 0), "ultimo_dia": r.get("ultimo_dia")}
+            for r in (rows or [])
+            if r.get(chave) is not None
+        }
+
+    def popularidade_relatorios(self, dias=30):
+        """{relatorio_id: {"acessos", "ultimo_dia"}} nos ultimos `dias`, lido
+        dos agregados (nao varre logs_acesso)."""
+        resp = self.supabase.rpc("popularidade_relatorios", {"p_dias": int(dias)}).execute()
+        return self._por_id(resp.data, "relatorio_id")
+
+    def atividade_usuarios(self, dias=30):
+        """{usuario_id: {"acessos", "ultimo_dia"}} nos ultimos `dias`."""
+        resp = self.supabase.rpc("atividade_usuarios", {"p_dias": int(dias)}).execute()
+        return self._por_id(resp.data, "usuario_id")
+
+    # -------------------------------------------------------------- usuarios
+    @staticmethod
+    def _escapar_like(texto):
+        # Escapa curingas do LIKE para a busca por prefixo ser literal.
+        return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+    def _montar_usuario(self, u):
+        is_admin = bool(u.get("is_admin", False))
+        efetivas = u.get("permissoes_efetivas")
+        if not isinstance(efetivas, dict):
+            efetivas = None
+        return Usuario(
+            id=u["id"],
+            username=u["username"],
+            is_admin=is_admin,
+            nivel_hierarquia=normalizar_nivel(u.get("nivel_hierarquia")),
+            categorias_permitidas=self._parse_categorias(
+                u.get("categorias_permitidas"), is_admin
+            ),
+            relatorios_permitidos=self._parse_relatorios_permitidos(
+                u.get("relatorios_permitidos")
+            ),
+            criado_em=u.get("criado_em"),
+            grupos=self._parse_relatorios_permitidos((efetivas or {}).get("grupos") or []),
+            concessoes=self._concessoes(
+                efetivas, u.get("nivel_hierarquia"), u.get("categorias_permitidas"),
+                u.get("relatorios_permitidos"),
+            ),
+        )
+
+    def listar_usuarios(self, busca="", is_admin=None, nivel=None, area=None,
+                        pagina=1, por_pagina=None):
+        """Lista usuarios com filtros e paginacao no servidor.
+
+        - `busca`: prefixo do username (sem diferenciar maiusculas);
+        - `is_admin`/`nivel`/`area`: filtros opcionais (None = todos);
+        - `pagina`/`por_pagina`: pagina 1-based; `por_pagina` None = sem limite.
+
+        Devolve (usuarios, total), onde `total` e a contagem com os filtros."""
+        query = (
             self.supabase.table("usuarios")
-            .select(
-                "id,username,is_admin,nivel_hierarquia,"
-                "categorias_permitidas,relatorios_permitidos,criado_em"
-            )
+            .select(self._COLS_USUARIO, count="exact")
+            .eq("ativo", True)
             .order("criado_em", desc=True)
-            .execute()
+            .order("id", desc=True)
         )
-        usuarios = []
-        for u in resp.data or []:
-            is_admin = bool(u.get("is_admin", False))
-            usuarios.append(
-                {
-                    "id": u["id"],
-                    "username": u["username"],
-                    "is_admin": is_admin,
-                    "nivel_hierarquia": normalizar_nivel(u.get("nivel_hierarquia")),
-                    "categorias_permitidas": self._parse_categorias(
-                        u.get("categorias_permitidas"), is_admin
-                    ),
-                    "relatorios_permitidos": self._parse_relatorios_permitidos(
-                        u.get("relatorios_permitidos")
-                    ),
-                    "criado_em": u.get("criado_em"),
-                }
-            )
-        return usuarios
+        busca = (busca or "").strip()
+        if busca:
+            query = query.ilike("username", self._escapar_like(busca) + "%")
+        if is_admin is not None:
+            query = query.eq("is_admin", bool(is_admin))
+        if nivel:
+            query = query.eq("nivel_hierarquia", normalizar_nivel(nivel))
+        if area:
+            query = query.contains("categorias_permitidas", [area])
+        if por_pagina:
+            inicio = (max(int(pagina), 1) - 1) * por_pagina
+            query = query.range(inicio, inicio + por_pagina - 1)
+
+        resp = query.execute()
+        usuarios = [self._montar_usuario(u) for u in (resp.data or [])]
+        total = resp.count if resp.count is not None else len(usuarios)
+        return usuarios, total
 
     def obter_usuario_por_id(self, usuario_id):
         resp = (
             self.supabase.table("usuarios")
-            .select(
-                "id,username,is_admin,nivel_hierarquia,"
-                "categorias_permitidas,relatorios_permitidos"
-            )
+            .select(self._COLS_USUARIO)
             .eq("id", usuario_id)
+            .eq("ativo", True)
             .limit(1)
             .execute()
         )
         if not resp.data:
             return None
-        u = resp.data[0]
-        is_admin = bool(u.get("is_admin", False))
-        return {
-            "id": u["id"],
-            "username": u["username"],
-            "is_admin": is_admin,
-            "nivel_hierarquia": normalizar_nivel(u.get("nivel_hierarquia")),
-            "categorias_permitidas": self._parse_categorias(
-                u.get("categorias_permitidas"), is_admin
-            ),
-            "relatorios_permitidos": self._parse_relatorios_permitidos(
-                u.get("relatorios_permitidos")
-            ),
-        }
+        return self._montar_usuario(resp.data[0])
+
+    def obter_usuarios_por_ids(self, ids):
+        ids = self._parse_relatorios_permitidos(list(ids or []))
+        if not ids:
+            return []
+        resp = (
+            self.supabase.table("usuarios")
+            .select(self._COLS_USUARIO)
+            .in_("id", ids)
+            .eq("ativo", True)
+            .execute()
+        )
+        return [self._montar_usuario(u) for u in (resp.data or [])]
 
     def criar_usuario_portal(self, username, senha, is_admin=False, nivel_hierarquia="operacao",
                             categorias_permitidas=None, relatorios_permitidos=None):
@@ -551,7 +1691,7 @@ class Database:
                 categorias_permitidas = ["GERAL"]
             relatorios_permitidos = self._parse_relatorios_permitidos(relatorios_permitidos or [])
 
-        self.supabase.table("usuarios").insert(
+        resp = self.supabase.table("usuarios").insert(
             {
                 "username": username,
                 "password_hash": self.hash_password(senha),
@@ -561,7 +1701,8 @@ class Database:
                 "relatorios_permitidos": relatorios_permitidos,
             }
         ).execute()
-        return True
+        # Devolve a linha gravada (para write-through nos caches do app).
+        return self._montar_usuario(resp.data[0]) if resp.data else True
 
     def atualizar_usuario_portal(self, usuario_id, username=None, is_admin=None,
                                 nivel_hierarquia=None, categorias_permitidas=None,
@@ -590,8 +1731,45 @@ class Database:
 
         if not updates:
             return True
-        self.supabase.table("usuarios").update(updates).eq("id", usuario_id).execute()
-        return True
+        resp = self.supabase.table("usuarios").update(updates).eq("id", usuario_id).execute()
+        return self._montar_usuario(resp.data[0]) if resp.data else True
+
+    def alterar_permissoes_em_massa(self, acao, valor, busca="", nivel=None, area=None,
+                                    ids=None, simular=False):
+        """Aplica uma alteracao de permissao a todos os usuarios comuns ativos
+        que casam com os filtros (`busca`/`nivel`/`area`, como em
+        listar_usuarios, e/ou `ids`) em um unico UPDATE no banco.
+
+        `valor`: lista de areas (adicionar_areas/remover_areas), nivel
+        (definir_nivel) ou lista de ids de relatorio (liberar_relatorios/
+        revogar_relatorios). Com `simular`, nada e gravado.
+
+        Devolve os usuarios que mudam, ja com os valores novos."""
+        if acao not in ACOES_EM_MASSA:
+            raise ValueError(f"Acao em massa desconhecida: {acao}")
+        if acao == "definir_nivel":
+            valor = normalizar_nivel(valor)
+        elif acao.endswith("_areas"):
+            valor = list(dict.fromkeys(a for a in (valor or []) if a in CATEGORIAS_PADRAO))
+        else:
+            valor = list(dict.fromkeys(self._parse_relatorios_permitidos(list(valor or []))))
+        if not valor:
+            raise ValueError("Informe ao menos um valor para a alteracao em massa.")
+
+        busca = (busca or "").strip()
+        resp = self.supabase.rpc(
+            "permissoes_em_massa",
+            {
+                "p_acao": acao,
+                "p_valor": valor,
+                "p_busca": self._escapar_like(busca) + "%" if busca else None,
+                "p_nivel": normalizar_nivel(nivel) if nivel else None,
+                "p_area": area or None,
+                "p_ids": self._parse_relatorios_permitidos(list(ids)) if ids is not None else None,
+                "p_simular": bool(simular),
+            },
+        ).execute()
+        return [self._montar_usuario(u) for u in (resp.data or [])]
 
     def atualizar_senha_portal(self, usuario_id, nova_senha):
         (
@@ -603,5 +1781,107 @@ class Database:
         return True
 
     def excluir_usuario(self, usuario_id):
-        self.supabase.table("usuarios").delete().eq("id", usuario_id).execute()
+        # Exclusao logica (ver excluir_relatorio). O username fica livre na
+        # hora: a unicidade so vale entre usuarios ativos.
+        (
+            self.supabase.table("usuarios")
+            .update(self._marca_exclusao())
+            .eq("id", usuario_id)
+            .eq("ativo", True)
+            .execute()
+        )
+        return True
+
+    # --------------------------------------------------------------- grupos
+    _COLS_GRUPO = (
+        "id,nome,descricao,nivel_hierarquia,categorias_permitidas,"
+        "relatorios_permitidos,atualizado_em"
+    )
+
+    def _montar_grupo(self, g):
+        membros = g.get("usuarios_grupos")
+        return {
+            "id": g["id"],
+            "nome": g["nome"],
+            "descricao": g.get("descricao") or "",
+            "nivel_hierarquia": normalizar_nivel(g.get("nivel_hierarquia")),
+            "categorias_permitidas": self._parse_categorias(g.get("categorias_permitidas")),
+            "relatorios_permitidos": self._parse_relatorios_permitidos(
+                g.get("relatorios_permitidos")
+            ),
+            "atualizado_em": g.get("atualizado_em"),
+            # Contagem embutida do PostgREST: [{"count": n}].
+            "membros": membros[0].get("count", 0) if membros else 0,
+        }
+
+    def _dados_grupo(self, nome, descricao, nivel_hierarquia, categorias_permitidas,
+                     relatorios_permitidos):
+        return {
+            "nome": nome.strip(),
+            "descricao": (descricao or "").strip() or None,
+            "nivel_hierarquia": normalizar_nivel(nivel_hierarquia),
+            "categorias_permitidas": list(categorias_permitidas or []),
+            "relatorios_permitidos": self._parse_relatorios_permitidos(relatorios_permitidos or []),
+        }
+
+    def listar_grupos(self):
+        resp = (
+            self.supabase.table("grupos_acesso")
+            .select(f"{self._COLS_GRUPO},usuarios_grupos(count)")
+            .order("nome")
+            .execute()
+        )
+        return [self._montar_grupo(g) for g in (resp.data or [])]
+
+    def criar_grupo(self, nome, descricao="", nivel_hierarquia="operacao",
+                    categorias_permitidas=None, relatorios_permitidos=None):
+        resp = self.supabase.table("grupos_acesso").insert(
+            self._dados_grupo(nome, descricao, nivel_hierarquia, categorias_permitidas,
+                              relatorios_permitidos)
+        ).execute()
+        return self._montar_grupo(resp.data[0]) if resp.data else True
+
+    def atualizar_grupo(self, grupo_id, nome, descricao, nivel_hierarquia,
+                        categorias_permitidas, relatorios_permitidos):
+        # Os triggers recalculam as permissoes efetivas dos membros (um
+        # UPDATE em conjunto, so nas linhas que mudam).
+        resp = (
+            self.supabase.table("grupos_acesso")
+            .update(self._dados_grupo(nome, descricao, nivel_hierarquia,
+                                      categorias_permitidas, relatorios_permitidos))
+            .eq("id", grupo_id)
+            .execute()
+        )
+        return self._montar_grupo(resp.data[0]) if resp.data else True
+
+    def excluir_grupo(self, grupo_id):
+        # As associacoes caem em cascata e o trigger de usuarios_grupos
+        # recalcula os ex-membros.
+        self.supabase.table("grupos_acesso").delete().eq("id", grupo_id).execute()
         return True
+
+    def definir_grupos_usuario(self, usuario_id, grupo_ids, atuais=()):
+        """Deixa o usuario exatamente nos grupos `grupo_ids`, gravando so a
+        diferenca para `atuais`. Devolve o usuario com as permissoes efetivas
+        ja recalculadas pelos triggers (None se nada mudou)."""
+        novos = set(self._parse_relatorios_permitidos(list(grupo_ids)))
+        atuais = set(self._parse_relatorios_permitidos(list(atuais)))
+        if novos == atuais:
+            return None
+        remover = sorted(atuais - novos)
+        inserir = sorted(novos - atuais)
+        if remover:
+            (
+                self.supabase.table("usuarios_grupos")
+                .delete()
+                .eq("usuario_id", usuario_id)
+                .in_("grupo_id", remover)
+                .execute()
+            )
+        if inserir:
+            self.supabase.table("usuarios_grupos").upsert(
+                [{"usuario_id": usuario_id, "grupo_id": g} for g in inserir],
+                on_conflict="usuario_id,grupo_id",
+                ignore_duplicates=True,
+            ).execute()
+        return self.obter_usuario_por_id(usuario_id) or True
@@ -0,0 +1,68 @@
+"""Consultas assincronas ao Supabase, usadas pelo `Database` sincrono.
+
+Leituras independentes (boot, delta do catalogo + exclusoes, etc.) rodam em
+paralelo com `asyncio.gather`, limitadas por um semaforo para nao abrir
+conexoes demais no PostgREST: o tempo total vira o da consulta mais lenta, nao
+a soma. O Streamlit roda o script em threads sem event loop, entao o
+`DatabaseAsync` mantem um loop proprio em uma thread daemon e `executar(coro)`
+bloqueia a thread chamadora ate o resultado (fachada sincrona).
+
+As consultas sao passadas como fabricas `cliente -> query builder`, porque o
+`AsyncClient` so existe dentro do loop.
+"""
+
+import asyncio
+import threading
+
+MAX_CONSULTAS_SIMULTANEAS = 6
+TIMEOUT_PADRAO_S = 60
+
+
+class DatabaseAsync:
+    def __init__(self, url, key, max_simultaneas=MAX_CONSULTAS_SIMULTANEAS):
+        self._url = url
+        self._key = key
+        self._cliente = None
+        # Criados uma vez aqui (no 3.10+ so se prendem ao loop no primeiro uso):
+        # consultas concorrentes no primeiro acesso nao montam semaforos
+        # separados, e o lock garante um AsyncClient so.
+        self._semaforo = asyncio.Semaphore(max_simultaneas)
+        self._lock_cliente = asyncio.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="db-async", daemon=True
+        )
+        self._thread.start()
+
+    # ------------------------------------------------------- fachada sync
+    def executar(self, coro, timeout=TIMEOUT_PADRAO_S):
+        """Roda `coro` no loop dedicado e devolve o resultado (bloqueante)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def fechar(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    # ------------------------------------------------------------ consultas
+    async def _obter_cliente(self):
+        if self._cliente is None:
+            async with self._lock_cliente:
+                if self._cliente is None:
+                    from supabase import acreate_client
+
+                    self._cliente = await acreate_client(self._url, self._key)
+        return self._cliente
+
+    async def consulta(self, fabrica):
+        """Executa uma consulta (`fabrica(cliente)` -> builder) respeitando o
+        limite de consultas simultaneas."""
+        cliente = await self._obter_cliente()
+        async with self._semaforo:
+            return await fabrica(cliente).execute()
+
+    async def reunir(self, *fabricas):
+        """Executa as consultas em paralelo; respostas na ordem das fabricas.
+        A primeira excecao e propagada."""
+        return await asyncio.gather(*(self.consulta(f) for f in fabricas))
+
+    def reunir_sync(self, *fabricas):
+        return self.executar(self.reunir(*fabricas))
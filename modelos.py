@@ -0,0 +1,197 @@
+"""Modelos imutaveis das linhas de relatorio e usuario.
+
+Cada linha do banco vira um objeto com `__slots__` montado uma vez (em
+database.py) e compartilhado por caches e sessoes, em vez de um dict por
+consulta:
+
+- categorias e niveis sao internados (`sys.intern`): milhares de linhas
+  apontam para as mesmas poucas strings;
+- permissoes ficam em frozensets e as concessoes ja no formato de avaliacao,
+  sem remontar conjuntos a cada filtro;
+- a data de criacao formatada para a tela (`criado_em_fmt`) e calculada na
+  carga, nao a cada card de cada rerun.
+
+A leitura continua aceitando `linha["campo"]` e `linha.get("campo")`, como os
+dicts de antes. Para o cache compartilhado (JSON) use `para_dict()` /
+`de_dict()`; para "alterar" um campo, `substituir(campo=valor)` devolve outra
+instancia.
+"""
+
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Fuso de Brasilia (UTC-3, sem horario de verao desde 2019).
+_TZ_BR = timezone(timedelta(hours=-3))
+
+
+# Fracao de segundo do timestamptz: o Postgres corta os zeros a direita
+# ("10:00:30.12345+00:00") e o fromisoformat do Python 3.10 so aceita 3 ou 6
+# digitos.
+_FRACAO = re.compile(r"\.(\d{1,6})(?=[+-]|$)")
+
+
+def ler_instante(valor):
+    """datetime de um timestamp ISO do Supabase/Postgres (aceita "Z" e fracao
+    de segundo com qualquer numero de digitos ate 6). ValueError se nao for
+    uma data."""
+    texto = str(valor).replace("Z", "+00:00")
+    texto = _FRACAO.sub(lambda m: "." + m.group(1).ljust(6, "0"), texto, count=1)
+    return datetime.fromisoformat(texto)
+
+
+def fmt_data(valor):
+    """Formata datas do Supabase (ISO/UTC) em dd/mm/aaaa hh:mm (horario de Brasilia)."""
+    if not valor:
+        return "—"
+    try:
+        dt = valor
+        if isinstance(valor, str):
+            dt = ler_instante(valor)
+        if getattr(dt, "tzinfo", None) is not None:
+            dt = dt.astimezone(_TZ_BR)
+        return dt.strftime("%d/%m/%Y %H:%M")
+    except Exception:  # noqa: BLE001  (formato inesperado: mostra o cru)
+        return str(valor)[:16].replace("T", " ")
+
+
+def _internar(valor):
+    return sys.intern(valor) if isinstance(valor, str) else valor
+
+
+def _ids(valores):
+    return frozenset(int(v) for v in (valores or ()))
+
+
+class Modelo:
+    """Base: campos em `__slots__`, imutavel, leitura tambem por chave."""
+
+    __slots__ = ()
+    # Campos calculados na montagem: ficam fora de para_dict()/de_dict().
+    DERIVADOS = ()
+
+    def __init__(self, **campos):
+        for nome in self.__slots__:
+            if nome not in self.DERIVADOS:
+                object.__setattr__(self, nome, campos.get(nome))
+
+    def __setattr__(self, nome, valor):
+        raise AttributeError(f"{type(self).__name__} e imutavel; use substituir()")
+
+    def __delattr__(self, nome):
+        raise AttributeError(f"{type(self).__name__} e imutavel")
+
+    # ------------------------------------------------------- leitura por chave
+    def __getitem__(self, campo):
+        try:
+            return getattr(self, campo)
+        except (AttributeError, TypeError):
+            raise KeyError(campo) from None
+
+    def get(self, campo, padrao=None):
+        return getattr(self, campo, padrao) if isinstance(campo, str) else padrao
+
+    def __contains__(self, campo):
+        return campo in self.__slots__
+
+    def keys(self):
+        return self.__slots__
+
+    # ------------------------------------------------------------ conversao
+    def _campos(self):
+        return {n: getattr(self, n) for n in self.__slots__ if n not in self.DERIVADOS}
+
+    def substituir(self, **mudancas):
+        """Copia com `mudancas` aplicadas (os derivados sao recalculados)."""
+        return type(self)(**{**self._campos(), **mudancas})
+
+    def para_dict(self):
+        """Campos em tipos JSON (frozenset/tuple viram listas ordenadas)."""
+        return {n: _para_json(v) for n, v in self._campos().items()}
+
+    @classmethod
+    def de_dict(cls, dados):
+        return cls(**{n: dados.get(n) for n in cls.__slots__ if n not in cls.DERIVADOS})
+
+    def __reduce__(self):
+        # Pickle/deepcopy (st.cache_data, AppTest) sem passar pelo __setattr__.
+        return (type(self).de_dict, (self._campos(),))
+
+    def __eq__(self, outro):
+        return type(outro) is type(self) and self._campos() == outro._campos()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={self.id!r})"
+
+
+def _para_json(valor):
+    if isinstance(valor, frozenset):
+        return sorted(valor)
+    if isinstance(valor, tuple):
+        return [_para_json(v) for v in valor]
+    return valor
+
+
+class Relatorio(Modelo):
+    """Relatorio montado para o catalogo/dashboard (com o nome do criador)."""
+
+    __slots__ = (
+        "id", "titulo", "link_powerbi", "descricao", "categoria", "nivel_hierarquia",
+        "criado_por", "criado_em", "atualizado_em", "criador", "criado_em_fmt",
+    )
+    DERIVADOS = ("criado_em_fmt",)
+
+    def __init__(self, **campos):
+        super().__init__(**campos)
+        _set = object.__setattr__
+        _set(self, "categoria", _internar(self.categoria))
+        _set(self, "nivel_hierarquia", _internar(self.nivel_hierarquia))
+        _set(self, "criado_em_fmt", fmt_data(self.criado_em))
+
+
+class Usuario(Modelo):
+    """Usuario montado (lista de gestao, edicao e sessao autenticada).
+
+    `categorias_permitidas` e uma tupla (a ordem e a de exibicao);
+    `relatorios_permitidos` e `grupos` sao frozensets de ids; `concessoes`
+    e uma tupla de (areas frozenset, nivel, relatorios frozenset), pronta
+    para avaliar muitos relatorios (Database._concessoes_liberam)."""
+
+    __slots__ = (
+        "id", "username", "is_admin", "nivel_hierarquia", "categorias_permitidas",
+        "relatorios_permitidos", "criado_em", "grupos", "concessoes", "autenticado",
+        "criado_em_fmt",
+    )
+    DERIVADOS = ("criado_em_fmt",)
+
+    def __init__(self, **campos):
+        super().__init__(**campos)
+        _set = object.__setattr__
+        _set(self, "is_admin", bool(self.is_admin))
+        _set(self, "autenticado", bool(self.autenticado))
+        _set(self, "nivel_hierarquia", _internar(self.nivel_hierarquia))
+        _set(self, "categorias_permitidas",
+             tuple(_internar(a) for a in (self.categorias_permitidas or ())))
+        _set(self, "relatorios_permitidos", _ids(self.relatorios_permitidos))
+        _set(self, "grupos", _ids(self.grupos))
+        _set(self, "concessoes", tuple(_concessao(c) for c in (self.concessoes or ())))
+        _set(self, "criado_em_fmt", fmt_data(self.criado_em))
+
+    def para_dict(self):
+        dados = super().para_dict()
+        dados["concessoes"] = [
+            {"areas": sorted(areas), "nivel": nivel, "relatorios": sorted(relatorios)}
+            for areas, nivel, relatorios in self.concessoes
+        ]
+        return dados
+
+
+def _concessao(c):
+    """(areas, nivel, relatorios) a partir da tupla ou do dict do JSON."""
+    if isinstance(c, dict):
+        areas, nivel, relatorios = c.get("areas"), c.get("nivel"), c.get("relatorios")
+    else:
+        areas, nivel, relatorios = c
+    return (frozenset(_internar(a) for a in (areas or ())), _internar(nivel), _ids(relatorios))
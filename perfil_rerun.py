@@ -0,0 +1,397 @@
+"""Perfil sob demanda dos reruns de uma sessao do portal (so admin).
+
+Quando o portal fica lento para um usuario especifico, nao dava para ver onde
+o tempo vai dentro de um rerun do app.py. Aqui um admin escolhe a sessao em
+"Minha conta" e arma o perfil dos proximos N reruns dela. Em cada rerun armado:
+
+- uma thread amostra a pilha da thread do script a cada `INTERVALO_AMOSTRA_S`
+  (perfil por amostragem: nada e instrumentado funcao a funcao);
+- o app marca secoes (tema, sidebar, cabecalho, ramo do menu, fragmentos) e
+  cada chamada ao `Database`, com o tempo de parede de cada uma;
+- o `st.session_state` e medido no inicio e no fim, com as chaves que mais
+  cresceram.
+
+O resultado sai no formato do speedscope (https://www.speedscope.app): por
+rerun, um perfil de secoes e um de amostras, vistos como flame graph.
+
+Sessoes, armacoes e capturas ficam no processo: o admin so enxerga as
+sessoes atendidas pela mesma replica. Rerun nao armado custa um lookup em
+dict no topo do script e em cada chamada ao banco.
+"""
+
+import json
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+INTERVALO_AMOSTRA_S = 0.005
+MAX_RERUNS = 20
+# Sessoes sem rerun ha mais que isso saem da lista de escolha.
+SESSAO_ATIVA_S = 30 * 60
+# Capturas guardadas no processo (as mais antigas saem primeiro).
+MAX_CAPTURAS = 100
+# Rerun preso nao acumula amostras para sempre.
+MAX_AMOSTRAS = 20000
+# Teto de objetos visitados ao medir o session_state.
+MAX_OBJETOS_MEDIDOS = 200_000
+
+_ATIVAS = {}  # id da thread do script -> CapturaRerun em andamento
+_ativas_lock = threading.Lock()
+
+
+class _SemPerfil:
+    """Rerun sem perfil: secoes e chamadas passam direto."""
+
+    def secao(self, _nome):
+        return nullcontext()
+
+    def abrir(self, _nome):
+        pass
+
+    def envolver(self, _nome, valor):
+        return valor
+
+
+SEM_PERFIL = _SemPerfil()
+
+
+def captura_atual():
+    """Captura em andamento na thread atual (ou SEM_PERFIL)."""
+    return _ATIVAS.get(threading.get_ident(), SEM_PERFIL)
+
+
+def _tamanho(obj, vistos):
+    """Bytes aproximados de `obj` e do que ele referencia (sem repetir os
+    objetos ja em `vistos`)."""
+    total = 0
+    pendentes = [obj]
+    while pendentes and len(vistos) < MAX_OBJETOS_MEDIDOS:
+        o = pendentes.pop()
+        if id(o) in vistos or isinstance(o, (type, types.ModuleType, types.FunctionType)):
+            continue
+        vistos.add(id(o))
+        total += sys.getsizeof(o, 0)
+        if isinstance(o, dict):
+            pendentes.extend(o.keys())
+            pendentes.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            pendentes.extend(o)
+        elif not isinstance(o, (str, bytes, int, float, bool)):
+            # object.__getattribute__: nunca cai num __getattr__ do objeto
+            # (ex.: proxy que conectaria ao banco).
+            nomes = ["__dict__"]
+            for cls in type(o).__mro__:
+                slots = cls.__dict__.get("__slots__", ())
+                nomes.extend((slots,) if isinstance(slots, str) else slots)
+            for nome in nomes:
+                try:
+                    pendentes.append(object.__getattribute__(o, nome))
+                except (AttributeError, TypeError):
+                    pass
+    return total
+
+
+def _medir_estado(estado):
+    """{chave: bytes} do session_state. Objeto referenciado por mais de uma
+    chave (ou compartilhado com os caches) conta uma vez, na primeira."""
+    if estado is None:
+        return {}
+    try:
+        itens = estado.filtered_state
+    except Exception:  # noqa: BLE001  (sessao encerrada no meio da medicao)
+        return {}
+    vistos = set()
+    return {str(chave): _tamanho(valor, vistos) for chave, valor in itens.items()}
+
+
+def _chave_frame(frame):
+    codigo = frame.f_code
+    return (getattr(codigo, "co_qualname", codigo.co_name), codigo.co_filename,
+            codigo.co_firstlineno)
+
+
+class CapturaRerun:
+    """Um rerun perfilado: eventos de secao, amostras da pilha e session_state."""
+
+    def __init__(self, sessao_id, username, origem, raiz, estado, ao_concluir,
+                 intervalo_s=INTERVALO_AMOSTRA_S):
+        self.sessao_id = sessao_id
+        self.username = username
+        self.origem = origem  # "script" ou o nome do fragmento
+        self.inicio_em = time.time()
+        self.duracao_ms = None
+        self.eventos = []   # ("O" | "C", secao, ms desde o inicio)
+        self.amostras = []  # (pilha de _chave_frame da raiz a folha, peso ms)
+        self.estado_antes = _medir_estado(estado)
+        self.estado_depois = {}
+        self._t0 = time.perf_counter()
+        self._thread_id = threading.get_ident()
+        # Frame do script (ou do fragmento): quando sai da pilha, o rerun acabou.
+        self._raiz = raiz
+        self._estado = estado
+        self._ao_concluir = ao_concluir
+        self._intervalo_s = intervalo_s
+        self._abertas = []
+        self._lock = threading.Lock()
+        self._fim = threading.Event()
+
+    def _agora_ms(self):
+        return (time.perf_counter() - self._t0) * 1000
+
+    # ------------------------------------------------------------- secoes
+    def abrir(self, nome):
+        """Abre a secao `nome` ate o fim do rerun (ex.: ramo do menu)."""
+        with self._lock:
+            if not self._fim.is_set():
+                self._abertas.append(nome)
+                self.eventos.append(("O", nome, self._agora_ms()))
+
+    def _fechar(self, nome):
+        # Fecha tambem o que foi aberto dentro e ficou aberto (abrir()).
+        with self._lock:
+            if self._fim.is_set():
+                return
+            agora = self._agora_ms()
+            while self._abertas:
+                topo = self._abertas.pop()
+                self.eventos.append(("C", topo, agora))
+                if topo == nome:
+                    break
+
+    @contextmanager
+    def secao(self, nome):
+        self.abrir(nome)
+        try:
+            yield
+        finally:
+            self._fechar(nome)
+
+    def envolver(self, nome, valor):
+        """`valor` chamavel vira uma secao `nome` por chamada, enquanto o
+        rerun estiver em andamento e na thread do script."""
+        if not callable(valor):
+            return valor
+
+        def envolvida(*args, **kwargs):
+            if self._fim.is_set() or threading.get_ident() != self._thread_id:
+                return valor(*args, **kwargs)
+            with self.secao(nome):
+                return valor(*args, **kwargs)
+        return envolvida
+
+    # --------------------------------------------------------- amostragem
+    def em_andamento_em(self, frame):
+        """True se `frame` roda dentro do rerun desta captura."""
+        while frame is not None:
+            if frame is self._raiz:
+                return not self._fim.is_set()
+            frame = frame.f_back
+        return False
+
+    def iniciar(self):
+        threading.Thread(target=self._amostrar, name="perfil-rerun", daemon=True).start()
+
+    def _amostrar(self):
+        anterior = time.perf_counter()
+        while not self._fim.wait(self._intervalo_s):
+            frame = sys._current_frames().get(self._thread_id)
+            pilha = []
+            while frame is not None and frame is not self._raiz:
+                pilha.append(frame)
+                frame = frame.f_back
+            if frame is None:
+                break  # a raiz saiu da pilha: rerun terminou (fim, st.stop, st.rerun)
+            agora = time.perf_counter()
+            if len(self.amostras) < MAX_AMOSTRAS:
+                pilha.append(frame)
+                self.amostras.append((
+                    tuple(_chave_frame(f) for f in reversed(pilha)), (agora - anterior) * 1000,
+                ))
+            anterior = agora
+            del pilha, frame
+        self.concluir()
+
+    def concluir(self):
+        """Fecha a captura (idempotente): secoes abertas, session_state final."""
+        with self._lock:
+            if self._fim.is_set():
+                return
+            self.duracao_ms = self._agora_ms()
+            while self._abertas:
+                self.eventos.append(("C", self._abertas.pop(), self.duracao_ms))
+            self._fim.set()
+        with _ativas_lock:
+            if _ATIVAS.get(self._thread_id) is self:
+                del _ATIVAS[self._thread_id]
+        self.estado_depois = _medir_estado(self._estado)
+        self._raiz = self._estado = None
+        self._ao_concluir(self)
+
+    @contextmanager
+    def rerun(self):
+        """Rerun que a propria captura delimita (rerun so de um fragmento)."""
+        try:
+            with self.secao(self.origem):
+                yield
+        finally:
+            self.concluir()
+
+    # ------------------------------------------------------------- resumo
+    def secoes_ms(self):
+        """{secao: (ms de parede somados, chamadas)}, tempo inclusivo."""
+        abertas = []
+        totais = {}
+        for tipo, nome, em in self.eventos:
+            if tipo == "O":
+                abertas.append(em)
+                continue
+            ms, chamadas = totais.get(nome, (0.0, 0))
+            totais[nome] = (ms + em - abertas.pop(), chamadas + 1)
+        return totais
+
+    def crescimento_estado(self, top=5):
+        """Bytes a mais no session_state no fim do rerun e as `top` chaves
+        que mais cresceram [(chave, bytes)]."""
+        total = sum(self.estado_depois.values()) - sum(self.estado_antes.values())
+        deltas = (
+            (chave, tamanho - self.estado_antes.get(chave, 0))
+            for chave, tamanho in self.estado_depois.items()
+        )
+        return total, sorted((d for d in deltas if d[1] > 0), key=lambda d: -d[1])[:top]
+
+
+class Perfilador:
+    """Registro do processo: sessoes vistas, sessoes armadas e capturas."""
+
+    def __init__(self, intervalo_s=INTERVALO_AMOSTRA_S):
+        self.intervalo_s = intervalo_s
+        self._lock = threading.Lock()
+        self._sessoes = {}   # sessao_id -> {"username", "visto_em"}
+        self._armadas = {}   # sessao_id -> {"restantes", "total", "por"}
+        self._capturas = []  # CapturaRerun concluidas, mais antigas primeiro
+
+    # ------------------------------------------------------------ reruns
+    def _iniciar(self, usuario, origem, raiz):
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        anterior = _ATIVAS.get(threading.get_ident())
+        if anterior is not None:
+            anterior.concluir()  # o rerun anterior acabou e a amostragem nao viu
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None or not usuario:
+            return SEM_PERFIL
+        sessao_id = ctx.session_id
+        with self._lock:
+            self._sessoes[sessao_id] = {"username": usuario["username"], "visto_em": time.time()}
+            armada = self._armadas.get(sessao_id)
+            if armada is None:
+                return SEM_PERFIL
+            armada["restantes"] -= 1
+            if armada["restantes"] <= 0:
+                del self._armadas[sessao_id]
+        captura = CapturaRerun(sessao_id, usuario["username"], origem, raiz,
+                               ctx.session_state, self._registrar, self.intervalo_s)
+        with _ativas_lock:
+            _ATIVAS[captura._thread_id] = captura
+        captura.iniciar()
+        return captura
+
+    def iniciar_rerun(self, usuario):
+        """Chamado no topo do script: registra a sessao e, se armada, devolve a
+        captura do rerun (senao SEM_PERFIL). O fim e detectado pela amostragem."""
+        return self._iniciar(usuario, "script", sys._getframe(1))
+
+    def fragmento(self, nome, usuario):
+        """Contexto de um fragmento: dentro de um rerun perfilado vira a secao
+        `nome`; num rerun so do fragmento (que nao passa pelo topo do script),
+        abre e fecha a propria captura."""
+        raiz = sys._getframe(1)
+        ativa = _ATIVAS.get(threading.get_ident())
+        if ativa is not None and ativa.em_andamento_em(raiz.f_back):
+            return ativa.secao(nome)
+        captura = self._iniciar(usuario, nome, raiz)
+        return nullcontext() if captura is SEM_PERFIL else captura.rerun()
+
+    def _registrar(self, captura):
+        with self._lock:
+            self._capturas.append(captura)
+            del self._capturas[:-MAX_CAPTURAS]
+
+    # --------------------------------------------------------------- admin
+    def sessoes(self):
+        """Sessoes com rerun recente, mais recentes primeiro, com os reruns
+        que ainda faltam perfilar (`restantes`)."""
+        limite = time.time() - SESSAO_ATIVA_S
+        with self._lock:
+            for sessao_id in [s for s, v in self._sessoes.items() if v["visto_em"] < limite]:
+                del self._sessoes[sessao_id]
+                self._armadas.pop(sessao_id, None)
+            lista = [
+                {"sessao_id": s, **v,
+                 "restantes": self._armadas.get(s, {}).get("restantes", 0)}
+                for s, v in self._sessoes.items()
+            ]
+        return sorted(lista, key=lambda s: -s["visto_em"])
+
+    def armar(self, sessao_id, reruns, por):
+        reruns = max(1, min(int(reruns), MAX_RERUNS))
+        with self._lock:
+            self._armadas[sessao_id] = {"restantes": reruns, "total": reruns, "por": por}
+
+    def cancelar(self, sessao_id):
+        with self._lock:
+            self._armadas.pop(sessao_id, None)
+
+    def capturas(self):
+        with self._lock:
+            return list(self._capturas)
+
+    def descartar(self):
+        with self._lock:
+            self._capturas.clear()
+
+
+def para_speedscope(capturas, nome="Portal Power BI - reruns"):
+    """Arquivo speedscope (JSON, bytes) com um perfil de secoes (evented) e um
+    de amostras da pilha (sampled) por rerun capturado."""
+    frames = []
+    indices = {}
+
+    def _frame(nome_frame, arquivo=None, linha=None):
+        chave = (nome_frame, arquivo, linha)
+        if chave not in indices:
+            indices[chave] = len(frames)
+            frame = {"name": nome_frame}
+            if arquivo:
+                frame.update(file=arquivo, line=linha)
+            frames.append(frame)
+        return indices[chave]
+
+    perfis = []
+    for c in capturas:
+        rotulo = (f"{datetime.fromtimestamp(c.inicio_em):%H:%M:%S} {c.username} "
+                  f"{c.origem} ({c.duracao_ms:.0f} ms)")
+        perfis.append({
+            "type": "evented", "name": f"{rotulo} - secoes", "unit": "milliseconds",
+            "startValue": 0, "endValue": c.duracao_ms,
+            "events": [{"type": tipo, "frame": _frame(secao), "at": em}
+                       for tipo, secao, em in c.eventos],
+        })
+        if c.amostras:
+            perfis.append({
+                "type": "sampled", "name": f"{rotulo} - amostras", "unit": "milliseconds",
+                "startValue": 0, "endValue": sum(peso for _pilha, peso in c.amostras),
+                "samples": [[_frame(*chave) for chave in pilha] for pilha, _peso in c.amostras],
+                "weights": [peso for _pilha, peso in c.amostras],
+            })
+    return json.dumps({
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": nome,
+        "exporter": "portal-powerbi perfil_rerun",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": perfis,
+    }).encode("utf-8")
@@ -0,0 +1,249 @@
+"""Broker de embed tokens do Power BI ("Embed for your customers").
+
+Em vez de embedar o `link_powerbi` cru (que obriga cada visitante a passar
+pelo login/redirect da Microsoft), o portal obtem, com um service principal,
+um embed token por relatorio; o relatorio e renderizado com o powerbi-client JS
+(componente `componentes/iframe_pool`).
+
+Os tokens ficam em cache no processo, por (workspace, relatorio), com a
+expiracao devolvida pela API. Uma thread em segundo plano renova os que estao
+perto de expirar, entao abrir um relatorio e um unico carregamento de iframe.
+So e renovado o que foi pedido recentemente (JANELA_USO_S); o resto sai do
+cache em vez de gerar tokens para relatorios que ninguem esta vendo.
+
+Os endpoints (login do Azure AD e API do Power BI) sao configuraveis para
+apontar para um servidor local de testes.
+
+O powerbi-client JS, em versao fixa, e servido de static/ pelo proprio app
+(`baixar_powerbi_client`), nao carregado de um CDN de terceiros.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+try:
+    from datetime import UTC
+except ImportError:  # Python 3.10
+    UTC = timezone.utc  # noqa: UP017
+
+AUTHORITY_PADRAO = "https://login.microsoftonline.com"
+API_PADRAO = "https://api.powerbi.com"
+ESCOPO_PADRAO = "https://analysis.windows.net/powerbi/api/.default"
+
+# Renova o token quando faltar menos que isso para expirar.
+MARGEM_RENOVACAO_S = 10 * 60
+# So renova tokens pedidos (obter_embed) ha menos que isso; os outros saem do
+# cache ao entrar na margem e sao gerados de novo se voltarem a ser pedidos.
+JANELA_USO_S = 30 * 60
+# Intervalo entre as varreduras da thread de renovacao.
+INTERVALO_VARREDURA_S = 60
+TIMEOUT_HTTP_S = 15
+
+# powerbi-client (JS) usado pelo componente iframe_pool. Trocar a versao aqui
+# e rodar scripts/baixar_powerbi_client.py.
+POWERBI_CLIENT_VERSAO = "2.23.1"
+URL_POWERBI_CLIENT = (
+    f"https://cdn.jsdelivr.net/npm/powerbi-client@{POWERBI_CLIENT_VERSAO}/dist/powerbi.min.js"
+)
+ARQUIVO_POWERBI_CLIENT = "powerbi.min.js"  # em static/
+
+_RE_GRUPO = re.compile(r"/groups/([0-9a-fA-F-]{36}|me)/", re.IGNORECASE)
+_RE_REPORT = re.compile(r"/reports/([0-9a-fA-F-]{36})", re.IGNORECASE)
+_RE_QS_REPORT = re.compile(r"[?&]reportId=([0-9a-fA-F-]{36})", re.IGNORECASE)
+_RE_QS_GRUPO = re.compile(r"[?&]groupId=([0-9a-fA-F-]{36})", re.IGNORECASE)
+
+
+def extrair_ids_powerbi(link):
+    """Extrai (group_id, report_id) de um link do Power BI.
+
+    Aceita tanto o link do servico (`/groups/<g>/reports/<r>/...`) quanto o de
+    embed (`reportEmbed?reportId=<r>&groupId=<g>`). Devolve None se o link nao
+    identificar um relatorio de um workspace (ex.: links "Publicar na web" ou
+    paineis Streamlit)."""
+    if not link or "powerbi.com" not in link.lower():
+        return None
+    m_rep = _RE_REPORT.search(link) or _RE_QS_REPORT.search(link)
+    m_grp = _RE_GRUPO.search(link) or _RE_QS_GRUPO.search(link)
+    if not m_rep or not m_grp or m_grp.group(1).lower() == "me":
+        return None
+    return m_grp.group(1).lower(), m_rep.group(1).lower()
+
+
+def _parse_expiracao(valor):
+    """Converte a expiracao ISO da API em epoch (segundos)."""
+    try:
+        dt = datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=UTC)
+        return dt.timestamp()
+    except Exception:  # noqa: BLE001  (formato inesperado: assume 1h)
+        return time.time() + 3600
+
+
+def baixar_powerbi_client(destino, url=URL_POWERBI_CLIENT):
+    """Baixa o powerbi-client para `destino` (ex.: static/powerbi.min.js) e
+    devolve o tamanho em bytes. Grava em um temporario e renomeia: o servidor
+    de estaticos nunca entrega o arquivo pela metade."""
+    with urllib.request.urlopen(url, timeout=TIMEOUT_HTTP_S) as resp:
+        dados = resp.read()
+    if b"powerbi" not in dados:
+        raise ValueError(f"{url} nao devolveu o powerbi-client")
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    with open(temporario, "wb") as fh:
+        fh.write(dados)
+    os.replace(temporario, destino)
+    return len(dados)
+
+
+class EmbedBroker:
+    def __init__(self, tenant_id, client_id, client_secret,
+                 authority_url=AUTHORITY_PADRAO, api_url=API_PADRAO,
+                 margem_renovacao=MARGEM_RENOVACAO_S, janela_uso=JANELA_USO_S):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.authority_url = authority_url.rstrip("/")
+        self.api_url = api_url.rstrip("/")
+        self.margem_renovacao = margem_renovacao
+        self.janela_uso = janela_uso
+
+        self._lock = threading.Lock()
+        self._aad = None  # (access_token, expira_em)
+        # (group_id, report_id) -> {"token", "embed_url", "report_id", "expira_em"}
+        self._cache = {}
+        # (group_id, report_id) -> ultimo obter_embed (epoch)
+        self._usado_em = {}
+        self._thread = None
+        self._parar = threading.Event()
+
+    @classmethod
+    def from_secrets(cls, get_secret):
+        """Cria o broker a partir dos secrets; devolve None se nao configurado."""
+        tenant = get_secret("POWERBI_TENANT_ID")
+        client_id = get_secret("POWERBI_CLIENT_ID")
+        client_secret = get_secret("POWERBI_CLIENT_SECRET")
+        if not tenant or not client_id or not client_secret:
+            return None
+        return cls(
+            tenant, client_id, client_secret,
+            authority_url=get_secret("POWERBI_AUTHORITY_URL", AUTHORITY_PADRAO) or AUTHORITY_PADRAO,
+            api_url=get_secret("POWERBI_API_URL", API_PADRAO) or API_PADRAO,
+        )
+
+    # ------------------------------------------------------------------ http
+    @staticmethod
+    def _request_json(url, data=None, headers=None, form=False):
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            if form:
+                body = urllib.parse.urlencode(data).encode()
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+            else:
+                body = json.dumps(data).encode()
+                headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(url, data=body, headers=headers,
+                                     method="POST" if body is not None else "GET")
+        with urllib.request.urlopen(req, timeout=TIMEOUT_HTTP_S) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def _token_aad(self):
+        # Token do service principal (client credentials), reaproveitado ate
+        # perto de expirar.
+        with self._lock:
+            if self._aad and self._aad[1] - time.time() > self.margem_renovacao:
+                return self._aad[0]
+        resp = self._request_json(
+            f"{self.authority_url}/{self.tenant_id}/oauth2/v2.0/token",
+            data={
+                "grant_type": "client_credentials",
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "scope": ESCOPO_PADRAO,
+            },
+            form=True,
+        )
+        token = resp["access_token"]
+        expira_em = time.time() + int(resp.get("expires_in", 3600))
+        with self._lock:
+            self._aad = (token, expira_em)
+        return token
+
+    def _gerar(self, group_id, report_id):
+        aad = self._token_aad()
+        auth = {"Authorization": f"Bearer {aad}"}
+        base = f"{self.api_url}/v1.0/myorg/groups/{group_id}/reports/{report_id}"
+        info = self._request_json(base, headers=auth)
+        gerado = self._request_json(
+            f"{base}/GenerateToken", data={"accessLevel": "View"}, headers=auth
+        )
+        entrada = {
+            "token": gerado["token"],
+            "embed_url": info["embedUrl"],
+            "report_id": info.get("id", report_id),
+            "expira_em": _parse_expiracao(gerado.get("expiration")),
+        }
+        with self._lock:
+            self._cache[(group_id, report_id)] = entrada
+        return entrada
+
+    # --------------------------------------------------------------- publico
+    def obter_embed(self, link):
+        """Devolve o embed (token, embed_url, report_id, expira_em) do link, ou
+        None se o link nao for de um relatorio de workspace. Usa o cache quando
+        o token ainda esta longe de expirar."""
+        ids = extrair_ids_powerbi(link)
+        if ids is None:
+            return None
+        with self._lock:
+            entrada = self._cache.get(ids)
+            self._usado_em[ids] = time.time()
+        if entrada and entrada["expira_em"] - time.time() > self.margem_renovacao:
+            return dict(entrada)
+        return dict(self._gerar(*ids))
+
+    def renovar_expirando(self):
+        """Renova os tokens em cache que estao dentro da margem de expiracao e
+        foram pedidos dentro da janela de uso; descarta os demais."""
+        agora = time.time()
+        with self._lock:
+            chaves = []
+            for k, v in list(self._cache.items()):
+                if v["expira_em"] - agora > self.margem_renovacao:
+                    continue
+                if agora - self._usado_em.get(k, 0) <= self.janela_uso:
+                    chaves.append(k)
+                else:
+                    del self._cache[k]
+                    self._usado_em.pop(k, None)
+        for group_id, report_id in chaves:
+            try:
+                self._gerar(group_id, report_id)
+            except Exception:  # noqa: BLE001  (tenta de novo na proxima varredura)
+                with self._lock:
+                    entrada = self._cache.get((group_id, report_id))
+                    if entrada and entrada["expira_em"] <= time.time():
+                        del self._cache[(group_id, report_id)]
+
+    def iniciar_renovacao(self, intervalo=INTERVALO_VARREDURA_S):
+        """Sobe (uma vez) a thread daemon que renova os tokens em segundo plano."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def _loop():
+            while not self._parar.wait(intervalo):
+                self.renovar_expirando()
+
+        self._parar.clear()
+        self._thread = threading.Thread(target=_loop, name="powerbi-embed-refresh", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
@@ -0,0 +1,276 @@
+"""Consultor de indices: EXPLAIN (ANALYZE, BUFFERS) dos formatos de consulta do portal.
+
+Roda cada formato de consulta que o `Database` emite (o SQL equivalente ao que
+o PostgREST gera) contra um Postgres LOCAL semeado com volume realista e
+aponta Seq Scan em tabelas grandes e Sort explicito, com o indice que atende
+aquele formato. Escritas (exclusao logica e a remocao fisica da purga, com as
+FKs `on delete set null`) rodam dentro de uma transacao desfeita no final.
+
+    # banco descartavel: docker run -e POSTGRES_PASSWORD=x -p 5432:5432 postgres:16
+    python scripts/analisar_indices.py --db-url postgresql://postgres:x@localhost/postgres --semear
+    python scripts/analisar_indices.py --db-url ... --formato listar_relatorios_usuario
+
+`--semear` aplica supabase_schema.sql e insere dados sinteticos; so roda com
+as tabelas vazias e nunca contra um host do Supabase. Sai com codigo 1 se
+algum formato tiver achados.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import psycopg
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIAS = (
+    "GERAL", "FINANCEIRO", "SUPRIMENTOS", "INSUMOS", "MARKETING", "OPERACIONAL",
+    "SOLINFITEC", "LOGISTICA", "VENDAS", "DIRETORIA", "RH", "CONTROLADORIA",
+)
+
+_COLS_RELATORIO = (
+    "id, titulo, link_powerbi, descricao, categoria, nivel_hierarquia, "
+    "criado_por, criado_em, atualizado_em"
+)
+_COLS_BASICO = "id, titulo, categoria, nivel_hierarquia, criado_em, atualizado_em"
+_COLS_USUARIO = (
+    "id, username, is_admin, nivel_hierarquia, categorias_permitidas, "
+    "relatorios_permitidos, criado_em"
+)
+
+# (nome, metodo do Database, SQL, parametros, indice que atende o formato).
+FORMATOS = (
+    (
+        "autenticar_usuario", "Database.autenticar_usuario",
+        ("select id, username, password_hash, is_admin, nivel_hierarquia, "
+         "categorias_permitidas, relatorios_permitidos from public.usuarios "
+         "where username = %(username)s and ativo limit 1"),
+        {"username": "user_4242"},
+        "uq_usuarios_username_ativo (unique, where ativo)",
+    ),
+    (
+        "listar_relatorios_usuario", "Database.listar_relatorios_usuario",
+        (f"select {_COLS_RELATORIO} from public.relatorios "
+         "where categoria = any(%(areas)s) and ativo order by criado_em desc"),
+        {"areas": ["VENDAS", "RH"]},
+        "idx_relatorios_ativos_cat_nivel_criado (categoria, nivel_hierarquia, criado_em desc)",
+    ),
+    (
+        "listar_relatorios_completo", "Database.listar_relatorios_completo",
+        f"select {_COLS_RELATORIO} from public.relatorios where ativo order by criado_em desc",
+        {},
+        "idx_relatorios_ativos_criado_em (criado_em desc)",
+    ),
+    (
+        "sincronizar_catalogo", "Database.sincronizar_catalogo",
+        (f"select {_COLS_RELATORIO} from public.relatorios "
+         "where ativo and atualizado_em > now() - interval '10 minutes'"),
+        {},
+        "idx_relatorios_ativos_atualizado_em (atualizado_em) where ativo",
+    ),
+    (
+        "sincronizar_exclusoes", "Database.sincronizar_catalogo",
+        ("select relatorio_id, excluido_em from public.relatorios_exclusoes "
+         "where excluido_em > now() - interval '10 minutes'"),
+        {},
+        "idx_relatorios_exclusoes_excluido_em",
+    ),
+    (
+        "obter_relatorio_por_id", "Database.obter_relatorio_por_id",
+        f"select {_COLS_RELATORIO} from public.relatorios where id = %(id)s and ativo limit 1",
+        {"id": 77},
+        "relatorios_pkey",
+    ),
+    (
+        "buscar_relatorios_basico", "Database.buscar_relatorios_basico",
+        (f"select {_COLS_BASICO} from public.relatorios "
+         "where ativo and categoria = any(%(areas)s) and nivel_hierarquia = 'operacao' "
+         "and (titulo ilike %(termo)s or categoria ilike %(termo)s) "
+         "order by titulo limit 30"),
+        {"areas": ["VENDAS", "RH", "GERAL"], "termo": "painel 1%"},
+        "idx_relatorios_ativos_titulo_trgm (gin titulo gin_trgm_ops)",
+    ),
+    (
+        "sonda_categoria_legada", "Database.init_database",
+        "select id from public.relatorios where categoria = %(categoria)s limit 1",
+        {"categoria": "Vendas"},
+        "idx_relatorios_ativos_cat_nivel_criado (prefixo categoria)",
+    ),
+    (
+        "listar_usuarios_pagina", "Database.listar_usuarios",
+        (f"select {_COLS_USUARIO}, count(*) over () as total from public.usuarios "
+         "where ativo order by criado_em desc, id desc limit 25 offset 50"),
+        {},
+        "idx_usuarios_ativos_criado_em (criado_em desc, id desc)",
+    ),
+    (
+        "listar_usuarios_busca", "Database.listar_usuarios",
+        (f"select {_COLS_USUARIO}, count(*) over () as total from public.usuarios "
+         "where ativo and username ilike %(busca)s order by criado_em desc, id desc limit 25"),
+        {"busca": "user_12%"},
+        "idx_usuarios_ativos_username_trgm (gin username gin_trgm_ops)",
+    ),
+    (
+        "listar_usuarios_area", "Database.listar_usuarios",
+        (f"select {_COLS_USUARIO}, count(*) over () as total from public.usuarios "
+         "where ativo and categorias_permitidas @> %(area)s::jsonb "
+         "order by criado_em desc, id desc limit 25"),
+        {"area": json.dumps(["DIRETORIA"])},
+        "idx_usuarios_ativos_categorias (gin jsonb_path_ops)",
+    ),
+    (
+        "obter_usuarios_por_ids", "Database.obter_usuarios_por_ids",
+        f"select {_COLS_USUARIO} from public.usuarios where id = any(%(ids)s) and ativo",
+        {"ids": [3, 14, 159, 265]},
+        "usuarios_pkey",
+    ),
+    (
+        "popularidade_relatorios", "Database.popularidade_relatorios",
+        "select * from public.popularidade_relatorios(30)",
+        {},
+        "idx_acessos_relatorio_dia_dia",
+    ),
+    (
+        "excluir_relatorio", "Database.excluir_relatorio (exclusao logica)",
+        ("update public.relatorios set ativo = false, excluido_em = now() "
+         "where id = %(id)s and ativo"),
+        {"id": 321},
+        "relatorios_pkey",
+    ),
+    (
+        "purga_usuario_fk", "purgar_inativos() (on delete set null)",
+        "delete from public.usuarios where id = %(id)s",
+        {"id": 1234},
+        "idx_logs_acesso_usuario + idx_relatorios_criado_por",
+    ),
+    (
+        "purga_relatorio_fk", "purgar_inativos() (on delete set null)",
+        "delete from public.relatorios where id = %(id)s",
+        {"id": 321},
+        "idx_logs_acesso_relatorio",
+    ),
+)
+
+# Executados um a um: o psycopg nao aceita varios comandos com parametros.
+_SEMENTE = (
+    """
+    insert into public.usuarios (username, password_hash, is_admin, nivel_hierarquia,
+                                 categorias_permitidas, criado_em)
+    select 'user_' || i, 'x', i %% 200 = 0,
+           case when i %% 4 = 0 then 'gestao' else 'operacao' end,
+           jsonb_build_array((%(cats)s::text[])[1 + i %% 12], (%(cats)s::text[])[1 + (i * 7) %% 12]),
+           now() - make_interval(mins => i)
+    from generate_series(1, %(usuarios)s) as i
+    """,
+    """
+    insert into public.relatorios (titulo, link_powerbi, descricao, categoria,
+                                   nivel_hierarquia, criado_por, criado_em, atualizado_em)
+    select 'Painel ' || i || ' ' || (%(cats)s::text[])[1 + i %% 12],
+           'https://app.powerbi.com/view?r=' || i, 'Relatorio sintetico ' || i,
+           (%(cats)s::text[])[1 + (i * 5) %% 12],
+           case when i %% 3 = 0 then 'gestao' else 'operacao' end,
+           1 + (i * 13) %% %(usuarios)s, now() - make_interval(hours => i),
+           now() - make_interval(hours => i)
+    from generate_series(1, %(relatorios)s) as i
+    """,
+    "select public.criar_particoes_logs_acesso(3, now() - interval '13 months')",
+    """
+    insert into public.logs_acesso (usuario_id, relatorio_id, data_acesso)
+    select 1 + (i * 31) %% %(usuarios)s, 1 + (i * 17) %% %(relatorios)s,
+           now() - make_interval(days => i %% 390, mins => i %% 1440)
+    from generate_series(1, %(acessos)s) as i
+    """,
+    "select public.atualizar_rollups_acesso()",
+)
+
+
+def semear(conn, usuarios, relatorios, acessos):
+    if "supabase" in (conn.info.host or ""):
+        raise SystemExit("--semear e so para banco local descartavel, nao para o Supabase.")
+    if conn.execute("select to_regclass('public.usuarios') is not null").fetchone()[0] \
+            and conn.execute("select exists (select 1 from public.usuarios)").fetchone()[0]:
+        raise SystemExit("--semear precisa das tabelas vazias (use um banco descartavel).")
+    with open(os.path.join(RAIZ, "supabase_schema.sql"), encoding="utf-8") as fh:
+        conn.execute(fh.read())
+    params = {
+        "cats": list(CATEGORIAS), "usuarios": usuarios,
+        "relatorios": relatorios, "acessos": acessos,
+    }
+    for sql in _SEMENTE:
+        # Cada comando so recebe os parametros que usa.
+        conn.execute(sql, {k: v for k, v in params.items() if f"%({k})s" in sql})
+    conn.execute("analyze")
+    print(f"semeado: {usuarios} usuarios, {relatorios} relatorios, {acessos} acessos")
+
+
+def _nos(plano):
+    yield plano
+    for filho in plano.get("Plans", []):
+        yield from _nos(filho)
+
+
+def analisar(conn, sql, params, min_linhas, min_gatilho_ms=5.0):
+    """Executa o EXPLAIN e devolve (tempo_ms, achados)."""
+    with conn.transaction(force_rollback=True):
+        linha = conn.execute(
+            "explain (analyze, buffers, format json) " + sql, params
+        ).fetchone()[0]
+    raiz = linha[0]
+    achados = []
+    for no in _nos(raiz["Plan"]):
+        tipo = no.get("Node Type")
+        if tipo == "Seq Scan":
+            lidas = (no.get("Actual Rows", 0) + no.get("Rows Removed by Filter", 0)) * no.get("Actual Loops", 1)
+            if lidas >= min_linhas:
+                filtro = f" filtro {no['Filter']}" if no.get("Filter") else ""
+                achados.append(f"Seq Scan em {no.get('Relation Name')} ({lidas} linhas lidas){filtro}")
+        elif tipo in ("Sort", "Incremental Sort"):
+            chave = ", ".join(no.get("Sort Key", []))
+            linhas = no.get("Actual Rows", 0) * no.get("Actual Loops", 1)
+            if linhas >= min_linhas:
+                achados.append(f"{tipo} por {chave} ({linhas} linhas, {no.get('Sort Method')})")
+    # FKs "on delete set null" viram gatilhos; lentos = Seq Scan na tabela filha.
+    for gatilho in raiz.get("Triggers", []):
+        if gatilho.get("Time", 0) >= min_gatilho_ms:
+            achados.append(f"gatilho {gatilho.get('Trigger Name')}: {gatilho.get('Time'):.1f} ms")
+    return raiz.get("Execution Time", 0.0), achados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=os.getenv("PORTAL_PG_LOCAL_URL", ""),
+                        help="Postgres local (padrao: $PORTAL_PG_LOCAL_URL)")
+    parser.add_argument("--semear", action="store_true",
+                        help="aplica supabase_schema.sql e insere dados sinteticos")
+    parser.add_argument("--usuarios", type=int, default=20000)
+    parser.add_argument("--relatorios", type=int, default=5000)
+    parser.add_argument("--acessos", type=int, default=500000)
+    parser.add_argument("--min-linhas", type=int, default=1000,
+                        help="ignora Seq Scan/Sort abaixo deste volume (padrao: 1000)")
+    parser.add_argument("--formato", action="append",
+                        help="analisa so este formato (pode repetir)")
+    args = parser.parse_args(argv)
+    if not args.db_url:
+        parser.error("defina PORTAL_PG_LOCAL_URL ou use --db-url")
+
+    formatos = [f for f in FORMATOS if not args.formato or f[0] in args.formato]
+    com_achados = 0
+    with psycopg.connect(args.db_url, autocommit=True) as conn:
+        if args.semear:
+            semear(conn, args.usuarios, args.relatorios, args.acessos)
+        for nome, origem, sql, params, indice in formatos:
+            tempo_ms, achados = analisar(conn, sql, params, args.min_linhas)
+            marca = "ATENCAO" if achados else "ok"
+            print(f"{marca:<8} {nome:<28} {tempo_ms:8.2f} ms  ({origem})")
+            for achado in achados:
+                print(f"         - {achado}")
+            if achados:
+                com_achados += 1
+                print(f"         indice recomendado: {indice}")
+    print(f"\n{len(formatos)} formato(s), {com_achados} com achados.")
+    return 1 if com_achados else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
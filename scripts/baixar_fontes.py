@@ -0,0 +1,123 @@
+"""Baixa as fontes do portal para static/fonts (self-hosted, sem CDN em runtime).
+
+Rode uma vez no build/deploy (precisa de internet so aqui):
+
+    python scripts/baixar_fontes.py
+
+Inter e Poppins vem no subset `latin` do Google Fonts; Material Symbols
+Outlined vem com apenas os icones usados pelo portal (`icon_names`), o que
+reduz o arquivo de ~3 MB para poucos KB. Os nomes gerados sao os referenciados
+por static/fontes.css.
+
+Os icones sao levantados de app.py e dos templates em componentes/ (veja
+`icones_usados`); `--listar` so mostra a lista, sem baixar nada.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DESTINO = os.path.join(RAIZ, "static", "fonts")
+
+# Chrome moderno: o Google Fonts so devolve woff2 para user agents que suportam.
+_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+FAMILIAS = {
+    "inter": ("Inter", (400, 500, 600, 700)),
+    "poppins": ("Poppins", (600, 700)),
+}
+
+# Onde o portal desenha icones com a fonte do subset. Os `:material/...:` do
+# Streamlit nao entram: usam a fonte Rounded que o proprio Streamlit serve.
+FONTES_ICONES = ("app.py", os.path.join("componentes", "*", "index.html"))
+# Trechos que levam nomes de icone entre aspas.
+_RE_TRECHOS_ICONE = (
+    re.compile(r'el\("span",\s*"ms",\s*([^)]*)\)'),     # el("span", "ms", "x" / cond ? "a" : "b")
+    re.compile(r'botao\("[^"]*",\s*("[^"]*")'),           # botao(rotulo, "icone", ...)
+    re.compile(r"^\s*icone\w*\s*=\s*(.+)$", re.MULTILINE),   # icone_papel = "a" if ... else "b"
+)
+# Icone literal em HTML: <span class='material-symbols-outlined'>nome</span>.
+_RE_SPAN_ICONE = re.compile(r"material-symbols-outlined[^>]*>([a-z0-9_]+)<")
+_RE_NOME = re.compile(r"""["']([a-z][a-z0-9_]*)["']""")
+
+_RE_BLOCO = re.compile(r"/\*\s*([\w-]+)\s*\*/\s*@font-face\s*{([^}]*)}", re.DOTALL)
+_RE_PESO = re.compile(r"font-weight:\s*(\d+)")
+_RE_URL = re.compile(r"url\((https://[^)]+\.woff2)\)")
+
+
+def _get(url):
+    req = urllib.request.Request(url, headers={"User-Agent": _UA})
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return resp.read()
+
+
+def _salvar(url, nome):
+    dados = _get(url)
+    with open(os.path.join(DESTINO, nome), "wb") as fh:
+        fh.write(dados)
+    print(f"{nome}: {len(dados) / 1024:.1f} KB")
+
+
+def baixar_texto():
+    for prefixo, (familia, pesos) in FAMILIAS.items():
+        css = _get(
+            "https://fonts.googleapis.com/css2?family="
+            f"{familia}:wght@{';'.join(map(str, pesos))}&display=swap"
+        ).decode("utf-8")
+        for subset, corpo in _RE_BLOCO.findall(css):
+            if subset != "latin":
+                continue
+            peso = _RE_PESO.search(corpo).group(1)
+            _salvar(_RE_URL.search(corpo).group(1), f"{prefixo}-latin-{peso}.woff2")
+
+
+def icones_usados(raiz=RAIZ):
+    """Nomes de icone (ordenados) referenciados em app.py e nos templates
+    dos componentes, para o subset nao ficar para tras quando um icone novo
+    entra no codigo."""
+    icones = set()
+    for padrao in FONTES_ICONES:
+        for caminho in sorted(glob.glob(os.path.join(raiz, padrao))):
+            with open(caminho, encoding="utf-8") as fh:
+                texto = fh.read()
+            for regex in _RE_TRECHOS_ICONE:
+                for trecho in regex.findall(texto):
+                    icones.update(_RE_NOME.findall(trecho))
+            icones.update(_RE_SPAN_ICONE.findall(texto))
+    return sorted(icones)
+
+
+def baixar_icones(icones):
+    css = _get(
+        "https://fonts.googleapis.com/css2?family=Material+Symbols+Outlined:"
+        "opsz,wght,FILL,GRAD@20..48,100..700,0..1,-50..200"
+        f"&icon_names={','.join(icones)}"
+    ).decode("utf-8")
+    _salvar(_RE_URL.search(css).group(1), "material-symbols-outlined.woff2")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listar", action="store_true",
+                        help="so lista os icones encontrados, sem baixar")
+    args = parser.parse_args(argv)
+
+    icones = icones_usados()
+    print(f"{len(icones)} icones: {', '.join(icones)}")
+    if args.listar:
+        return 0
+    os.makedirs(DESTINO, exist_ok=True)
+    baixar_texto()
+    baixar_icones(icones)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
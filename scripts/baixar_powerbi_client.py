@@ -0,0 +1,41 @@
+"""Baixa o powerbi-client JS para static/ (servido pelo app, sem CDN em runtime).
+
+Rode no build/deploy (precisa de internet so aqui) e ao trocar a versao em
+`powerbi_embed.POWERBI_CLIENT_VERSAO`:
+
+    python scripts/baixar_powerbi_client.py
+
+Se o deploy nao rodar o script, o app baixa o arquivo sozinho na primeira
+abertura de um relatorio embedado e, ate la, o pool carrega a mesma versao do
+CDN.
+"""
+
+import argparse
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from powerbi_embed import (
+    ARQUIVO_POWERBI_CLIENT,
+    POWERBI_CLIENT_VERSAO,
+    URL_POWERBI_CLIENT,
+    baixar_powerbi_client,
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=URL_POWERBI_CLIENT,
+                        help="origem do arquivo (padrao: jsDelivr, versao fixa)")
+    args = parser.parse_args(argv)
+
+    destino = os.path.join(RAIZ, "static", ARQUIVO_POWERBI_CLIENT)
+    tamanho = baixar_powerbi_client(destino, args.url)
+    print(f"powerbi-client {POWERBI_CLIENT_VERSAO}: {destino} ({tamanho / 1024:.1f} KB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,623 @@
+"""Teste de carga do portal: varias sessoes simultaneas contra um banco local.
+
+Cada sessao simulada e um `AppTest` (streamlit.testing) rodando o app.py em
+sua propria thread, como o servidor faz com cada aba aberta. Todas dividem o
+mesmo processo e, portanto, os caches (st.cache_resource, CacheIndexado), como
+em uma replica de verdade. O Supabase e trocado pelo `BancoLocal` abaixo: as
+tabelas ficam em memoria, cada chamada espera `--latencia-banco-ms` (a ida e
+volta ao PostgREST) e todas sao contadas.
+
+Fluxos, repetidos `--ciclos` vezes por sessao depois do login:
+- usuario comum: dashboard, abre um relatorio (clique na grade), volta,
+  Minha conta (filtro e busca da grade rodam no navegador, sem rerun, e
+  por isso nao entram);
+- admin (`--admins`, fracao das sessoes): dashboard, Usuarios, busca, edita
+  um usuario e salva.
+
+Para cada nivel de concorrencia mostra a latencia dos reruns (p50/p95/p99/
+max), a CPU do processo, a memoria por sessao e as chamadas ao banco por
+rerun, e no fim os passos mais lentos do ultimo nivel. Um processo so usa um
+nucleo de CPU para o Python (GIL), como uma replica do portal: quando a
+coluna CPU chega perto de 1, a replica saturou.
+
+    python scripts/carga_sessoes.py
+    python scripts/carga_sessoes.py --sessoes 1,10,25,50 --ciclos 3 --latencia-banco-ms 20
+    python scripts/carga_sessoes.py --json carga.json   # para comparar entre versoes
+"""
+
+import argparse
+import asyncio
+import copy
+import gc
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+try:
+    from datetime import UTC
+except ImportError:  # Python 3.10
+    UTC = timezone.utc  # noqa: UP017
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+SENHA_CARGA = "carga-123"
+# Secrets de toda sessao: sem SUPABASE_DB_URL/REDIS_URL (nada de LISTEN nem
+# Redis) e sem varredura de links em segundo plano durante a medicao.
+SECRETS = {
+    "SUPABASE_URL": "http://banco-local",
+    "SUPABASE_KEY": "carga",
+    "ADMIN_INITIAL_PASSWORD": SENHA_CARGA,
+    "LINKS_INTERVALO_S": "0",
+}
+
+# ------------------------------------------------------------ banco local
+class _Resposta:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Consulta:
+    """Subconjunto do query builder do supabase-py usado pelo database.py."""
+
+    def __init__(self, banco, tabela):
+        self._banco = banco
+        self._tabela = tabela
+        self._op = "select"
+        self._filtros = []
+        self._ordem = []
+        self._limite = None
+        self._faixa = None
+        self._dados = None
+        self._contar = False
+        self._conflito = None
+
+    def select(self, _colunas="*", count=None):
+        self._op, self._contar = "select", bool(count)
+        return self
+
+    def insert(self, dados):
+        self._op, self._dados = "insert", dados
+        return self
+
+    def upsert(self, dados, on_conflict=None, **_opcoes):
+        self._op, self._dados, self._conflito = "upsert", dados, on_conflict
+        return self
+
+    def update(self, dados):
+        self._op, self._dados = "update", dados
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    def _filtro(self, f):
+        self._filtros.append(f)
+        return self
+
+    def eq(self, c, v):
+        return self._filtro(lambda r: r.get(c) == v)
+
+    def gt(self, c, v):
+        return self._filtro(lambda r: r.get(c) is not None and str(r.get(c)) > str(v))
+
+    def in_(self, c, vs):
+        vs = list(vs)
+        return self._filtro(lambda r: r.get(c) in vs)
+
+    def contains(self, c, vs):
+        return self._filtro(lambda r: all(v in (r.get(c) or []) for v in vs))
+
+    def ilike(self, c, padrao):
+        prefixo = padrao.rstrip("%").replace("\\", "").lower()
+        return self._filtro(lambda r: str(r.get(c) or "").lower().startswith(prefixo))
+
+    def or_(self, expressao):
+        prefixos = []
+        for parte in expressao.split(","):
+            coluna, _op, valor = parte.split(".", 2)
+            prefixos.append((coluna, valor.rstrip("*").lower()))
+        return self._filtro(
+            lambda r: any(str(r.get(c) or "").lower().startswith(p) for c, p in prefixos)
+        )
+
+    def order(self, c, desc=False):
+        self._ordem.append((c, desc))
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    def range(self, inicio, fim):
+        self._faixa = (inicio, fim)
+        return self
+
+    def _executar(self):
+        return self._banco.executar(self)
+
+    def execute(self):
+        self._banco.esperar()
+        return self._executar()
+
+
+class _ConsultaAsync:
+    def __init__(self, consulta):
+        self._consulta = consulta
+
+    def __getattr__(self, nome):
+        metodo = getattr(self._consulta, nome)
+        if nome == "execute":
+            async def _executar():
+                await asyncio.sleep(self._consulta._banco.latencia_s)
+                return self._consulta._executar()
+            return _executar
+
+        def _encadear(*args, **kwargs):
+            metodo(*args, **kwargs)
+            return self
+        return _encadear
+
+
+class _Rpc:
+    def __init__(self, banco, nome, params):
+        self._banco, self._nome, self._params = banco, nome, params
+
+    def _executar(self):
+        return self._banco.executar_rpc(self._nome, self._params)
+
+    def execute(self):
+        self._banco.esperar()
+        return self._executar()
+
+
+class BancoLocal:
+    """Stand-in do Supabase em memoria, com latencia e contagem de chamadas."""
+
+    def __init__(self, latencia_s=0.0):
+        self.latencia_s = latencia_s
+        self.tabelas = {}
+        self.chamadas = Counter()  # (tabela | "rpc:nome", operacao) -> n
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # interface do supabase-py
+    def table(self, nome):
+        return _Consulta(self, nome)
+
+    def rpc(self, nome, params=None):
+        return _Rpc(self, nome, params or {})
+
+    def cliente_async(self):
+        banco = self
+
+        class _ClienteAsync:
+            def table(self, nome):
+                return _ConsultaAsync(banco.table(nome))
+
+            def rpc(self, nome, params=None):
+                return _ConsultaAsync(banco.rpc(nome, params))
+
+        return _ClienteAsync()
+
+    def esperar(self):
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+
+    def total_chamadas(self):
+        with self._lock:
+            return sum(self.chamadas.values())
+
+    def executar(self, q):
+        with self._lock:
+            self.chamadas[(q._tabela, q._op)] += 1
+            linhas = self.tabelas.setdefault(q._tabela, [])
+            casam = [r for r in linhas if all(f(r) for f in q._filtros)]
+            if q._op == "select":
+                for coluna, desc in reversed(q._ordem):
+                    casam.sort(key=lambda r: (r.get(coluna) is None, r.get(coluna)), reverse=desc)
+                total = len(casam)
+                if q._faixa:
+                    casam = casam[q._faixa[0]:q._faixa[1] + 1]
+                if q._limite is not None:
+                    casam = casam[:q._limite]
+                return _Resposta(copy.deepcopy(casam), total if q._contar else None)
+            agora = datetime.now(UTC).isoformat()
+            if q._op == "update":
+                for r in casam:
+                    r.update(copy.deepcopy(q._dados), atualizado_em=agora)
+                return _Resposta(copy.deepcopy(casam))
+            if q._op == "delete":
+                self.tabelas[q._tabela] = [r for r in linhas if r not in casam]
+                return _Resposta(copy.deepcopy(casam))
+            novas = q._dados if isinstance(q._dados, list) else [q._dados]
+            gravadas = []
+            for dados in novas:
+                chave = (q._conflito or "").split(",") if q._conflito else None
+                existente = next(
+                    (r for r in linhas if chave and all(r.get(c) == dados.get(c) for c in chave)),
+                    None,
+                )
+                if existente is not None:
+                    existente.update(copy.deepcopy(dados))
+                    gravadas.append(copy.deepcopy(existente))
+                    continue
+                linha = {"id": next(self._ids), "ativo": True, "criado_em": agora,
+                         "atualizado_em": agora, **copy.deepcopy(dados)}
+                linhas.append(linha)
+                gravadas.append(copy.deepcopy(linha))
+            return _Resposta(gravadas)
+
+    def executar_rpc(self, nome, _params):
+        with self._lock:
+            self.chamadas[(f"rpc:{nome}", "rpc")] += 1
+            if nome not in ("popularidade_relatorios", "atividade_usuarios"):
+                return _Resposta(None)
+            campo = "relatorio_id" if nome == "popularidade_relatorios" else "usuario_id"
+            contagem = Counter(log[campo] for log in self.tabelas.get("logs_acesso", []))
+            hoje = datetime.now(UTC).date().isoformat()
+            return _Resposta([
+                {campo: i, "acessos": n, "ultimo_dia": hoje} for i, n in contagem.items()
+            ])
+
+    def semear(self, relatorios, usuarios, admins, hash_senha, areas):
+        """Catalogo e usuarios de carga (`carga001`..., `admcarga01`...). As
+        areas ja vem na ordem padrao, para o boot nao ter o que normalizar."""
+        inicio = datetime.now(UTC) - timedelta(days=relatorios)
+        for i in range(relatorios):
+            criado = (inicio + timedelta(days=i)).isoformat()
+            self.table("relatorios").insert({
+                "titulo": f"Relatorio de carga {i:04d}",
+                "link_powerbi": f"https://app.powerbi.com/view?r=carga{i}",
+                "descricao": "Relatorio gerado pelo teste de carga.",
+                "categoria": areas[i % len(areas)],
+                "nivel_hierarquia": "gestao" if i % 4 == 3 else "operacao",
+                "criado_por": None, "criado_em": criado, "atualizado_em": criado,
+            }).execute()
+        for i in range(usuarios):
+            self.table("usuarios").insert({
+                "username": f"carga{i + 1:03d}", "password_hash": hash_senha,
+                "is_admin": False, "nivel_hierarquia": "operacao",
+                "categorias_permitidas": list(areas[: 1 + i % len(areas)]),
+                "relatorios_permitidos": [],
+            }).execute()
+        for i in range(admins):
+            self.table("usuarios").insert({
+                "username": f"admcarga{i + 1:02d}", "password_hash": hash_senha,
+                "is_admin": True, "nivel_hierarquia": "gestao",
+                "categorias_permitidas": list(areas), "relatorios_permitidos": [],
+            }).execute()
+        self.chamadas.clear()
+
+
+def instalar_banco(banco):
+    """Faz o Database do app (create_client/acreate_client) usar `banco`."""
+    import supabase
+
+    async def _acreate_client(_url, _key):
+        return banco.cliente_async()
+
+    supabase.create_client = lambda _url, _key: banco
+    supabase.acreate_client = _acreate_client
+
+
+def preparar_processo():
+    """Estado global do Streamlit que o AppTest troca a cada `run()`.
+
+    O AppTest foi feito para um teste por vez: cada run cria um Runtime
+    falso, troca `st.secrets` e, no fim, zera `Runtime._instance` e devolve os
+    secrets antigos. Com sessoes em threads, o fim de um run derrubaria o
+    runtime e os secrets de quem ainda esta no meio do script. Aqui o
+    processo ganha um runtime unico (como o servidor de verdade) e secrets
+    fixos; as sessoes nao passam secrets proprios ao AppTest.
+
+    O AppTest tambem cria ScriptCaches por run e recompila o app.py a cada
+    rerun (e o `ast.parse` do Python 3.11 falha com threads em paralelo); o
+    servidor compila uma vez, entao o cache passa a ser um so.
+    """
+    from unittest.mock import MagicMock
+
+    import streamlit as st
+    from streamlit import config
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.logger import set_log_level
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import (
+        MemoryCacheStorageManager,
+    )
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    # Avisos de deprecacao e de "bare mode" se repetiriam a cada rerun. A
+    # config e lida antes, senao a leitura tardia volta ao nivel padrao.
+    config.get_config_options()
+    config.set_option("logger.level", "error")
+    set_log_level("error")
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    componentes = BidiComponentManager()
+    componentes.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = componentes
+    Runtime.instance = classmethod(lambda _cls: runtime)
+    Runtime.exists = classmethod(lambda _cls: True)
+
+    cache_script = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: cache_script
+
+    # Todo AppTest usa o mesmo session_id; cada sessao simulada ganha o seu
+    # (o session_state do AppTest vive entre os runs), como no servidor.
+    iniciar_runner = local_script_runner.LocalScriptRunner.__init__
+
+    def _iniciar_runner(runner, script_path, session_state, *args, **kwargs):
+        iniciar_runner(runner, script_path, session_state, *args, **kwargs)
+        runner._session_id = f"{id(session_state):x}"
+    local_script_runner.LocalScriptRunner.__init__ = _iniciar_runner
+
+    secrets = Secrets()
+    secrets._secrets = dict(SECRETS)
+    st.secrets = secrets
+
+
+# ---------------------------------------------------------------- sessoes
+class Sessao:
+    """Uma aba do navegador: um AppTest que guarda o tempo de cada rerun."""
+
+    def __init__(self, username, admin, timeout_s, banco):
+        from streamlit.testing.v1 import AppTest
+
+        self.username = username
+        self.admin = admin
+        self.banco = banco
+        # Secrets vem de preparar_processo(), nao de at.secrets.
+        self.at = AppTest.from_file(os.path.join(RAIZ, "app.py"), default_timeout=timeout_s)
+        self.tempos = []  # (passo, segundos)
+        self.erros = []
+
+    def passo(self, nome, acao=None):
+        inicio = time.perf_counter()
+        try:
+            if acao is not None:
+                acao()
+            self.at.run()
+        except Exception as e:  # noqa: BLE001  (timeout, widget ausente...)
+            self.erros.append(f"{nome}: {type(e).__name__}: {e}"[:200])
+            return
+        self.tempos.append((nome, time.perf_counter() - inicio))
+        for exc in self.at.exception:
+            self.erros.append(f"{nome}: {exc.value}"[:200])
+
+    def _botao(self, chave):
+        return lambda: self.at.button(key=chave).click()
+
+    def login(self):
+        self.passo("abrir_pagina")
+
+        def _entrar():
+            self.at.text_input[0].input(self.username)
+            self.at.text_input[1].input(SENHA_CARGA)
+            self.at.button[0].click()
+        self.passo("login", _entrar)
+
+    def ciclo_comum(self, rng):
+        self.passo("dashboard", self._botao("nav_Dashboard"))
+        usuario = self.at.session_state.get("usuario")
+        if not usuario:
+            self.erros.append("login: sessao sem usuario")
+            return
+        catalogo = [r for r in self.banco.tabelas.get("relatorios", []) if r.get("ativo")]
+        visiveis = [r for r in catalogo if r["categoria"] in usuario["categorias_permitidas"]
+                    and r["nivel_hierarquia"] == "operacao"]
+        if visiveis:
+            alvo = rng.choice(visiveis)["id"]
+
+            def _clicar_abrir():
+                self.at.session_state["grade_relatorios"] = {
+                    "acao": "abrir", "id": alvo, "nonce": uuid.uuid4().hex,
+                }
+            self.passo("abrir_relatorio", _clicar_abrir)
+
+            def _voltar():
+                next(b for b in self.at.button if b.label.startswith("Voltar")).click()
+            self.passo("voltar", _voltar)
+        self.passo("minha_conta", self._botao("nav_Minha conta"))
+
+    def ciclo_admin(self, rng):
+        self.passo("dashboard", self._botao("nav_Dashboard"))
+        self.passo("usuarios", self._botao("nav_Usuarios"))
+        prefixo = f"carga{rng.randint(0, 9)}"
+        self.passo("buscar_usuario",
+                   lambda: self.at.text_input(key="u_lista_busca").input(prefixo))
+        editar = [b for b in self.at.button if (b.key or "").startswith("edit_")]
+        if not editar:
+            return
+        botao = rng.choice(editar)
+        usuario_id = botao.key.split("_", 1)[1]
+        self.passo("editar_usuario", botao.click)
+        self.passo("salvar_usuario", self._botao(f"u_salvar_edit{usuario_id}"))
+
+    def rodar(self, ciclos, semente, barreira):
+        rng = random.Random(semente)
+        barreira.wait()
+        self.login()
+        for _ in range(ciclos):
+            (self.ciclo_admin if self.admin else self.ciclo_comum)(rng)
+
+
+# ---------------------------------------------------------------- medicao
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # Sem /proc (macOS): pico, nao o atual; a diferenca fica aproximada.
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def _cpu_s():
+    uso = resource.getrusage(resource.RUSAGE_SELF)
+    return uso.ru_utime + uso.ru_stime
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def medir_nivel(banco, n, args, offset):
+    gc.collect()
+    rss_antes = _rss_mb()
+    admins = round(n * args.admins)
+    sessoes = [
+        Sessao(f"admcarga{i % args.admins_semeados + 1:02d}" if i < admins
+               else f"carga{(offset + i) % args.usuarios + 1:03d}",
+               i < admins, args.timeout, banco)
+        for i in range(n)
+    ]
+    barreira = threading.Barrier(n)
+    threads = [
+        threading.Thread(target=s.rodar, args=(args.ciclos, args.semente + offset + i, barreira),
+                         name=f"sessao-{i}")
+        for i, s in enumerate(sessoes)
+    ]
+    chamadas_antes = banco.total_chamadas()
+    cpu_antes, inicio = _cpu_s(), time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    parede = time.perf_counter() - inicio
+    cpu = _cpu_s() - cpu_antes
+    gc.collect()
+    rss_depois = _rss_mb()
+
+    tempos = [dt for s in sessoes for _p, dt in s.tempos]
+    por_passo = {}
+    for s in sessoes:
+        for passo, dt in s.tempos:
+            por_passo.setdefault(passo, []).append(dt)
+    reruns = len(tempos)
+    chamadas = banco.total_chamadas() - chamadas_antes
+    return {
+        "sessoes": n,
+        "reruns": reruns,
+        "erros": [e for s in sessoes for e in s.erros],
+        "p50_ms": _percentil(tempos, 50) * 1000,
+        "p95_ms": _percentil(tempos, 95) * 1000,
+        "p99_ms": _percentil(tempos, 99) * 1000,
+        "max_ms": max(tempos, default=0) * 1000,
+        "reruns_s": reruns / parede if parede else 0.0,
+        "cpu_nucleos": cpu / parede if parede else 0.0,
+        "cpu_ms_rerun": cpu * 1000 / reruns if reruns else 0.0,
+        "mb_sessao": max(0.0, rss_depois - rss_antes) / n,
+        "chamadas_rerun": chamadas / reruns if reruns else 0.0,
+        "passos": {
+            p: {"n": len(v), "p50_ms": statistics.median(v) * 1000,
+                "p95_ms": _percentil(v, 95) * 1000}
+            for p, v in por_passo.items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessoes", default="1,5,10,20",
+                        help="niveis de concorrencia, separados por virgula (padrao: 1,5,10,20)")
+    parser.add_argument("--ciclos", type=int, default=2,
+                        help="repeticoes do fluxo por sessao apos o login (padrao: 2)")
+    parser.add_argument("--admins", type=float, default=0.2,
+                        help="fracao das sessoes que fazem o fluxo de admin (padrao: 0.2)")
+    parser.add_argument("--relatorios", type=int, default=300,
+                        help="relatorios no catalogo do banco local (padrao: 300)")
+    parser.add_argument("--usuarios", type=int, default=200,
+                        help="usuarios comuns no banco local (padrao: 200)")
+    parser.add_argument("--latencia-banco-ms", type=float, default=5.0,
+                        help="espera por chamada ao banco, ida e volta (padrao: 5)")
+    parser.add_argument("--timeout", type=float, default=120,
+                        help="timeout de cada rerun, em segundos (padrao: 120)")
+    parser.add_argument("--semente", type=int, default=1, help="semente dos sorteios")
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    args = parser.parse_args(argv)
+
+    try:
+        niveis = [int(n) for n in args.sessoes.split(",") if n.strip()]
+    except ValueError:
+        parser.error("--sessoes deve ser uma lista de inteiros, ex.: 1,5,10")
+    if not niveis or min(niveis) < 1 or args.ciclos < 1 or not 0 <= args.admins <= 1:
+        parser.error("--sessoes >= 1, --ciclos >= 1 e --admins entre 0 e 1")
+    args.admins_semeados = max(1, round(max(niveis) * args.admins))
+
+    banco = BancoLocal(args.latencia_banco_ms / 1000)
+    instalar_banco(banco)
+    preparar_processo()
+    from database import CATEGORIAS_PADRAO, Database
+
+    banco.semear(args.relatorios, args.usuarios, args.admins_semeados,
+                 Database.__new__(Database).hash_password(SENHA_CARGA), CATEGORIAS_PADRAO)
+
+    # Aquecimento: caches de processo (Database, catalogo) antes da medicao,
+    # como uma replica que ja atendeu alguem.
+    aquecer = Sessao("carga001", False, args.timeout, banco)
+    aquecer.login()
+    if aquecer.erros:
+        print("falha no aquecimento:", *aquecer.erros[:5], sep="\n  ")
+        return 1
+    banco.chamadas.clear()
+
+    print(f"banco local: {args.relatorios} relatorios, {args.usuarios} usuarios, "
+          f"latencia {args.latencia_banco_ms:g} ms; {args.ciclos} ciclo(s) por sessao, "
+          f"{args.admins:.0%} admins")
+    print(f"{'sessoes':>7} {'reruns':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} "
+          f"{'rerun/s':>7} {'CPU':>5} {'CPU/rerun':>9} {'MB/sessao':>9} {'banco/rerun':>11} erros")
+    resultados = []
+    offset = 0
+    for n in niveis:
+        r = medir_nivel(banco, n, args, offset)
+        offset += n
+        resultados.append(r)
+        print(f"{n:>7} {r['reruns']:>6} {r['p50_ms']:>5.0f}ms {r['p95_ms']:>5.0f}ms "
+              f"{r['p99_ms']:>5.0f}ms {r['max_ms']:>5.0f}ms {r['reruns_s']:>7.1f} "
+              f"{r['cpu_nucleos']:>5.2f} {r['cpu_ms_rerun']:>7.0f}ms {r['mb_sessao']:>9.1f} "
+              f"{r['chamadas_rerun']:>11.2f} {len(r['erros'])}")
+
+    ultimo = resultados[-1]
+    print(f"\npassos com {ultimo['sessoes']} sessao(oes) (p50 / p95):")
+    for passo, v in sorted(ultimo["passos"].items(), key=lambda kv: -kv[1]["p95_ms"]):
+        print(f"  {passo:<16} {v['p50_ms']:7.0f} / {v['p95_ms']:7.0f} ms  ({v['n']} reruns)")
+    print("\nchamadas ao banco (total):")
+    for (tabela, op), qtd in banco.chamadas.most_common(8):
+        print(f"  {tabela:<28} {op:<7} {qtd}")
+    erros = [e for r in resultados for e in r["erros"]]
+    if erros:
+        print(f"\n{len(erros)} erro(s); primeiros:")
+        for e in erros[:5]:
+            print(f"  {e}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "niveis": resultados}, f, indent=2)
+    return 1 if erros else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Perfil de inicializacao do portal: custo de import e da primeira renderizacao.
+
+Mede, cada parte em um interpretador novo (partida a frio, como um container
+recem-criado):
+
+- import dos modulos do app alem do proprio Streamlit (`-X importtime`),
+  com os pacotes mais caros;
+- tempo ate a primeira renderizacao da tela de login (AppTest, sem banco) e
+  de um rerun da mesma tela;
+- se dependencias pesadas (supabase, psycopg, passlib, Pillow, httpx) foram carregadas
+  antes do login, o que nao deve acontecer: elas sao importadas sob demanda.
+
+    python scripts/perfil_inicializacao.py
+    python scripts/perfil_inicializacao.py --top 25 --sem-orcamento
+
+Sai com codigo 1 quando algum numero passa do ORCAMENTO_MS abaixo. Ao mudar o
+orcamento, registre o motivo no commit.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULOS_APP = (
+    "database", "database_async", "modelos", "cache_portal", "cache_compartilhado",
+    "powerbi_embed", "verificador_links", "perfil_rerun", "componentes",
+)
+PESADOS = ("supabase", "postgrest", "psycopg", "passlib", "PIL", "httpx")
+
+# Orcamento (ms): medicao em container de 1 vCPU (import ~55, login frio ~680,
+# rerun ~280) com folga para variacao entre maquinas.
+ORCAMENTO_MS = {
+    "import_app": 150,
+    "login_frio": 1500,
+    "login_rerun": 400,
+}
+
+_SCRIPT_LOGIN = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+# Secrets ficticios: a tela de login nao pode depender do banco.
+at.secrets["SUPABASE_URL"] = "http://127.0.0.1:9"
+at.secrets["SUPABASE_KEY"] = "perfil"
+t0 = time.perf_counter()
+at.run()
+t1 = time.perf_counter()
+at.run()
+t2 = time.perf_counter()
+print(json.dumps({{
+    "login_frio": (t1 - t0) * 1000,
+    "login_rerun": (t2 - t1) * 1000,
+    "erros": [str(e.value)[:200] for e in at.exception] + [e.value[:200] for e in at.error],
+    "pesados": sorted({{m.split(".")[0] for m in sys.modules}} & set({pesados!r})),
+}}))
+"""
+
+
+def _rodar(args):
+    return subprocess.run(
+        [sys.executable, *args], cwd=RAIZ, capture_output=True, text=True, check=False,
+    )
+
+
+def medir_imports():
+    """(total_ms, [(ms, pacote)], pesados) dos imports do app apos o streamlit."""
+    codigo = "import streamlit\n" + "".join(f"import {m}\n" for m in MODULOS_APP)
+    saida = _rodar(["-X", "importtime", "-c", codigo])
+    if saida.returncode != 0:
+        raise SystemExit(saida.stderr)
+
+    # Linhas: "import time: <self us> | <cumulativo us> | <indentacao><modulo>".
+    # So os de nivel 0 somam sem contar duas vezes.
+    dentro_streamlit = True
+    total_us = 0
+    pacotes = {}
+    pesados = set()
+    for linha in saida.stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        _, cumulativo, nome = linha.split("|", 2)
+        if not cumulativo.strip().isdigit():
+            continue
+        nivel = len(nome) - len(nome.lstrip()) - 1
+        nome = nome.strip()
+        if nivel == 0 and nome == "streamlit":
+            dentro_streamlit = False
+            continue
+        if dentro_streamlit:
+            continue
+        raiz = nome.split(".")[0]
+        if raiz in PESADOS:
+            pesados.add(raiz)
+        if nivel == 0:
+            total_us += int(cumulativo)
+            pacotes[raiz] = pacotes.get(raiz, 0) + int(cumulativo)
+    ranking = sorted(((us / 1000, nome) for nome, us in pacotes.items()), reverse=True)
+    return total_us / 1000, ranking, sorted(pesados)
+
+
+def medir_login():
+    import json
+
+    codigo = _SCRIPT_LOGIN.format(app=os.path.join(RAIZ, "app.py"), pesados=PESADOS)
+    saida = _rodar(["-c", codigo])
+    if saida.returncode != 0:
+        raise SystemExit(saida.stderr)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=10, help="pacotes listados (padrao: 10)")
+    parser.add_argument("--sem-orcamento", action="store_true",
+                        help="so mostra os numeros, sem falhar pelo orcamento")
+    args = parser.parse_args(argv)
+
+    import_ms, ranking, pesados_import = medir_imports()
+    login = medir_login()
+    medidas = {
+        "import_app": import_ms,
+        "login_frio": login["login_frio"],
+        "login_rerun": login["login_rerun"],
+    }
+
+    print("Import dos modulos do app (alem do streamlit):")
+    for ms, nome in ranking[: args.top]:
+        print(f"  {ms:8.1f} ms  {nome}")
+    print()
+    estourou = []
+    for chave, ms in medidas.items():
+        limite = ORCAMENTO_MS[chave]
+        marca = "ok" if ms <= limite else "ACIMA"
+        if ms > limite:
+            estourou.append(chave)
+        print(f"{chave:<12} {ms:8.1f} ms  (orcamento {limite} ms)  {marca}")
+
+    pesados = sorted(set(pesados_import) | set(login["pesados"]))
+    print(f"dependencias pesadas antes do login: {', '.join(pesados) or 'nenhuma'}")
+    if login["erros"]:
+        print("erros na tela de login:")
+        for erro in login["erros"]:
+            print(f"  {erro}")
+
+    if args.sem_orcamento:
+        return 0
+    return 1 if estourou or pesados or login["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Purga de relatorios e usuarios excluidos (exclusao logica, `ativo = false`).
+
+O portal so marca as linhas ao excluir; este comando as remove fisicamente em
+lotes pequenos, cada lote em sua propria transacao, para nao segurar locks nem
+gerar um DELETE gigante. A carencia deixa a linha recuperavel por alguns dias
+(basta voltar `ativo` para true no SQL Editor). Agende diariamente (cron/CI ou
+`pg_cron` chamando `purgar_inativos()` em loop):
+
+    SUPABASE_DB_URL=postgresql://... python scripts/purgar_inativos.py --carencia-dias 30
+    python scripts/purgar_inativos.py --lote 200 --pausa 0.5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import psycopg
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--carencia-dias", type=int, default=30,
+                        help="so remove o que foi excluido ha mais dias que isto (padrao: 30)")
+    parser.add_argument("--lote", type=int, default=500,
+                        help="linhas por tabela em cada transacao (padrao: 500)")
+    parser.add_argument("--pausa", type=float, default=0.2,
+                        help="segundos entre lotes, para nao competir com o app (padrao: 0.2)")
+    parser.add_argument("--db-url", default=os.getenv("SUPABASE_DB_URL", ""),
+                        help="conexao Postgres (padrao: $SUPABASE_DB_URL)")
+    args = parser.parse_args(argv)
+
+    if not args.db_url:
+        parser.error("defina SUPABASE_DB_URL ou use --db-url")
+    if args.lote < 1 or args.carencia_dias < 0:
+        parser.error("--lote precisa ser >= 1 e --carencia-dias >= 0")
+
+    totais = {}
+    lotes = 0
+    with psycopg.connect(args.db_url, autocommit=True) as conn:
+        while True:
+            linhas = conn.execute(
+                "select tabela, removidas from public.purgar_inativos(%s, %s)",
+                (args.lote, args.carencia_dias),
+            ).fetchall()
+            lotes += 1
+            for tabela, removidas in linhas:
+                totais[tabela] = totais.get(tabela, 0) + removidas
+            if not any(removidas >= args.lote for _, removidas in linhas):
+                break
+            time.sleep(args.pausa)
+
+    print(f"lotes: {lotes}")
+    for tabela, total in totais.items():
+        print(f"  {tabela}: {total} removido(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Retencao do log de acessos: remove particoes mensais antigas de logs_acesso.
+
+Descartar uma particao inteira e instantaneo e nao gera o bloat/WAL de um
+DELETE em massa. Antes de remover, os agregados de uso sao atualizados
+(a popularidade historica continua valendo) e as particoes dos proximos meses
+sao criadas. Agende mensalmente (cron/CI ou `pg_cron` chamando as funcoes):
+
+    SUPABASE_DB_URL=postgresql://... python scripts/retencao_logs.py --manter-meses 12
+    python scripts/retencao_logs.py --simular   # so lista o que seria removido
+"""
+
+import argparse
+import os
+import sys
+
+import psycopg
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manter-meses", type=int, default=12,
+                        help="meses completos mantidos alem do mes atual (padrao: 12)")
+    parser.add_argument("--meses-a-frente", type=int, default=3,
+                        help="particoes futuras garantidas (padrao: 3)")
+    parser.add_argument("--simular", action="store_true",
+                        help="lista as particoes que seriam removidas, sem remover")
+    parser.add_argument("--db-url", default=os.getenv("SUPABASE_DB_URL", ""),
+                        help="conexao Postgres (padrao: $SUPABASE_DB_URL)")
+    args = parser.parse_args(argv)
+
+    if not args.db_url:
+        parser.error("defina SUPABASE_DB_URL ou use --db-url")
+    if args.manter_meses < 1:
+        parser.error("--manter-meses precisa ser >= 1")
+
+    with psycopg.connect(args.db_url, autocommit=True) as conn:
+        with conn.cursor() as cur:
+            if not args.simular:
+                cur.execute("select public.criar_particoes_logs_acesso(%s)", (args.meses_a_frente,))
+                print(f"particoes criadas: {cur.fetchone()[0]}")
+            cur.execute(
+                "select * from public.remover_particoes_logs_acesso(%s, %s)",
+                (args.manter_meses, args.simular),
+            )
+            removidas = [linha[0] for linha in cur.fetchall()]
+
+    acao = "seriam removidas" if args.simular else "removidas"
+    print(f"particoes {acao}: {len(removidas)}")
+    for nome in removidas:
+        print(f"  {nome}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
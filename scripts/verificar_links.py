@@ -0,0 +1,52 @@
+"""Verificacao dos links dos relatorios fora do app (cron/CI).
+
+Faz a mesma varredura da thread do portal (`verificador_links.py`) e grava o
+resultado em `links_status`; util com `LINKS_INTERVALO_S = 0` no app, quando a
+varredura fica a cargo de um agendador:
+
+    SUPABASE_URL=... SUPABASE_KEY=... python scripts/verificar_links.py
+    python scripts/verificar_links.py --alvo http://127.0.0.1:8000 --simular
+"""
+
+import argparse
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from verificador_links import SITUACAO_LABELS, VerificadorLinks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--alvo", default=os.getenv("LINKS_ALVO", ""),
+                        help="troca esquema/host dos links (padrao: $LINKS_ALVO)")
+    parser.add_argument("--simular", action="store_true",
+                        help="so mostra o resultado, sem gravar em links_status")
+    args = parser.parse_args(argv)
+
+    from database import Database
+
+    db = Database()
+    verificador = VerificadorLinks(alvo=args.alvo or None)
+    relatorios = db.links_para_verificar()
+    resultados = verificador.verificar(relatorios)
+    if not args.simular:
+        db.registrar_status_links(resultados)
+
+    contagem = {}
+    for r in resultados:
+        contagem[r["situacao"]] = contagem.get(r["situacao"], 0) + 1
+    print(f"links verificados: {len(resultados)}")
+    for situacao, rotulo in SITUACAO_LABELS.items():
+        print(f"  {rotulo}: {contagem.get(situacao, 0)}")
+    problemas = [r for r in resultados if r["situacao"] in ("quebrado", "erro")]
+    for r in problemas:
+        print(f"  #{r['relatorio_id']} {r['host'] or '-'} "
+              f"HTTP {r['http_status'] or '-'} {r['erro'] or ''}".rstrip())
+    return 1 if problemas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
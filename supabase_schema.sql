@@ -1,9 +1,11 @@
 -- Execute este script no SQL Editor do Supabase (instalacao nova).
--- Para uma base que ja existe (v2), use migration_v3.sql.
+-- Para uma base que ja existe, use migration_v3.sql (v2 -> v3) e depois
+-- migration_v4.sql (v3 -> v4).
 
 create table if not exists public.usuarios (
     id bigint generated by default as identity primary key,
-    username text unique not null,
+    -- Unico entre usuarios ativos (indice uq_usuarios_username_ativo).
+    username text not null,
     email text unique,
     password_hash text not null,
     is_admin boolean not null default false,
@@ -15,6 +17,8 @@ create table if not exists public.usuarios (
     -- Filtro secundario (restritivo): se preenchido, o usuario ve APENAS estes
     -- relatorios (dentro das areas/nivel permitidos). Vazio = todos da area.
     relatorios_permitidos jsonb not null default '[]'::jsonb,
+    -- Exclusao logica: ativo = false + excluido_em (trigger); purgar_inativos() remove depois.
+    excluido_em timestamptz,
     criado_em timestamptz not null default now()
 );
 
@@ -29,21 +33,232 @@ create table if not exists public.relatorios (
     tags text,
     criado_por bigint references public.usuarios(id) on delete set null,
     ativo boolean not null default true,
+    excluido_em timestamptz,
     criado_em timestamptz not null default now(),
     atualizado_em timestamptz not null default now()
 );
 
+-- Log de acessos particionado por mes de data_acesso: consultas por periodo
+-- so leem as particoes do intervalo e a retencao descarta particoes inteiras
+-- (sem DELETE em massa). A particao padrao recebe o que cair fora dos meses
+-- criados; criar_particoes_logs_acesso() move essas linhas para o mes certo.
 create table if not exists public.logs_acesso (
-    id bigint generated by default as identity primary key,
+    id bigserial,
     usuario_id bigint references public.usuarios(id) on delete set null,
     relatorio_id bigint references public.relatorios(id) on delete set null,
-    data_acesso timestamptz not null default now()
-);
+    data_acesso timestamptz not null default now(),
+    primary key (id, data_acesso)
+) partition by range (data_acesso);
+create table if not exists public.logs_acesso_padrao
+    partition of public.logs_acesso default;
+
+create index if not exists idx_logs_acesso_data_brin
+    on public.logs_acesso using brin (data_acesso);
+create index if not exists idx_logs_acesso_usuario on public.logs_acesso(usuario_id);
+create index if not exists idx_logs_acesso_relatorio on public.logs_acesso(relatorio_id);
+
+-- Cria as particoes mensais (UTC) de `p_desde` ate `p_meses_a_frente` meses
+-- adiante. Idempotente; devolve quantas criou.
+create or replace function public.criar_particoes_logs_acesso(
+    p_meses_a_frente integer default 3,
+    p_desde timestamptz default now()
+)
+returns integer
+language plpgsql
+as $$
+declare
+    v_mes timestamp := date_trunc('month', p_desde at time zone 'UTC');
+    v_ultimo timestamp := date_trunc('month', now() at time zone 'UTC')
+                          + make_interval(months => p_meses_a_frente);
+    v_de timestamptz;
+    v_ate timestamptz;
+    v_nome text;
+    v_criadas integer := 0;
+begin
+    while v_mes <= v_ultimo loop
+        v_nome := 'logs_acesso_' || to_char(v_mes, 'YYYY_MM');
+        v_de := v_mes at time zone 'UTC';
+        v_ate := (v_mes + interval '1 month') at time zone 'UTC';
+        if to_regclass('public.' || v_nome) is null then
+            -- Cria solta, traz as linhas do mes que estao na particao padrao e
+            -- so entao anexa (anexar com essas linhas na padrao falharia).
+            execute format(
+                'create table public.%I (like public.logs_acesso including defaults)', v_nome
+            );
+            execute format(
+                'insert into public.%I select * from public.logs_acesso_padrao'
+                ' where data_acesso >= $1 and data_acesso < $2', v_nome
+            ) using v_de, v_ate;
+            delete from public.logs_acesso_padrao
+            where data_acesso >= v_de and data_acesso < v_ate;
+            execute format(
+                'alter table public.logs_acesso attach partition public.%I'
+                ' for values from (%L) to (%L)', v_nome, v_de, v_ate
+            );
+            v_criadas := v_criadas + 1;
+        end if;
+        v_mes := v_mes + interval '1 month';
+    end loop;
+    return v_criadas;
+end;
+$$;
+
+-- Retencao: desanexa e remove as particoes mensais anteriores aos ultimos
+-- `p_manter_meses` meses. Os agregados de uso sao atualizados antes, entao a
+-- popularidade historica nao se perde. Com `p_simular` so lista as particoes.
+create or replace function public.remover_particoes_logs_acesso(
+    p_manter_meses integer default 12,
+    p_simular boolean default false
+)
+returns setof text
+language plpgsql
+as $$
+declare
+    v_corte date := (date_trunc('month', now() at time zone 'UTC')
+                     - make_interval(months => p_manter_meses))::date;
+    v_nome text;
+begin
+    if not p_simular then
+        perform public.atualizar_rollups_acesso();
+    end if;
+    for v_nome in
+        select c.relname
+        from pg_inherits i
+        join pg_class c on c.oid = i.inhrelid
+        where i.inhparent = 'public.logs_acesso'::regclass
+          and c.relname ~ '^logs_acesso_[0-9]{4}_[0-9]{2}$'
+          and to_date(substr(c.relname, 13), 'YYYY_MM') < v_corte
+        order by c.relname
+    loop
+        if not p_simular then
+            execute format('alter table public.logs_acesso detach partition public.%I', v_nome);
+            execute format('drop table public.%I', v_nome);
+        end if;
+        return next v_nome;
+    end loop;
+end;
+$$;
+
+select public.criar_particoes_logs_acesso(3);
 
-create index if not exists idx_relatorios_categoria on public.relatorios(categoria);
-create index if not exists idx_relatorios_nivel on public.relatorios(nivel_hierarquia);
 create index if not exists idx_relatorios_criado_por on public.relatorios(criado_por);
-create index if not exists idx_usuarios_username on public.usuarios(username);
+-- Exclusao logica: as leituras do portal so enxergam linhas com `ativo`, entao
+-- os indices das consultas sao parciais (`where ativo`) e ignoram o que aguarda
+-- a purga. Formatos de consulta: ver scripts/analisar_indices.py.
+-- Catalogo por area (categoria in (...) order by criado_em desc) e completo.
+create index if not exists idx_relatorios_ativos_cat_nivel_criado
+    on public.relatorios(categoria, nivel_hierarquia, criado_em desc) where ativo;
+create index if not exists idx_relatorios_ativos_criado_em
+    on public.relatorios(criado_em desc) where ativo;
+-- Username unico so entre ativos: um usuario excluido nao prende o nome.
+create unique index if not exists uq_usuarios_username_ativo
+    on public.usuarios(username) where ativo;
+alter table public.usuarios drop constraint if exists usuarios_username_key;
+-- Paginacao da lista de usuarios (ordem criado_em desc) e filtro por area.
+create index if not exists idx_usuarios_ativos_criado_em
+    on public.usuarios(criado_em desc, id desc) where ativo;
+create index if not exists idx_usuarios_ativos_categorias
+    on public.usuarios using gin (categorias_permitidas jsonb_path_ops) where ativo;
+-- Typeahead de relatorios e busca de usuarios (prefixo, ILIKE).
+create extension if not exists pg_trgm;
+create index if not exists idx_relatorios_ativos_titulo_trgm
+    on public.relatorios using gin (titulo gin_trgm_ops) where ativo;
+create index if not exists idx_usuarios_ativos_username_trgm
+    on public.usuarios using gin (username gin_trgm_ops) where ativo;
+-- Fila da purga: inativos por data de exclusao.
+create index if not exists idx_relatorios_excluidos
+    on public.relatorios(excluido_em) where not ativo;
+create index if not exists idx_usuarios_excluidos
+    on public.usuarios(excluido_em) where not ativo;
+-- excluido_em vem do relogio do banco, nao do cliente: marcado quando `ativo`
+-- vira false (e limpo se a linha voltar a ativa). O app so grava ativo = false.
+create or replace function public.marcar_excluido_em()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.excluido_em = case when new.ativo then null else now() end;
+    return new;
+end;
+$$;
+
+drop trigger if exists trg_usuarios_excluido_em on public.usuarios;
+create trigger trg_usuarios_excluido_em
+before update of ativo on public.usuarios
+for each row
+when (old.ativo is distinct from new.ativo)
+execute function public.marcar_excluido_em();
+
+drop trigger if exists trg_relatorios_excluido_em on public.relatorios;
+create trigger trg_relatorios_excluido_em
+before update of ativo on public.relatorios
+for each row
+when (old.ativo is distinct from new.ativo)
+execute function public.marcar_excluido_em();
+-- Substituidos pelas versoes parciais acima (ou redundantes).
+drop index if exists public.idx_relatorios_categoria;
+drop index if exists public.idx_relatorios_nivel;
+drop index if exists public.idx_relatorios_cat_nivel_criado;
+drop index if exists public.idx_relatorios_criado_em;
+drop index if exists public.idx_relatorios_titulo_trgm;
+drop index if exists public.idx_usuarios_username;
+drop index if exists public.idx_usuarios_criado_em;
+drop index if exists public.idx_usuarios_categorias;
+drop index if exists public.idx_usuarios_username_trgm;
+
+-- Remove fisicamente ate `p_lote` relatorios e `p_lote` usuarios inativos ha
+-- mais de `p_carencia_dias` dias (e o log de exclusoes do mesmo periodo). Lotes pequenos seguram locks por pouco tempo
+-- (as FKs de logs_acesso e criado_por sao indexadas); chame em loop ate
+-- devolver zero (scripts/purgar_inativos.py).
+create or replace function public.purgar_inativos(
+    p_lote integer default 500,
+    p_carencia_dias integer default 30
+)
+returns table (tabela text, removidas integer)
+language plpgsql
+as $$
+declare
+    v_limite timestamptz := now() - make_interval(days => p_carencia_dias);
+begin
+    with alvo as (
+        select id from public.relatorios
+        where not ativo and excluido_em < v_limite
+        order by excluido_em
+        limit p_lote
+        for update skip locked
+    )
+    delete from public.relatorios r using alvo where r.id = alvo.id;
+    get diagnostics removidas = row_count;
+    tabela := 'relatorios';
+    return next;
+
+    with alvo as (
+        select id from public.usuarios
+        where not ativo and excluido_em < v_limite
+        order by excluido_em
+        limit p_lote
+        for update skip locked
+    )
+    delete from public.usuarios u using alvo where u.id = alvo.id;
+    get diagnostics removidas = row_count;
+    tabela := 'usuarios';
+    return next;
+
+    -- Log de exclusoes: o app recarrega o catalogo inteiro bem antes disso.
+    with alvo as (
+        select relatorio_id from public.relatorios_exclusoes
+        where excluido_em < v_limite
+        order by excluido_em
+        limit p_lote
+        for update skip locked
+    )
+    delete from public.relatorios_exclusoes e using alvo
+    where e.relatorio_id = alvo.relatorio_id;
+    get diagnostics removidas = row_count;
+    tabela := 'relatorios_exclusoes';
+    return next;
+end;
+$$;
 
 -- Atualiza atualizado_em automaticamente.
 create or replace function public.set_relatorio_updated_at()
@@ -62,8 +277,489 @@ before update on public.relatorios
 for each row
 execute function public.set_relatorio_updated_at();
 
+-- Sincronizacao incremental do catalogo: o app busca so os relatorios com
+-- atualizado_em depois da sua ultima marca e, para saber o que sumiu, as
+-- linhas deste log (a exclusao logica tira o relatorio das leituras `where
+-- ativo`, e um DELETE nao deixa linha nenhuma).
+create table if not exists public.relatorios_exclusoes (
+    relatorio_id bigint primary key,
+    excluido_em timestamptz not null default now()
+);
+create index if not exists idx_relatorios_exclusoes_excluido_em
+    on public.relatorios_exclusoes(excluido_em);
+create index if not exists idx_relatorios_ativos_atualizado_em
+    on public.relatorios(atualizado_em) where ativo;
+
+create or replace function public.registrar_exclusao_relatorio()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.relatorios_exclusoes (relatorio_id, excluido_em)
+    values (old.id, now())
+    on conflict (relatorio_id) do update set excluido_em = excluded.excluido_em;
+    return null;
+end;
+$$;
+
+-- Exclusao logica (ativo -> false) ou DELETE de relatorio ainda ativo (a
+-- purga so apaga inativos, ja registrados).
+drop trigger if exists trg_relatorios_exclusao on public.relatorios;
+create trigger trg_relatorios_exclusao
+after update of ativo on public.relatorios
+for each row
+when (old.ativo and not new.ativo)
+execute function public.registrar_exclusao_relatorio();
+
+drop trigger if exists trg_relatorios_exclusao_delete on public.relatorios;
+create trigger trg_relatorios_exclusao_delete
+after delete on public.relatorios
+for each row
+when (old.ativo)
+execute function public.registrar_exclusao_relatorio();
+
+-- Saude dos links (verificador_links.py): ultima verificacao de cada
+-- relatorio, sobrescrita a cada varredura.
+create table if not exists public.links_status (
+    relatorio_id bigint primary key references public.relatorios(id) on delete cascade,
+    situacao text not null,
+    http_status integer,
+    latencia_ms integer,
+    host text,
+    erro text,
+    verificado_em timestamptz not null default now()
+);
+
+-- Avisa os processos do portal (LISTEN portal_alteracoes) de cada linha
+-- gravada, venha a escrita do app, de outra replica ou do SQL Editor. O payload
+-- leva so tabela, operacao, id, a versao (atualizado_em, quando existir) e, em
+-- UPDATE, os nomes das colunas que mudaram (quem so depende de algumas ignora
+-- o resto).
+create or replace function public.notificar_alteracao()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_linha jsonb := to_jsonb(case when tg_op = 'DELETE' then old else new end);
+    v_campos jsonb;
+begin
+    if tg_op = 'UPDATE' then
+        select coalesce(jsonb_agg(n.key), '[]'::jsonb) into v_campos
+        from jsonb_each(v_linha) n
+        where n.value is distinct from to_jsonb(old) -> n.key;
+    end if;
+    perform pg_notify(
+        'portal_alteracoes',
+        json_build_object(
+            'tabela', tg_table_name,
+            'op', tg_op,
+            'id', v_linha -> 'id',
+            'versao', v_linha -> 'atualizado_em',
+            'campos', v_campos
+        )::text
+    );
+    return null;
+end;
+$$;
+
+drop trigger if exists trg_relatorios_notificar on public.relatorios;
+create trigger trg_relatorios_notificar
+after insert or update or delete on public.relatorios
+for each row
+execute function public.notificar_alteracao();
+
+-- Troca de senha (password_hash) nao muda nada que esteja em cache.
+drop trigger if exists trg_usuarios_notificar on public.usuarios;
+create trigger trg_usuarios_notificar
+after insert or delete or update of username, is_admin, ativo, nivel_hierarquia,
+    categorias_permitidas, relatorios_permitidos, permissoes_efetivas on public.usuarios
+for each row
+execute function public.notificar_alteracao();
+
+-- Grupos de acesso: perfis (areas, nivel, liberacao individual) compartilhados
+-- por varios usuarios. Mudar um grupo e um UPDATE de uma linha; os triggers
+-- abaixo rematerializam as permissoes efetivas so dos membros.
+create table if not exists public.grupos_acesso (
+    id bigint generated by default as identity primary key,
+    nome text not null unique,
+    descricao text,
+    nivel_hierarquia text not null default 'operacao',
+    categorias_permitidas jsonb not null default '[]'::jsonb,
+    relatorios_permitidos jsonb not null default '[]'::jsonb,
+    criado_em timestamptz not null default now(),
+    atualizado_em timestamptz not null default now()
+);
+
+create table if not exists public.usuarios_grupos (
+    usuario_id bigint not null references public.usuarios(id) on delete cascade,
+    grupo_id bigint not null references public.grupos_acesso(id) on delete cascade,
+    primary key (usuario_id, grupo_id)
+);
+create index if not exists idx_usuarios_grupos_grupo on public.usuarios_grupos(grupo_id);
+
+-- Permissoes efetivas (proprias + grupos), materializadas na linha do usuario:
+-- {"grupos": [ids], "nivel": maior nivel, "areas": uniao das areas,
+--  "concessoes": [{"nivel", "areas", "relatorios"}, ...]}.
+-- Cada concessao vale como hoje (area E nivel E, se houver, liberacao
+-- individual); o usuario ve o que qualquer concessao libera. Fontes com o
+-- mesmo nivel e a mesma liberacao individual viram uma concessao so.
+alter table public.usuarios add column if not exists permissoes_efetivas jsonb;
+
+create or replace function public.permissoes_efetivas_de(
+    p_usuario_id bigint,
+    p_nivel text,
+    p_areas jsonb,
+    p_relatorios jsonb
+)
+returns jsonb
+language sql
+stable
+as $$
+    with fontes as (
+        select p_nivel as nivel,
+               coalesce(p_areas, '[]'::jsonb) as areas,
+               coalesce(p_relatorios, '[]'::jsonb) as relatorios
+        union all
+        select g.nivel_hierarquia, g.categorias_permitidas, g.relatorios_permitidos
+        from public.usuarios_grupos ug
+        join public.grupos_acesso g on g.id = ug.grupo_id
+        where ug.usuario_id = p_usuario_id
+    ),
+    concessoes as (
+        select f.nivel, f.relatorios, jsonb_agg(distinct a.x) as areas
+        from fontes f
+        cross join lateral jsonb_array_elements(f.areas) a(x)
+        group by f.nivel, f.relatorios
+    )
+    select jsonb_build_object(
+        'grupos', coalesce(
+            (select jsonb_agg(ug.grupo_id order by ug.grupo_id)
+             from public.usuarios_grupos ug where ug.usuario_id = p_usuario_id),
+            '[]'::jsonb),
+        'nivel', case when exists (select 1 from concessoes c where c.nivel = 'gestao')
+                      then 'gestao' else 'operacao' end,
+        'areas', coalesce(
+            (select jsonb_agg(distinct a.x)
+             from concessoes c cross join lateral jsonb_array_elements(c.areas) a(x)),
+            '[]'::jsonb),
+        'concessoes', coalesce(
+            (select jsonb_agg(jsonb_build_object(
+                 'nivel', c.nivel, 'areas', c.areas, 'relatorios', c.relatorios))
+             from concessoes c),
+            '[]'::jsonb)
+    )
+$$;
+
+-- Rematerializa os usuarios `p_usuarios`; so grava quem mudou. Devolve quantos.
+create or replace function public.recalcular_permissoes_efetivas(p_usuarios bigint[])
+returns integer
+language plpgsql
+as $$
+declare
+    v_qtd integer;
+begin
+    with calculadas as (
+        select u.id,
+               public.permissoes_efetivas_de(
+                   u.id, u.nivel_hierarquia, u.categorias_permitidas, u.relatorios_permitidos
+               ) as efetivas
+        from public.usuarios u
+        where u.id = any(p_usuarios)
+    )
+    update public.usuarios u
+    set permissoes_efetivas = c.efetivas
+    from calculadas c
+    where u.id = c.id and u.permissoes_efetivas is distinct from c.efetivas;
+    get diagnostics v_qtd = row_count;
+    return v_qtd;
+end;
+$$;
+
+-- Permissoes proprias alteradas: recalcula na propria linha, antes de gravar.
+create or replace function public.usuarios_calcular_permissoes()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.permissoes_efetivas := public.permissoes_efetivas_de(
+        new.id, new.nivel_hierarquia, new.categorias_permitidas, new.relatorios_permitidos
+    );
+    return new;
+end;
+$$;
+
+drop trigger if exists trg_usuarios_permissoes on public.usuarios;
+create trigger trg_usuarios_permissoes
+before insert or update of nivel_hierarquia, categorias_permitidas, relatorios_permitidos
+on public.usuarios
+for each row
+execute function public.usuarios_calcular_permissoes();
+
+-- Entrada/saida de grupos: um recalculo por comando, para todos os envolvidos
+-- (inclui a remocao em cascata ao excluir um grupo).
+create or replace function public.usuarios_grupos_recalcular()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        perform public.recalcular_permissoes_efetivas(array(select distinct usuario_id from novos));
+    else
+        perform public.recalcular_permissoes_efetivas(array(select distinct usuario_id from antigos));
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists trg_usuarios_grupos_inserir on public.usuarios_grupos;
+create trigger trg_usuarios_grupos_inserir
+after insert on public.usuarios_grupos
+referencing new table as novos
+for each statement
+execute function public.usuarios_grupos_recalcular();
+
+drop trigger if exists trg_usuarios_grupos_remover on public.usuarios_grupos;
+create trigger trg_usuarios_grupos_remover
+after delete on public.usuarios_grupos
+referencing old table as antigos
+for each statement
+execute function public.usuarios_grupos_recalcular();
+
+-- Grupo alterado: recalcula os membros dos grupos do comando.
+create or replace function public.grupos_acesso_recalcular()
+returns trigger
+language plpgsql
+as $$
+begin
+    perform public.recalcular_permissoes_efetivas(array(
+        select distinct ug.usuario_id
+        from public.usuarios_grupos ug
+        join novos n on n.id = ug.grupo_id
+    ));
+    return null;
+end;
+$$;
+
+drop trigger if exists trg_grupos_acesso_recalcular on public.grupos_acesso;
+create trigger trg_grupos_acesso_recalcular
+after update on public.grupos_acesso
+referencing new table as novos
+for each statement
+execute function public.grupos_acesso_recalcular();
+
+drop trigger if exists trg_grupos_acesso_updated_at on public.grupos_acesso;
+create trigger trg_grupos_acesso_updated_at
+before update on public.grupos_acesso
+for each row
+execute function public.set_relatorio_updated_at();
+
+drop trigger if exists trg_grupos_acesso_notificar on public.grupos_acesso;
+create trigger trg_grupos_acesso_notificar
+after insert or update or delete on public.grupos_acesso
+for each row
+execute function public.notificar_alteracao();
+
+-- Usuarios anteriores aos grupos.
+update public.usuarios
+set permissoes_efetivas = public.permissoes_efetivas_de(
+    id, nivel_hierarquia, categorias_permitidas, relatorios_permitidos
+)
+where permissoes_efetivas is null;
+
+-- Alteracao de permissoes em massa: um unico UPDATE para todos os usuarios
+-- comuns ativos que casam com os filtros (os mesmos da lista de usuarios).
+-- Devolve so as linhas que mudam, ja com os valores novos (inclusive as
+-- permissoes efetivas); com p_simular nada e gravado (pre-visualizacao). Acoes e p_valor:
+--   adicionar_areas / remover_areas        lista de areas
+--   definir_nivel                          'gestao' ou 'operacao'
+--   liberar_relatorios / revogar_relatorios lista de ids de relatorio
+-- liberar_relatorios so altera quem ja tem liberacao individual: para os
+-- demais, lista vazia significa "todos os relatorios das areas".
+drop function if exists public.permissoes_em_massa(text, jsonb, text, text, text, bigint[], boolean);
+create or replace function public.permissoes_em_massa(
+    p_acao text,
+    p_valor jsonb,
+    p_busca text default null,
+    p_nivel text default null,
+    p_area text default null,
+    p_ids bigint[] default null,
+    p_simular boolean default false
+)
+returns table (
+    id bigint,
+    username text,
+    is_admin boolean,
+    nivel_hierarquia text,
+    categorias_permitidas jsonb,
+    relatorios_permitidos jsonb,
+    criado_em timestamptz,
+    permissoes_efetivas jsonb
+)
+language sql
+as $$
+    with alvo as (
+        select
+            u.id, u.username, u.is_admin, u.criado_em,
+            u.nivel_hierarquia as nivel_antes,
+            u.categorias_permitidas as areas_antes,
+            u.relatorios_permitidos as rels_antes,
+            case when p_acao = 'definir_nivel' then p_valor #>> '{}'
+                 else u.nivel_hierarquia end as nivel_depois,
+            case p_acao
+                when 'adicionar_areas' then u.categorias_permitidas || coalesce(
+                    (select jsonb_agg(v.x) from jsonb_array_elements(p_valor) v(x)
+                     where not u.categorias_permitidas @> jsonb_build_array(v.x)),
+                    '[]'::jsonb)
+                when 'remover_areas' then coalesce(
+                    (select jsonb_agg(e.x order by e.i)
+                     from jsonb_array_elements(u.categorias_permitidas) with ordinality e(x, i)
+                     where not p_valor @> jsonb_build_array(e.x)),
+                    '[]'::jsonb)
+                else u.categorias_permitidas
+            end as areas_depois,
+            case
+                when p_acao = 'liberar_relatorios'
+                     and jsonb_array_length(u.relatorios_permitidos) > 0
+                    then u.relatorios_permitidos || coalesce(
+                        (select jsonb_agg(v.x) from jsonb_array_elements(p_valor) v(x)
+                         where not u.relatorios_permitidos @> jsonb_build_array(v.x)),
+                        '[]'::jsonb)
+                when p_acao = 'revogar_relatorios' then coalesce(
+                    (select jsonb_agg(e.x order by e.i)
+                     from jsonb_array_elements(u.relatorios_permitidos) with ordinality e(x, i)
+                     where not p_valor @> jsonb_build_array(e.x)),
+                    '[]'::jsonb)
+                else u.relatorios_permitidos
+            end as rels_depois
+        from public.usuarios u
+        where u.ativo and not u.is_admin
+          and (p_ids is null or u.id = any(p_ids))
+          and (p_busca is null or u.username ilike p_busca)
+          and (p_nivel is null or u.nivel_hierarquia = p_nivel)
+          and (p_area is null or u.categorias_permitidas @> jsonb_build_array(p_area))
+        for update of u
+    ),
+    mudam as (
+        select * from alvo
+        where nivel_depois is distinct from nivel_antes
+           or areas_depois is distinct from areas_antes
+           or rels_depois is distinct from rels_antes
+    ),
+    gravados as (
+        update public.usuarios u
+        set nivel_hierarquia = m.nivel_depois,
+            categorias_permitidas = m.areas_depois,
+            relatorios_permitidos = m.rels_depois
+        from mudam m
+        where u.id = m.id and not p_simular
+        returning u.id
+    )
+    select m.id, m.username, m.is_admin, m.nivel_depois, m.areas_depois,
+           m.rels_depois, m.criado_em,
+           public.permissoes_efetivas_de(m.id, m.nivel_depois, m.areas_depois, m.rels_depois)
+    from mudam m
+    order by m.criado_em desc, m.id desc
+$$;
+
+-- Agregados de uso (popularidade) alimentados incrementalmente a partir de
+-- logs_acesso, usando logs_acesso.id como marca d'agua (rollup_estado).
+create table if not exists public.acessos_relatorio_dia (
+    relatorio_id bigint not null,
+    dia date not null,
+    acessos integer not null default 0,
+    primary key (relatorio_id, dia)
+);
+create index if not exists idx_acessos_relatorio_dia_dia on public.acessos_relatorio_dia(dia);
+
+create table if not exists public.acessos_usuario_dia (
+    usuario_id bigint not null,
+    dia date not null,
+    acessos integer not null default 0,
+    primary key (usuario_id, dia)
+);
+create index if not exists idx_acessos_usuario_dia_dia on public.acessos_usuario_dia(dia);
+
+create table if not exists public.rollup_estado (
+    nome text primary key,
+    ultimo_id bigint not null default 0,
+    atualizado_em timestamptz not null default now()
+);
+
+create or replace function public.atualizar_rollups_acesso()
+returns bigint
+language plpgsql
+as $$
+declare
+    v_de bigint;
+    v_ate bigint;
+begin
+    -- Um agregador por vez; quem nao pega o lock sai sem esperar.
+    if not pg_try_advisory_xact_lock(hashtext('rollups_acesso')) then
+        return 0;
+    end if;
+    insert into public.rollup_estado (nome) values ('logs_acesso') on conflict do nothing;
+    select ultimo_id into v_de from public.rollup_estado where nome = 'logs_acesso' for update;
+    -- So agrega linhas com alguns segundos de idade: ids de transacoes ainda
+    -- abertas nao ficam para tras da marca d'agua.
+    select coalesce(max(id), v_de) into v_ate
+    from public.logs_acesso
+    where id > v_de and data_acesso < now() - interval '30 seconds';
+    if v_ate <= v_de then
+        return 0;
+    end if;
+
+    insert into public.acessos_relatorio_dia as a (relatorio_id, dia, acessos)
+    select relatorio_id, (data_acesso at time zone 'America/Sao_Paulo')::date, count(*)
+    from public.logs_acesso
+    where id > v_de and id <= v_ate and relatorio_id is not null
+    group by 1, 2
+    on conflict (relatorio_id, dia) do update set acessos = a.acessos + excluded.acessos;
+
+    insert into public.acessos_usuario_dia as a (usuario_id, dia, acessos)
+    select usuario_id, (data_acesso at time zone 'America/Sao_Paulo')::date, count(*)
+    from public.logs_acesso
+    where id > v_de and id <= v_ate and usuario_id is not null
+    group by 1, 2
+    on conflict (usuario_id, dia) do update set acessos = a.acessos + excluded.acessos;
+
+    update public.rollup_estado
+    set ultimo_id = v_ate, atualizado_em = now()
+    where nome = 'logs_acesso';
+    return v_ate - v_de;
+end;
+$$;
+
+create or replace function public.popularidade_relatorios(p_dias integer default 30)
+returns table (relatorio_id bigint, acessos bigint, ultimo_dia date)
+language sql
+stable
+as $$
+    select relatorio_id, sum(acessos)::bigint, max(dia)
+    from public.acessos_relatorio_dia
+    where dia > current_date - p_dias
+    group by relatorio_id
+$$;
+
+create or replace function public.atividade_usuarios(p_dias integer default 30)
+returns table (usuario_id bigint, acessos bigint, ultimo_dia date)
+language sql
+stable
+as $$
+    select usuario_id, sum(acessos)::bigint, max(dia)
+    from public.acessos_usuario_dia
+    where dia > current_date - p_dias
+    group by usuario_id
+$$;
+
 -- Para ambientes internos simples, voce pode manter RLS desativado.
 -- Se quiser habilitar RLS, crie policies para leitura/escrita com service role
 -- ou via autenticacao do Supabase Auth.
 alter table public.usuarios disable row level security;
 alter table public.relatorios disable row level security;
+alter table public.acessos_relatorio_dia disable row level security;
+alter table public.acessos_usuario_dia disable row level security;
+alter table public.rollup_estado disable row level security;
+alter table public.grupos_acesso disable row level security;
+alter table public.usuarios_grupos disable row level security;
+alter table public.relatorios_exclusoes disable row level security;
+alter table public.links_status disable row level security;
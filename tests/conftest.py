@@ -0,0 +1,31 @@
+"""Configuracao comum dos testes: os modulos do portal ficam na raiz do repo
+(sem pacote), como os scripts/ fazem."""
+
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture
+def servidor_local():
+    """Sobe um servidor HTTP local (stand-in do servico externo) com o handler
+    dado e devolve a URL base; derrubado no fim do teste."""
+    servidores = []
+
+    def subir(handler):
+        servidor = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        servidores.append(servidor)
+        return f"http://127.0.0.1:{servidor.server_address[1]}"
+
+    yield subir
+    for servidor in servidores:
+        servidor.shutdown()
+        servidor.server_close()
@@ -0,0 +1,41 @@
+from cache_compartilhado import CacheCompartilhado
+from cache_portal import CacheIndexado
+
+
+class _Backend:
+    """Stand-in do Redis: get/set/incr em um dict, guardando o `ex` de cada set."""
+
+    def __init__(self):
+        self.dados = {}
+        self.validade = {}
+
+    def get(self, chave):
+        return self.dados.get(chave)
+
+    def set(self, chave, valor, ex=None):
+        self.dados[chave] = valor
+        self.validade[chave] = ex
+
+    def incr(self, chave):
+        self.dados[chave] = str(int(self.dados.get(chave) or 0) + 1)
+
+
+def test_l2_grava_com_o_ttl_do_cache_que_consultou():
+    backend = _Backend()
+    l2 = CacheCompartilhado(backend, ttl=120)
+    ttl = {"s": 900}  # ex.: LISTEN confirmado
+    cache = CacheIndexado("relatorios", ttl=lambda: ttl["s"], compartilhado=l2)
+    cache.consulta("todos", lambda: ([{"id": 1}], 1))
+    ttl["s"] = 120  # a escuta caiu
+    cache.consulta("outra", lambda: ([{"id": 2}], 1))
+    assert sorted(backend.validade.values()) == [120, 900]
+
+
+def test_l2_sem_ttl_usa_o_da_camada_e_le_das_outras_replicas():
+    backend = _Backend()
+    l2 = CacheCompartilhado(backend, ttl=300)
+    assert l2.consulta("t", "k", lambda: ([{"id": 1}], 1)) == ([{"id": 1}], 1)
+    assert list(backend.validade.values()) == [300]
+    # Outra replica: mesmo backend, nao chama o banco.
+    outra = CacheCompartilhado(backend)
+    assert outra.consulta("t", "k", lambda: ([], 0)) == ([{"id": 1}], 1)
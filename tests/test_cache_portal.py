@@ -0,0 +1,270 @@
+import pytest
+
+import cache_portal
+from cache_portal import CacheIndexado
+
+
+class Relogio:
+    """time.time() controlado pelo teste."""
+
+    def __init__(self, agora=1000.0):
+        self.agora = agora
+
+    def __call__(self):
+        return self.agora
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(cache_portal.time, "time", r)
+    return r
+
+
+class Carga:
+    """carregar() que conta as chamadas e devolve as linhas atuais."""
+
+    def __init__(self, linhas):
+        self.linhas = [dict(linha) for linha in linhas]
+        self.chamadas = 0
+
+    def __call__(self):
+        self.chamadas += 1
+        return [dict(linha) for linha in self.linhas], len(self.linhas)
+
+
+def _linhas(*ids, **extra):
+    return [{"id": i, "nome": f"n{i}", **extra} for i in ids]
+
+
+# ------------------------------------------------------------------- TTL
+def test_consulta_em_cache_ate_vencer_o_ttl(relogio):
+    cache = CacheIndexado("t", ttl=60)
+    carga = Carga(_linhas(1, 2))
+    assert cache.consulta("todos", carga) == (carga.linhas, 2)
+    relogio.avancar(59)
+    cache.consulta("todos", carga)
+    assert carga.chamadas == 1
+    relogio.avancar(2)
+    cache.consulta("todos", carga)
+    assert carga.chamadas == 2
+
+
+def test_ttl_funcao_e_lido_a_cada_consulta(relogio):
+    ttl = {"s": 600}
+    cache = CacheIndexado("t", ttl=lambda: ttl["s"])
+    carga = Carga(_linhas(1))
+    cache.consulta("todos", carga)
+    relogio.avancar(120)
+    cache.consulta("todos", carga)
+    assert carga.chamadas == 1
+    ttl["s"] = 60  # ex.: a escuta caiu
+    cache.consulta("todos", carga)
+    assert carga.chamadas == 2
+
+
+def test_obter_recarrega_linha_vencida(relogio):
+    cache = CacheIndexado("t", ttl=60)
+    versoes = iter(range(1, 10))
+
+    def carregar(item_id):
+        return {"id": item_id, "v": next(versoes)}
+
+    assert cache.obter(7, carregar)["v"] == 1
+    relogio.avancar(30)
+    assert cache.obter(7, carregar)["v"] == 1
+    relogio.avancar(31)
+    assert cache.obter(7, carregar)["v"] == 2
+
+
+def test_obter_varios_busca_so_faltantes_e_vencidas(relogio):
+    cache = CacheIndexado("t", ttl=60)
+    pedidos = []
+
+    def carregar_varios(ids):
+        pedidos.append(list(ids))
+        return [{"id": i} for i in ids if i != 99]
+
+    assert [r["id"] for r in cache.obter_varios([1, 2, 99], carregar_varios)] == [1, 2]
+    cache.obter_varios([1, 2], carregar_varios)
+    relogio.avancar(30)
+    cache.obter(3, lambda i: {"id": i})
+    relogio.avancar(31)
+    cache.obter_varios([1, 3], carregar_varios)
+    assert pedidos == [[1, 2, 99], [1]]
+
+
+def test_linhas_avulsas_limitadas_sem_perder_as_das_consultas(relogio):
+    cache = CacheIndexado("t", max_avulsas=10)
+    cache.consulta("todos", Carga(_linhas(*range(100, 150))))
+    for i in range(40):
+        relogio.avancar(1)
+        cache.obter(i, lambda item_id: {"id": item_id})
+    em_cache = {linha["id"] for linha in cache.linhas()}
+    assert set(range(100, 150)) <= em_cache
+    avulsas = em_cache - set(range(100, 150))
+    assert len(avulsas) <= 10
+    assert 39 in avulsas  # as mais recentes ficam
+
+
+# --------------------------------------------------------- patches locais
+def test_vencer_recarrega_sem_descartar_linhas(relogio):
+    cache = CacheIndexado("t", ttl=600)
+    carga = Carga(_linhas(1, 2))
+    cache.consulta("todos", carga)
+    cache.vencer()
+    assert cache.obter(1, lambda i: None) is not None
+    cache.consulta("todos", carga)
+    assert carga.chamadas == 2
+
+
+def test_remover_tira_a_linha_das_listas_e_descarta_paginas(relogio):
+    cache = CacheIndexado("t", ttl=600)
+    lista, pagina = Carga(_linhas(1, 2, 3)), Carga(_linhas(1, 2))
+    cache.consulta("todos", lista)
+    cache.consulta("p1", pagina, paginada=True)
+    cache.remover(2)
+    linhas, total = cache.consulta("todos", lista)
+    assert [r["id"] for r in linhas] == [1, 3] and total == 2
+    assert lista.chamadas == 1
+    cache.consulta("p1", pagina, paginada=True)
+    assert pagina.chamadas == 2
+
+
+def test_aplicar_respeita_filtro_e_ordem(relogio):
+    cache = CacheIndexado("t", ttl=600)
+    cache.consulta(
+        "ativos", Carga([{"id": 1, "nome": "b", "ok": True}, {"id": 2, "nome": "c", "ok": True}]),
+        pred=lambda r: r["ok"], ordem=lambda r: r["nome"],
+    )
+    cache.aplicar({"id": 3, "nome": "a", "ok": True}, nova=True)
+    cache.aplicar({"id": 2, "nome": "c", "ok": False})
+    linhas, total = cache.consulta("ativos", Carga([]))
+    assert [r["id"] for r in linhas] == [3, 1] and total == 2
+
+
+def test_aplicar_versao_mais_antiga_descarta_o_cache(relogio):
+    cache = CacheIndexado("t", versao_de=lambda r: r.get("atualizado_em"), ttl=600)
+    carga = Carga([{"id": 1, "atualizado_em": "2026-01-02T00:00:00+00:00"}])
+    cache.consulta("todos", carga)
+    cache.aplicar({"id": 1, "atualizado_em": "2026-01-03T00:00:00+00:00"})
+    assert cache.consulta("todos", carga)[0][0]["atualizado_em"].startswith("2026-01-03")
+    assert carga.chamadas == 1
+    # Patch mais velho que o cache: escrita fora de ordem, recarrega tudo.
+    cache.aplicar({"id": 1, "atualizado_em": "2026-01-01T00:00:00+00:00"})
+    cache.consulta("todos", carga)
+    assert carga.chamadas == 2
+
+
+def test_invalidar_linha_descarta_so_as_consultas_que_a_contem(relogio):
+    cache = CacheIndexado("t", ttl=600)
+    a, b = Carga(_linhas(1, 2)), Carga(_linhas(3))
+    cache.consulta("a", a)
+    cache.consulta("b", b)
+    cache.invalidar(1)
+    cache.consulta("a", a)
+    cache.consulta("b", b)
+    assert (a.chamadas, b.chamadas) == (2, 1)
+
+
+# ----------------------------------------------------- lista incremental
+class Catalogo:
+    """Fonte de uma lista incremental: carga inteira e delta por marca."""
+
+    def __init__(self, linhas):
+        self.linhas = {linha["id"]: dict(linha, marca=0) for linha in linhas}
+        self.removidos = {}
+        self.marca = 0
+        self.cargas = 0
+        self.deltas = []
+
+    def alterar(self, linha):
+        self.marca += 1
+        self.linhas[linha["id"]] = dict(linha, marca=self.marca)
+
+    def excluir(self, item_id):
+        self.marca += 1
+        del self.linhas[item_id]
+        self.removidos[item_id] = self.marca
+
+    def carregar(self):
+        self.cargas += 1
+        return [dict(linha) for linha in self.linhas.values()], self.marca
+
+    def delta(self, desde):
+        self.deltas.append(desde)
+        alteradas = [dict(linha) for linha in self.linhas.values() if linha["marca"] > desde]
+        removidos = [i for i, m in self.removidos.items() if m > desde]
+        return alteradas, removidos, self.marca
+
+
+def _ids(cache, catalogo, **kw):
+    linhas, total = cache.consulta_incremental(
+        "completo", catalogo.carregar, catalogo.delta, ordem=lambda r: r["id"], **kw
+    )
+    assert total == len(linhas)
+    return [r["id"] for r in linhas]
+
+
+def test_incremental_busca_so_o_delta_depois_da_carga(relogio):
+    cache = CacheIndexado("catalogo", ttl=60)
+    catalogo = Catalogo(_linhas(1, 2, 3))
+    assert _ids(cache, catalogo) == [1, 2, 3]
+    catalogo.alterar({"id": 4})
+    catalogo.alterar({"id": 2, "nome": "novo"})
+    catalogo.excluir(1)
+    relogio.avancar(61)
+    assert _ids(cache, catalogo) == [2, 3, 4]
+    assert catalogo.cargas == 1 and catalogo.deltas == [0]
+    assert cache.obter(2, lambda i: None)["nome"] == "novo"
+    # Sem mudancas nem vencimento: nem delta.
+    _ids(cache, catalogo)
+    assert catalogo.deltas == [0]
+
+
+def test_incremental_vencer_e_invalidar_linha_pedem_delta(relogio):
+    cache = CacheIndexado("catalogo", ttl=600)
+    catalogo = Catalogo(_linhas(1, 2))
+    _ids(cache, catalogo)
+    cache.vencer()
+    _ids(cache, catalogo)
+    catalogo.alterar({"id": 2, "nome": "x"})
+    cache.invalidar(2)
+    assert _ids(cache, catalogo) == [1, 2]
+    assert catalogo.cargas == 1 and len(catalogo.deltas) == 2
+
+
+def test_incremental_excluido_e_restaurado_no_mesmo_delta_volta(relogio):
+    cache = CacheIndexado("catalogo", ttl=600)
+    catalogo = Catalogo(_linhas(1, 2))
+    _ids(cache, catalogo)
+    catalogo.excluir(2)
+    catalogo.alterar({"id": 2})
+    cache.vencer()
+    assert _ids(cache, catalogo) == [1, 2]
+
+
+def test_incremental_recarga_total_periodica_e_invalidar_tudo(relogio):
+    cache = CacheIndexado("catalogo", ttl=60)
+    catalogo = Catalogo(_linhas(1))
+    _ids(cache, catalogo, recarga_total=3600)
+    relogio.avancar(3601)
+    _ids(cache, catalogo, recarga_total=3600)
+    assert catalogo.cargas == 2 and catalogo.deltas == []
+    cache.invalidar()
+    _ids(cache, catalogo, recarga_total=3600)
+    assert catalogo.cargas == 3
+
+
+def test_incremental_linha_descartada_fora_do_delta_recarrega(relogio):
+    cache = CacheIndexado("catalogo", ttl=600)
+    catalogo = Catalogo(_linhas(1, 2))
+    _ids(cache, catalogo)
+    # Some do cache sem aparecer em delta nenhum (ex.: remover local perdido).
+    cache._linhas.pop(2)
+    cache.vencer()
+    assert _ids(cache, catalogo) == [1, 2]
+    assert catalogo.cargas == 2
@@ -0,0 +1,78 @@
+from database import MARCA_INICIAL, Database
+
+
+def test_marca_sincronizacao_com_fracao_de_cinco_digitos():
+    # Como o PostgREST devolve timestamptz: sem os zeros finais da fracao.
+    marca = Database.marca_sincronizacao(
+        ["2024-05-01T10:00:30.12345+00:00", None, "2024-05-01T10:00:29.9+00:00"],
+        "2024-05-01T09:00:00+00:00",
+    )
+    assert marca == "2024-05-01T10:00:30.123450+00:00"
+    assert Database.marca_sincronizacao([]) == MARCA_INICIAL
+
+
+def test_ordem_catalogo_com_fracao_de_cinco_digitos():
+    linhas = [
+        {"id": 1, "criado_em": "2024-05-01T10:00:30.1234+00:00"},
+        {"id": 2, "criado_em": "2024-05-01T10:00:30.12345+00:00"},
+        {"id": 3, "criado_em": "2024-05-01T10:00:30.12345+00:00"},
+    ]
+    assert [r["id"] for r in sorted(linhas, key=Database.ordem_catalogo)] == [3, 2, 1]
+
+
+def test_por_id_converte_ids_e_acessos_para_int():
+    # bigint pode chegar como texto (ex.: JSON de numeric grande).
+    linhas = [
+        {"relatorio_id": "7", "acessos": "12", "ultimo_dia": "2024-05-01"},
+        {"relatorio_id": 8, "acessos": None, "ultimo_dia": None},
+        {"relatorio_id": None, "acessos": 3},
+    ]
+    assert Database._por_id(linhas, "relatorio_id") == {
+        7: {"acessos": 12, "ultimo_dia": "2024-05-01"},
+        8: {"acessos": 0, "ultimo_dia": None},
+    }
+
+
+class _Consulta:
+    """Query builder do supabase-py com o minimo usado pelo catalogo."""
+
+    def __init__(self, tabelas, nome, log):
+        self.linhas, self.log = tabelas[nome], log
+        self.filtros = [nome]
+
+    def select(self, *_a, **_kw):
+        return self
+
+    def order(self, *_a, **_kw):
+        return self
+
+    def eq(self, coluna, valor):
+        self.filtros.append(("eq", coluna, valor))
+        self.linhas = [r for r in self.linhas if r.get(coluna) == valor]
+        return self
+
+    def in_(self, coluna, valores):
+        self.filtros.append(("in", coluna, list(valores)))
+        self.linhas = [r for r in self.linhas if r.get(coluna) in valores]
+        return self
+
+    def execute(self):
+        self.log.append(self.filtros)
+        return type("Resp", (), {"data": self.linhas})()
+
+
+def test_catalogo_busca_so_os_criadores_das_linhas():
+    log = []
+    tabelas = {
+        "relatorios": [
+            {"id": i, "titulo": "r", "link_powerbi": "https://x", "criado_por": criador,
+             "ativo": True}
+            for i, criador in [(1, 5), (2, 5), (3, None)]
+        ],
+        "usuarios": [{"id": i, "username": f"u{i}", "ativo": True} for i in range(1, 2000)],
+    }
+    db = Database.__new__(Database)
+    db.supabase = type("Cliente", (), {"table": lambda _s, nome: _Consulta(tabelas, nome, log)})()
+    relatorios = db.listar_relatorios_completo()
+    assert [r["criador"] for r in relatorios] == ["u5", "u5", "Sistema"]
+    assert log[1] == ["usuarios", ("eq", "ativo", True), ("in", "id", [5])]
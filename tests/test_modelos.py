@@ -0,0 +1,106 @@
+import copy
+import json
+import pickle
+
+import pytest
+
+from modelos import Relatorio, Usuario, fmt_data, ler_instante
+
+
+def _relatorio(**mudancas):
+    campos = {
+        "id": 10, "titulo": "Vendas", "link_powerbi": "https://app.powerbi.com/x",
+        "descricao": None, "categoria": "COMERCIAL", "nivel_hierarquia": "gestao",
+        "criado_por": 3, "criado_em": "2026-03-01T15:30:00+00:00",
+        "atualizado_em": "2026-03-02T10:00:00+00:00", "criador": "ana",
+    }
+    campos.update(mudancas)
+    return Relatorio(**campos)
+
+
+def _usuario(**mudancas):
+    campos = {
+        "id": 3, "username": "ana", "is_admin": 0, "nivel_hierarquia": "operacao",
+        "categorias_permitidas": ["COMERCIAL", "FINANCEIRO"],
+        "relatorios_permitidos": ["7", 5], "criado_em": "2026-01-01T00:00:00Z",
+        "grupos": [2], "concessoes": [(["COMERCIAL"], "gestao", [5, 7])],
+    }
+    campos.update(mudancas)
+    return Usuario(**campos)
+
+
+def test_relatorio_ida_e_volta_pelo_json():
+    r = _relatorio()
+    dados = json.loads(json.dumps(r.para_dict()))
+    assert "criado_em_fmt" not in dados
+    volta = Relatorio.de_dict(dados)
+    assert volta == r
+    assert volta.criado_em_fmt == "01/03/2026 12:30"  # horario de Brasilia
+
+
+def test_usuario_normaliza_e_volta_pelo_json():
+    u = _usuario()
+    assert u.is_admin is False
+    assert u.categorias_permitidas == ("COMERCIAL", "FINANCEIRO")
+    assert u.relatorios_permitidos == frozenset({5, 7})
+    assert u.concessoes == ((frozenset({"COMERCIAL"}), "gestao", frozenset({5, 7})),)
+    dados = json.loads(json.dumps(u.para_dict()))
+    assert dados["relatorios_permitidos"] == [5, 7]
+    assert dados["concessoes"] == [{"areas": ["COMERCIAL"], "nivel": "gestao", "relatorios": [5, 7]}]
+    assert Usuario.de_dict(dados) == u
+
+
+def test_pickle_e_deepcopy_preservam_o_modelo():
+    for modelo in (_relatorio(), _usuario()):
+        assert pickle.loads(pickle.dumps(modelo)) == modelo
+        assert copy.deepcopy(modelo) == modelo
+
+
+def test_leitura_como_dict():
+    r = _relatorio()
+    assert r["titulo"] == r.titulo == "Vendas"
+    assert r.get("inexistente", "x") == "x"
+    assert "criador" in r
+
+
+def test_imutavel_e_substituir_recalcula_derivados():
+    r = _relatorio()
+    with pytest.raises(AttributeError):
+        r.titulo = "outro"
+    novo = r.substituir(criado_em="2026-12-25T03:00:00+00:00", criador="Sistema")
+    assert (r.criador, novo.criador) == ("ana", "Sistema")
+    assert novo.criado_em_fmt == "25/12/2026 00:00"
+    assert novo.id == r.id
+
+
+def test_categorias_internadas_entre_linhas():
+    # Strings montadas em tempo de execucao (literais ja viriam internadas).
+    a = _relatorio(categoria="comercial".upper())
+    b = _relatorio(id=11, categoria="Comercial".upper())
+    assert a.categoria is b.categoria
+
+
+def test_fmt_data_sem_valor_ou_formato_inesperado():
+    assert fmt_data(None) == "—"
+    assert fmt_data("ontem de tarde") == "ontem de tarde"
+
+
+@pytest.mark.parametrize(
+    ("valor", "esperado"),
+    [
+        # Postgres corta zeros da fracao; o Python 3.10 so aceita 3 ou 6 digitos.
+        ("2024-05-01T10:00:30.12345+00:00", (30, 123450)),
+        ("2024-05-01T10:00:30.1+00:00", (30, 100000)),
+        ("2024-05-01T10:00:30.123456Z", (30, 123456)),
+        ("2024-05-01T10:00:30+00:00", (30, 0)),
+    ],
+)
+def test_ler_instante_aceita_fracao_de_qualquer_tamanho(valor, esperado):
+    dt = ler_instante(valor)
+    assert (dt.second, dt.microsecond) == esperado
+    assert dt.utcoffset().total_seconds() == 0
+
+
+def test_ler_instante_rejeita_o_que_nao_e_data():
+    with pytest.raises(ValueError):
+        ler_instante("ontem de tarde")
@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from typing import ClassVar
+
+import pytest
+
+from powerbi_embed import EmbedBroker, baixar_powerbi_client, extrair_ids_powerbi
+
+GRUPO = "11111111-2222-3333-4444-555555555555"
+REPORT = "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+@pytest.mark.parametrize(
+    ("link", "ids"),
+    [
+        (f"https://app.powerbi.com/groups/{GRUPO}/reports/{REPORT}/ReportSection", (GRUPO, REPORT)),
+        (f"https://app.powerbi.com/reportEmbed?reportId={REPORT.upper()}&groupId={GRUPO}",
+         (GRUPO, REPORT)),
+        (f"https://app.powerbi.com/groups/me/reports/{REPORT}", None),
+        ("https://app.powerbi.com/view?r=eyJrIjoi", None),   # "Publicar na web"
+        ("https://painel.streamlit.app/", None),
+        ("", None),
+    ],
+)
+def test_extrair_ids_powerbi(link, ids):
+    assert extrair_ids_powerbi(link) == ids
+
+
+class _PowerBI(BaseHTTPRequestHandler):
+    """Stand-in do login do Azure AD e da API do Power BI. `expira_em_s`
+    controla a validade dos embed tokens emitidos; `chamadas` conta os
+    endpoints usados."""
+
+    chamadas: ClassVar[Counter] = Counter()
+    expira_em_s = 3600
+    trava = threading.Lock()
+
+    def _json(self, dados, codigo=200):
+        corpo = json.dumps(dados).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _contar(self, nome):
+        with self.trava:
+            type(self).chamadas[nome] += 1
+            return type(self).chamadas[nome]
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.endswith("/oauth2/v2.0/token"):
+            self._contar("aad")
+            self._json({"access_token": "aad-token", "expires_in": 3600})
+        elif self.path.endswith("/GenerateToken"):
+            if self.headers.get("Authorization") != "Bearer aad-token":
+                self._json({"erro": "sem auth"}, 401)
+                return
+            n = self._contar("token")
+            # Como a API: ISO em UTC com "Z".
+            expira = time.gmtime(time.time() + type(self).expira_em_s)
+            self._json({"token": f"embed-{n}", "expiration": time.strftime("%Y-%m-%dT%H:%M:%SZ", expira)})
+        else:
+            self._json({}, 404)
+
+    def do_GET(self):
+        if f"/v1.0/myorg/groups/{GRUPO}/reports/{REPORT}" in self.path:
+            self._contar("info")
+            self._json({"id": REPORT, "embedUrl": f"https://app.powerbi.com/reportEmbed?reportId={REPORT}"})
+        else:
+            self._json({}, 404)
+
+    def log_message(self, *_args):
+        pass
+
+
+@pytest.fixture
+def broker(servidor_local):
+    _PowerBI.chamadas = Counter()
+    _PowerBI.expira_em_s = 3600
+    base = servidor_local(_PowerBI)
+    broker = EmbedBroker("tenant", "cliente", "segredo", authority_url=base, api_url=base)
+    yield broker
+    broker.parar()
+
+
+LINK = f"https://app.powerbi.com/groups/{GRUPO}/reports/{REPORT}/ReportSection"
+
+
+def test_obter_embed_contra_servidor_local_reaproveita_token(broker):
+    embed = broker.obter_embed(LINK)
+    assert embed["token"] == "embed-1"
+    assert embed["report_id"] == REPORT
+    assert embed["embed_url"].startswith("https://app.powerbi.com/reportEmbed")
+    assert broker.obter_embed(LINK)["token"] == "embed-1"
+    assert _PowerBI.chamadas == Counter(aad=1, info=1, token=1)
+
+
+def test_link_fora_de_workspace_nao_chama_a_api(broker):
+    assert broker.obter_embed("https://app.powerbi.com/view?r=abc") is None
+    assert not _PowerBI.chamadas
+
+
+def test_token_perto_de_expirar_e_renovado(broker):
+    _PowerBI.expira_em_s = 60  # dentro da margem de renovacao (10 min)
+    assert broker.obter_embed(LINK)["token"] == "embed-1"
+    assert broker.obter_embed(LINK)["token"] == "embed-2"
+    _PowerBI.expira_em_s = 3600
+    broker.renovar_expirando()
+    assert broker.obter_embed(LINK)["token"] == "embed-3"
+    broker.renovar_expirando()  # longe de expirar: nada a renovar
+    assert _PowerBI.chamadas["token"] == 3
+    assert _PowerBI.chamadas["aad"] == 1
+
+
+def test_renovacao_so_dos_tokens_usados_na_janela(broker):
+    broker.janela_uso = 0.2
+    _PowerBI.expira_em_s = 60  # sempre dentro da margem de renovacao
+    assert broker.obter_embed(LINK)["token"] == "embed-1"
+    broker.renovar_expirando()  # pedido agora: renova
+    assert _PowerBI.chamadas["token"] == 2
+    time.sleep(0.3)
+    broker.renovar_expirando()  # ninguem pediu na janela: sai do cache
+    assert _PowerBI.chamadas["token"] == 2
+    assert broker.obter_embed(LINK)["token"] == "embed-3"
+
+
+class _CDN(BaseHTTPRequestHandler):
+    def do_GET(self):
+        corpo = b"/*! powerbi-client */ window.powerbi = {};" if self.path == "/js" else b"<html>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *_args):
+        pass
+
+
+def test_baixar_powerbi_client(servidor_local, tmp_path):
+    base = servidor_local(_CDN)
+    destino = tmp_path / "powerbi.min.js"
+    assert baixar_powerbi_client(str(destino), f"{base}/js") == destino.stat().st_size
+    assert destino.read_bytes().startswith(b"/*! powerbi-client")
+    # Pagina de erro/captive portal no lugar do script: nao substitui o arquivo.
+    with pytest.raises(ValueError):
+        baixar_powerbi_client(str(destino), f"{base}/outra")
+    assert destino.read_bytes().startswith(b"/*! powerbi-client")
+    assert [p.name for p in tmp_path.iterdir()] == ["powerbi.min.js"]
@@ -0,0 +1,106 @@
+import socket
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from verificador_links import VerificadorLinks, classificar, redirecionar
+
+
+@pytest.mark.parametrize(
+    ("http_status", "latencia_ms", "situacao"),
+    [
+        (200, 100, "ok"),
+        (200, 5000, "lento"),
+        (302, 10, "ok"),
+        (401, 10, "ok"),   # pede login da Microsoft: o host respondeu
+        (403, 10, "ok"),
+        (404, 10, "quebrado"),
+        (410, 10, "quebrado"),
+        (400, 10, "erro"),
+        (429, 10, "erro"),
+        (500, 10, "erro"),
+        (503, 10, "erro"),
+        (None, 10000, "erro"),
+    ],
+)
+def test_classificar(http_status, latencia_ms, situacao):
+    assert classificar(http_status, latencia_ms) == situacao
+
+
+def test_classificar_limite_lento_configuravel():
+    assert classificar(200, 250, limite_lento_ms=200) == "lento"
+    assert classificar(200, 150, limite_lento_ms=200) == "ok"
+
+
+def test_redirecionar_troca_esquema_e_host_mantendo_caminho_e_query():
+    link = "https://app.powerbi.com/groups/g/reports/r/ReportSection?ctid=abc#frag"
+    assert redirecionar(link, "http://127.0.0.1:8123") == (
+        "http://127.0.0.1:8123/groups/g/reports/r/ReportSection?ctid=abc"
+    )
+
+
+def test_redirecionar_sem_alvo_devolve_o_link():
+    link = "https://app.powerbi.com/view?r=abc"
+    assert redirecionar(link, None) == link
+    assert redirecionar(link, "") == link
+
+
+class _Relatorios(BaseHTTPRequestHandler):
+    """Stand-in dos hosts dos relatorios: o caminho decide a resposta."""
+
+    def _responder(self):
+        caminho = self.path.split("?")[0]
+        if caminho == "/lento":
+            time.sleep(0.3)
+        if caminho == "/movido":
+            self.send_response(302)
+            self.send_header("Location", "/ok")
+        elif caminho == "/sem-head" and self.command == "HEAD":
+            self.send_response(405)
+        else:
+            codigos = {"/sumiu": 404, "/login": 401, "/falha": 500}
+            self.send_response(codigos.get(caminho, 200))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_HEAD = do_GET = _responder
+
+    def log_message(self, *_args):
+        pass
+
+
+def test_verificar_contra_servidor_local(servidor_local):
+    base = servidor_local(_Relatorios)
+    caminhos = ["/ok", "/sumiu", "/login", "/falha", "/lento", "/movido", "/sem-head"]
+    relatorios = [
+        {"id": i, "link_powerbi": f"https://app.powerbi.com{c}?ctid=1"}
+        for i, c in enumerate(caminhos, 1)
+    ]
+    relatorios.append({"id": 99, "link_powerbi": "sem-host"})
+    verificador = VerificadorLinks(
+        alvo=base, intervalo_por_host_s=0, timeout_s=5, limite_lento_ms=200,
+    )
+    resultados = verificador.verificar(relatorios)
+
+    assert [r["relatorio_id"] for r in resultados] == [r["id"] for r in relatorios]
+    por_id = {r["relatorio_id"]: r for r in resultados}
+    assert {i: por_id[i]["situacao"] for i in range(1, 8)} == {
+        1: "ok", 2: "quebrado", 3: "ok", 4: "erro", 5: "lento", 6: "ok", 7: "ok",
+    }
+    assert por_id[2]["http_status"] == 404
+    assert por_id[6]["http_status"] == 200  # seguiu o redirect
+    assert por_id[1]["host"] == "app.powerbi.com"
+    assert por_id[99]["situacao"] == "quebrado" and por_id[99]["erro"] == "link sem host"
+    assert all(r["verificado_em"] for r in resultados)
+
+
+def test_verificar_host_fora_do_ar():
+    # Porta que acabou de ser liberada: ninguem escutando, sem resposta.
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        porta = s.getsockname()[1]
+    verificador = VerificadorLinks(alvo=f"http://127.0.0.1:{porta}", timeout_s=2)
+    (resultado,) = verificador.verificar([{"id": 1, "link_powerbi": "https://x.example/r"}])
+    assert resultado["situacao"] == "erro"
+    assert resultado["http_status"] is None and resultado["erro"]
@@ -0,0 +1,203 @@
+"""Verificacao de saude dos links dos relatorios (`link_powerbi`).
+
+Um link quebrado ou movido so aparecia quando alguem abria o relatorio e
+esperava o erro dentro do iframe. Aqui todos os links do catalogo sao checados
+em paralelo (asyncio + httpx) com:
+
+- limite global de requisicoes simultaneas;
+- limite de simultaneas e intervalo minimo entre requisicoes por host, para
+  nao martelar o Power BI (ou um app Streamlit) com o catalogo inteiro;
+- timeout por requisicao.
+
+O resultado (situacao, HTTP, latencia, host, horario) vai para `links_status`
+e aparece nos cards do dashboard e na tela de uso. Uma thread em segundo plano
+repete a varredura a cada `LINKS_INTERVALO_S`; com varias replicas, quem acha
+uma varredura recente no banco so espera a proxima.
+
+O destino pode ser trocado (`alvo`, secret `LINKS_ALVO`): o esquema e o host
+de cada link viram os do alvo, mantendo caminho e query, para os testes
+rodarem contra um servidor HTTP local.
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+from modelos import ler_instante
+
+try:
+    from datetime import UTC
+except ImportError:  # Python 3.10
+    UTC = timezone.utc  # noqa: UP017
+
+MAX_SIMULTANEAS = 16
+MAX_POR_HOST = 2
+INTERVALO_POR_HOST_S = 0.25
+TIMEOUT_S = 10
+# Acima disso o link funciona, mas o card avisa que esta lento.
+LIMITE_LENTO_MS = 3000
+# Intervalo entre varreduras da thread (0 desliga a thread).
+INTERVALO_PADRAO_S = 6 * 3600
+
+SITUACAO_LABELS = {
+    "ok": "OK",
+    "lento": "Lento",
+    "quebrado": "Link quebrado",
+    "erro": "Indisponível",
+}
+# 404/410: o relatorio saiu do endereco. 401/403 sao esperados em links que
+# pedem login da Microsoft: o host respondeu, entao contam como ok.
+_HTTP_QUEBRADO = (404, 410)
+
+
+def redirecionar(link, alvo):
+    """`link` com esquema e host trocados pelos de `alvo` (None = o proprio)."""
+    if not alvo:
+        return link
+    destino = urlsplit(alvo)
+    partes = urlsplit(link)
+    return urlunsplit((destino.scheme, destino.netloc, partes.path, partes.query, ""))
+
+
+def classificar(http_status, latencia_ms, limite_lento_ms=LIMITE_LENTO_MS):
+    """Situacao de um link pela resposta (http_status None = sem resposta)."""
+    if http_status is None:
+        return "erro"
+    if http_status in _HTTP_QUEBRADO:
+        return "quebrado"
+    if http_status >= 500 or (http_status >= 400 and http_status not in (401, 403)):
+        return "erro"
+    return "lento" if latencia_ms > limite_lento_ms else "ok"
+
+
+class _LimiteHost:
+    """Simultaneas + intervalo minimo entre inicios de requisicao de um host."""
+
+    def __init__(self, simultaneas, intervalo_s):
+        self.semaforo = asyncio.Semaphore(simultaneas)
+        self._lock = asyncio.Lock()
+        self._intervalo_s = intervalo_s
+        self._proximo = 0.0
+
+    async def aguardar_vez(self):
+        async with self._lock:
+            agora = time.monotonic()
+            espera = self._proximo - agora
+            self._proximo = max(agora, self._proximo) + self._intervalo_s
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+class VerificadorLinks:
+    def __init__(self, alvo=None, max_simultaneas=MAX_SIMULTANEAS, max_por_host=MAX_POR_HOST,
+                 intervalo_por_host_s=INTERVALO_POR_HOST_S, timeout_s=TIMEOUT_S,
+                 limite_lento_ms=LIMITE_LENTO_MS):
+        self.alvo = alvo or None
+        self.max_simultaneas = max_simultaneas
+        self.max_por_host = max_por_host
+        self.intervalo_por_host_s = intervalo_por_host_s
+        self.timeout_s = timeout_s
+        self.limite_lento_ms = limite_lento_ms
+        self._thread = None
+        self._parar = threading.Event()
+
+    @classmethod
+    def from_secrets(cls, get_secret):
+        return cls(alvo=get_secret("LINKS_ALVO") or None)
+
+    # ------------------------------------------------------------ varredura
+    async def _verificar_um(self, cliente, semaforo, limites, relatorio):
+        link = (relatorio.get("link_powerbi") or "").strip()
+        host = urlsplit(link).netloc.lower()
+        resultado = {
+            "relatorio_id": relatorio["id"],
+            "host": host or None,
+            "http_status": None,
+            "latencia_ms": None,
+            "erro": None,
+        }
+        if not host:
+            resultado.update(situacao="quebrado", erro="link sem host")
+        else:
+            limite = limites.setdefault(
+                host, _LimiteHost(self.max_por_host, self.intervalo_por_host_s)
+            )
+            url = redirecionar(link, self.alvo)
+            async with semaforo, limite.semaforo:
+                await limite.aguardar_vez()
+                inicio = time.perf_counter()
+                try:
+                    # HEAD basta para saber se o endereco existe; quem nao
+                    # aceita HEAD recebe um GET sem ler o corpo.
+                    resp = await cliente.head(url)
+                    if resp.status_code in (405, 501):
+                        async with cliente.stream("GET", url) as resp:
+                            pass
+                    resultado["http_status"] = resp.status_code
+                except Exception as e:  # noqa: BLE001  (timeout, DNS, conexao recusada...)
+                    resultado["erro"] = f"{type(e).__name__}: {e}"[:200]
+                resultado["latencia_ms"] = int((time.perf_counter() - inicio) * 1000)
+            resultado["situacao"] = classificar(
+                resultado["http_status"], resultado["latencia_ms"], self.limite_lento_ms
+            )
+        resultado["verificado_em"] = datetime.now(UTC).isoformat()
+        return resultado
+
+    async def verificar_async(self, relatorios):
+        import httpx
+
+        semaforo = asyncio.Semaphore(self.max_simultaneas)
+        limites = {}
+        async with httpx.AsyncClient(
+            timeout=self.timeout_s, follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.max_simultaneas),
+        ) as cliente:
+            return await asyncio.gather(
+                *(self._verificar_um(cliente, semaforo, limites, r) for r in relatorios)
+            )
+
+    def verificar(self, relatorios):
+        """Verifica os links de `relatorios` ({"id", "link_powerbi"}) e devolve
+        um resultado por relatorio, na mesma ordem. Bloqueante: use fora do
+        script do Streamlit (thread propria ou scripts/verificar_links.py)."""
+        return asyncio.run(self.verificar_async(list(relatorios)))
+
+    def varrer(self, db):
+        """Verifica o catalogo inteiro e grava em links_status."""
+        resultados = self.verificar(db.links_para_verificar())
+        db.registrar_status_links(resultados)
+        return resultados
+
+    # --------------------------------------------------------------- thread
+    def iniciar(self, db, intervalo=INTERVALO_PADRAO_S):
+        """Sobe (uma vez) a thread daemon que varre o catalogo a cada
+        `intervalo` segundos. Se outra replica varreu ha pouco (ultima
+        verificacao no banco), so espera o que falta."""
+        if intervalo <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        def _loop():
+            espera = 0
+            while not self._parar.wait(espera):
+                try:
+                    ultima = db.ultima_verificacao_links()
+                    idade = (
+                        time.time() - ler_instante(ultima).timestamp()
+                        if ultima else intervalo
+                    )
+                    if idade < intervalo:
+                        espera = intervalo - idade
+                        continue
+                    self.varrer(db)
+                    espera = intervalo
+                except Exception:  # noqa: BLE001  (banco/rede fora: tenta de novo depois)
+                    espera = min(intervalo, 300)
+
+        self._parar.clear()
+        self._thread = threading.Thread(target=_loop, name="verificador-links", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()